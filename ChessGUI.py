@@ -48,6 +48,7 @@ class ChessGUI:
             self.button_font = pygame.font.SysFont("Arial", 22, bold=True)
 
         self.ai = ChessAI(depth=3)
+        self.ai.set_ponder(True)  # Keep searching the expected reply while the opponent thinks
 
         self.selected_square = None
         self.possible_moves = []
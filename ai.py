@@ -7,6 +7,12 @@ import os
 import platform
 import subprocess
 import shutil
+import math
+import multiprocessing
+import threading
+import abc
+from array import array
+from multiprocessing import shared_memory
 
 # Piece values
 PAWN_VALUE = 100
@@ -94,20 +100,1574 @@ KING_END_TABLE = [
     -50, -30, -30, -30, -30, -30, -30, -50
 ]
 
+# Material plus piece-square value of every piece on every square, signed from White's
+# point of view and indexed [piece_type][color][square]; the king uses its middlegame
+# table in PSQ_MG and its endgame table in PSQ_EG
+PIECE_SQUARE_TABLES = [None, PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE]
+PIECE_TYPE_VALUES = [0, PAWN_VALUE, KNIGHT_VALUE, BISHOP_VALUE, ROOK_VALUE, QUEEN_VALUE, KING_VALUE]
+
+
+def _build_psq(king_table):
+    """Material + PST lookup table for one game phase"""
+    psq = [None]
+    for piece_type, table in enumerate(PIECE_SQUARE_TABLES + [king_table]):
+        if piece_type == 0:
+            continue
+        value = PIECE_TYPE_VALUES[piece_type]
+        black = [-(value + table[63 - square]) for square in chess.SQUARES]
+        white = [value + table[square] for square in chess.SQUARES]
+        psq.append([black, white])
+    return psq
+
+
+PSQ_MG = _build_psq(KING_MIDDLE_TABLE)
+PSQ_EG = _build_psq(KING_END_TABLE)
+BISHOP_PAIR_BONUS = 50
+
+# Pawn structure terms as (middlegame, endgame) pairs; the middlegame values are the original ones
+DOUBLED_PAWN_PENALTY = (15, 25)
+PAWN_CHAIN_BONUS = (5, 5)  # Per diagonal defender from behind
+PASSED_PAWN_BONUS = (20, 30)  # Plus PASSED_PAWN_RANK_BONUS * relative rank squared
+PASSED_PAWN_RANK_BONUS = (2, 4)
+SUPPORTED_PASSED_PAWN_BONUS = (10, 15)  # Per friendly pawn beside or behind
+ISOLATED_PAWN_PENALTY = (20, 25)
+BACKWARD_PAWN_PENALTY = (10, 15)
+
+
+
+def _build_pawn_masks():
+    """Per color and square masks used by _evaluate_pawn_structure.
+
+    Neighbour files are taken as max(0, file - 1) and min(7, file + 1), so on the
+    edge files the pawn's own file stands in for the missing neighbour, as in the
+    original square-by-square evaluation.
+    """
+    passed = [[0] * 64, [0] * 64]
+    passed_support = [[0] * 64, [0] * 64]
+    backward_span = [[0] * 64, [0] * 64]
+    pawn_stop = [[0] * 64, [0] * 64]
+    stop_attack = [[0] * 64, [0] * 64]
+    for color in chess.COLORS:
+        forward = 1 if color == chess.WHITE else -1
+        for square in chess.SQUARES:
+            file = chess.square_file(square)
+            rank = chess.square_rank(square)
+            neighbours = {max(0, file - 1), min(7, file + 1)}
+            ranks_ahead = range(rank + 1, 8) if color == chess.WHITE else range(0, rank)
+            for r in ranks_ahead:
+                for f in range(max(0, file - 1), min(7, file + 1) + 1):
+                    passed[color][square] |= chess.BB_SQUARES[chess.square(f, r)]
+                for f in neighbours:
+                    backward_span[color][square] |= chess.BB_SQUARES[chess.square(f, r)]
+            behind = rank - forward
+            if 0 <= behind < 8:
+                for f in neighbours:
+                    passed_support[color][square] |= chess.BB_SQUARES[chess.square(f, behind)]
+            if 0 <= rank + forward < 8:
+                pawn_stop[color][square] = chess.BB_SQUARES[chess.square(file, rank + forward)]
+            if 0 <= rank + 2 * forward < 8:
+                for f in neighbours:
+                    stop_attack[color][square] |= chess.BB_SQUARES[chess.square(f, rank + 2 * forward)]
+    return passed, passed_support, backward_span, pawn_stop, stop_attack
+
+
+# Squares in front of a pawn on its own and neighbouring files, indexed [color][square]
+(PASSED_PAWN_MASKS, PASSED_SUPPORT_MASKS, BACKWARD_SPAN_MASKS, PAWN_STOP_MASKS,
+ STOP_ATTACK_MASKS) = _build_pawn_masks()
+# Squares a pawn on [color][square] can attack now or after advancing (inverse of BACKWARD_SPAN_MASKS)
+PAWN_ATTACK_SPAN_MASKS = [[0] * 64, [0] * 64]
+for _color in chess.COLORS:
+    for _square in chess.SQUARES:
+        for _pawn_square in chess.scan_forward(BACKWARD_SPAN_MASKS[_color][_square]):
+            PAWN_ATTACK_SPAN_MASKS[not _color][_pawn_square] |= chess.BB_SQUARES[_square]
+
+
+def _build_shield_table():
+    """(square bitboard, bonus) pairs of the pawn shield in front of a king, indexed [color][king square].
+
+    The shield files of a king on an edge file contain that file twice, as in the
+    original evaluation, so those pawns count double.
+    """
+    table = [[None] * 64, [None] * 64]
+    for color in chess.COLORS:
+        for king_square in chess.SQUARES:
+            king_file = chess.square_file(king_square)
+            king_rank = chess.square_rank(king_square)
+            if king_file < 3:  # Queenside castle
+                shield_files = [max(0, king_file - 1), king_file, king_file + 1]
+            elif king_file > 4:  # Kingside castle
+                shield_files = [king_file - 1, king_file, min(7, king_file + 1)]
+            else:  # Middle (not castled or e-file)
+                shield_files = [max(0, king_file - 1), king_file, min(7, king_file + 1)]
+            if color == chess.WHITE:
+                shield_ranks = range(king_rank + 1, min(king_rank + 3, 8))
+            else:
+                shield_ranks = range(max(0, king_rank - 2), king_rank)
+            shield = []
+            for f in shield_files:
+                for r in shield_ranks:
+                    # Closer pawns are more valuable
+                    distance = abs(r - king_rank) + abs(f - king_file)
+                    shield.append((chess.BB_SQUARES[chess.square(f, r)], max(15 - 5 * distance, 5)))
+            table[color][king_square] = shield
+    return table
+
+
+PAWN_SHIELD_TABLE = _build_shield_table()
+PAWN_HASH_SIZE = 1 << 14  # Entries, a power of two
+
+# Files next to each file (the file itself excluded)
+ADJACENT_FILE_MASKS = [
+    (chess.BB_FILES[file - 1] if file > 0 else 0) | (chess.BB_FILES[file + 1] if file < 7 else 0)
+    for file in range(8)
+]
+
+# Mobility bonus per reachable square, by piece type (rooks and queens gain most in the endgame)
+MOBILITY_WEIGHTS_MG = [0, 0, 4, 3, 2, 1, 0]
+MOBILITY_WEIGHTS_EG = [0, 0, 4, 4, 4, 2, 0]
+
+# King safety weight of each attacker of the king zone, by piece type (king counts like a pawn)
+KING_ATTACKER_WEIGHTS = [0, 1, 2, 2, 3, 4, 1]
+
+# Two-square radius around each king square, the king itself excluded
+KING_ZONE_MASKS = [
+    chess.SquareSet(
+        chess.square(f, r)
+        for f in range(max(0, chess.square_file(sq) - 2), min(8, chess.square_file(sq) + 3))
+        for r in range(max(0, chess.square_rank(sq) - 2), min(8, chess.square_rank(sq) + 3))
+    ).mask & ~chess.BB_SQUARES[sq]
+    for sq in chess.SQUARES
+]
+
+BB_CENTER = chess.BB_D4 | chess.BB_E4 | chess.BB_D5 | chess.BB_E5
+BB_EXTENDED_CENTER = (chess.BB_C3 | chess.BB_D3 | chess.BB_E3 | chess.BB_F3 | chess.BB_C4 | chess.BB_F4
+                      | chess.BB_C5 | chess.BB_F5 | chess.BB_C6 | chess.BB_D6 | chess.BB_E6 | chess.BB_F6)
+
+# Lazy evaluation: skip the attack-based terms when material, PST and pawns are this far outside
+# the window (covers about 99% of the positional swing measured on the bench positions)
+LAZY_EVAL_MARGIN = 600
+
+# Game phase: non-pawn material weights, PHASE_MAX with all pieces on the board
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]
+PHASE_MAX = 24
+
+# Search score bounds
+MATE_SCORE = 10000
+MAX_PLY = 100
+UNDO_STACK_SIZE = 4 * MAX_PLY  # Plies of make/unmake a search Position can hold (main line plus quiescence)
+
+# Selectivity parameters for _alpha_beta
+NULL_MOVE_MIN_DEPTH = 3
+REVERSE_FUTILITY_MAX_DEPTH = 3
+REVERSE_FUTILITY_MARGIN = 150  # Per ply of remaining depth
+FUTILITY_MARGINS = [0, 200, 350, 500]  # Indexed by remaining depth
+LATE_MOVE_PRUNING_COUNTS = [0, 5, 8, 13]  # Quiet moves searched before pruning, by remaining depth
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVE_INDEX = 3
+
+# Quiescence search
+QUIESCENCE_CHECK_DEPTH = 2  # Quiescence plies that also try quiet checking moves
+DELTA_MARGIN = 200  # Positional slack of delta pruning on top of the captured piece and promotion gain
+
+# Quiet move statistics (see Stockfish's history.h)
+PIECE_TO_SIZE = 12 * 64  # Moved piece in Polyglot order (as _zobrist_piece) times destination square
+HISTORY_MAX = 7183  # Gravity bound of the [color][from][to] history
+CONTINUATION_HISTORY_MAX = 16384  # Gravity bound of the [previous piece-to][piece-to] history
+HISTORY_BONUS_MAX = 1600
+QUIET_HISTORY_DIVISOR = 32  # History sums are scaled down next to the check/castling/development hints
+
+# Aspiration windows around the previous iteration's score
+ASPIRATION_MIN_DEPTH = 4
+ASPIRATION_DELTA = 100  # Initial half-width, grown by half on every fail high or fail low
+ASPIRATION_MAX_DELTA = 600  # Beyond this the failing side of the window opens to infinity
+
+# Late move reduction table, indexed by [depth][move index]
+LMR_REDUCTIONS = [
+    [0 if d == 0 or m == 0 else int(0.75 + math.log(d) * math.log(m) / 2.25) for m in range(64)]
+    for d in range(MAX_PLY)
+]
+
+# Transposition table bound types (same encoding as Stockfish's Bound enum)
+BOUND_NONE = 0
+BOUND_UPPER = 1
+BOUND_LOWER = 2
+BOUND_EXACT = BOUND_UPPER | BOUND_LOWER
+
+# Transposition table entry layout, packed into one 64-bit word:
+#   bits  0-15  encoded move (from | to << 6 | promotion << 12)
+#   bits 16-31  score + 32768
+#   bits 32-39  depth - DEPTH_ENTRY_OFFSET (0 means the slot is empty)
+#   bits 40-47  generation (upper 6 bits) | bound (lower 2 bits)
+#   bits 48-63  key verification bits (lower 16 bits of the key)
+TT_CLUSTER_SIZE = 4
+DEPTH_ENTRY_OFFSET = -3
+GENERATION_BITS = 2
+GENERATION_DELTA = 1 << GENERATION_BITS
+GENERATION_CYCLE = 255 + GENERATION_DELTA
+GENERATION_MASK = (0xFF << GENERATION_BITS) & 0xFF
+
+
+class TranspositionTable:
+    """Fixed-size bucketed transposition table stored in a packed array (see Stockfish tt.cpp)"""
+
+    def __init__(self, size_mb=16):
+        self.generation8 = 0
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        """Reallocate the table to use roughly size_mb megabytes"""
+        self.size_mb = max(1, int(size_mb))
+        self.bucket_count = max(1, self.size_mb * 1024 * 1024 // (8 * TT_CLUSTER_SIZE))
+        self.entries = array('Q')
+        self.entries.frombytes(bytes(8 * TT_CLUSTER_SIZE * self.bucket_count))
+
+    def clear(self):
+        """Wipe all entries without reallocating"""
+        self.entries = array('Q')
+        self.entries.frombytes(bytes(8 * TT_CLUSTER_SIZE * self.bucket_count))
+        self.generation8 = 0
+
+    def new_search(self):
+        """Age existing entries so they are preferred for replacement"""
+        self.generation8 = (self.generation8 + GENERATION_DELTA) & 0xFF
+
+    def _first_entry(self, key):
+        return ((key * self.bucket_count) >> 64) * TT_CLUSTER_SIZE
+
+    def _relative_age(self, genbound8):
+        return (GENERATION_CYCLE + self.generation8 - genbound8) & GENERATION_MASK
+
+    def _unpack(self, data, ply):
+        """Decode an entry word into (depth, score, move, bound)"""
+        move16 = data & 0xFFFF
+        move = None
+        if move16:
+            move = chess.Move(move16 & 63, (move16 >> 6) & 63, (move16 >> 12) or None)
+        score = _score_from_tt(((data >> 16) & 0xFFFF) - 32768, ply)
+        depth = ((data >> 32) & 0xFF) + DEPTH_ENTRY_OFFSET
+        return depth, score, move, (data >> 40) & 0x3
+
+    def _pack(self, key, depth, score, move, bound, ply, old, same_key):
+        """Encode a new entry word, or return None to keep the old entry"""
+        move16 = _encode_move(move) if move else 0
+        # Preserve the old move if we don't have a new one
+        if not move16 and same_key:
+            move16 = old & 0xFFFF
+        # Keep a deeper result for the same position unless the new one is exact or the old one is stale
+        if (same_key and bound != BOUND_EXACT
+                and depth - DEPTH_ENTRY_OFFSET <= ((old >> 32) & 0xFF) - 4
+                and not self._relative_age((old >> 40) & 0xFF)):
+            return (old & ~0xFFFF) | move16
+
+        score = max(-32767, min(32767, int(_score_to_tt(score, ply))))
+        depth8 = max(1, min(255, depth - DEPTH_ENTRY_OFFSET))
+        return (
+            move16
+            | (score + 32768) << 16
+            | depth8 << 32
+            | (self.generation8 | bound) << 40
+            | (key & 0xFFFF) << 48
+        )
+
+    def probe(self, key, ply=0):
+        """Look up a position; returns (depth, score, move, bound) or None"""
+        key16 = key & 0xFFFF
+        entries = self.entries
+        first = self._first_entry(key)
+        for i in range(first, first + TT_CLUSTER_SIZE):
+            data = entries[i]
+            if data >> 48 == key16 and (data >> 32) & 0xFF:
+                return self._unpack(data, ply)
+        return None
+
+    def store(self, key, depth, score, move, bound, ply=0):
+        """Save a search result, replacing the least valuable entry in the bucket"""
+        key16 = key & 0xFFFF
+        entries = self.entries
+        first = self._first_entry(key)
+        replace = first
+        replace_value = None
+        old = 0
+        for i in range(first, first + TT_CLUSTER_SIZE):
+            data = entries[i]
+            depth8 = (data >> 32) & 0xFF
+            if data >> 48 == key16 or not depth8:
+                replace = i
+                old = data
+                break
+            # Depth-preferred replacement, discounted by the entry's age
+            value = depth8 - 2 * self._relative_age((data >> 40) & 0xFF)
+            if replace_value is None or value < replace_value:
+                replace = i
+                replace_value = value
+                old = data
+
+        same_key = old >> 48 == key16 and (old >> 32) & 0xFF
+        entries[replace] = self._pack(key, depth, score, move, bound, ply, old, same_key)
+
+    def hashfull(self, max_age=0):
+        """Permille of sampled entries written within the last max_age searches"""
+        sample = min(1000, self.bucket_count)
+        max_age_internal = max_age << GENERATION_BITS
+        entries = self.entries
+        count = 0
+        for i in range(sample * TT_CLUSTER_SIZE):
+            data = entries[i]
+            if (data >> 32) & 0xFF and self._relative_age((data >> 40) & 0xFF) <= max_age_internal:
+                count += 1
+        return count * 1000 // (sample * TT_CLUSTER_SIZE)
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """Transposition table in shared memory for Lazy SMP worker processes.
+
+    Each entry takes two words: the packed data and key ^ data. Processes
+    read and write without locks; an entry torn by a concurrent write fails
+    the XOR check and is simply treated as a miss.
+    """
+
+    def __init__(self, size_mb=16, name=None):
+        self.generation8 = 0
+        self.shm = None
+        self.owner = name is None
+        if name is None:
+            self.resize(size_mb)
+        else:
+            self._attach(size_mb, name)
+
+    def _attach(self, size_mb, name):
+        self.size_mb = max(1, int(size_mb))
+        self.bucket_count = max(1, self.size_mb * 1024 * 1024 // (16 * TT_CLUSTER_SIZE))
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.entries = self.shm.buf.cast('Q')
+
+    def resize(self, size_mb):
+        """Reallocate the shared block to use roughly size_mb megabytes"""
+        self.close()
+        self.owner = True
+        self.size_mb = max(1, int(size_mb))
+        self.bucket_count = max(1, self.size_mb * 1024 * 1024 // (16 * TT_CLUSTER_SIZE))
+        self.shm = shared_memory.SharedMemory(create=True, size=16 * TT_CLUSTER_SIZE * self.bucket_count)
+        self.entries = self.shm.buf.cast('Q')
+        self.clear()
+
+    def clear(self):
+        """Wipe all entries in place, keeping the shared block"""
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+        self.generation8 = 0
+
+    def close(self):
+        """Detach from the shared block, removing it if this process created it"""
+        if self.shm is None:
+            return
+        self.entries.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def probe(self, key, ply=0):
+        """Look up a position; returns (depth, score, move, bound) or None"""
+        entries = self.entries
+        first = self._first_entry(key)
+        for i in range(2 * first, 2 * (first + TT_CLUSTER_SIZE), 2):
+            data = entries[i + 1]
+            if entries[i] ^ data == key and (data >> 32) & 0xFF:
+                return self._unpack(data, ply)
+        return None
+
+    def store(self, key, depth, score, move, bound, ply=0):
+        """Save a search result, replacing the least valuable entry in the bucket"""
+        entries = self.entries
+        first = self._first_entry(key)
+        replace = 2 * first
+        replace_value = None
+        old = 0
+        same_key = False
+        for i in range(2 * first, 2 * (first + TT_CLUSTER_SIZE), 2):
+            data = entries[i + 1]
+            depth8 = (data >> 32) & 0xFF
+            if not depth8 or entries[i] ^ data == key:
+                replace = i
+                old = data
+                same_key = bool(depth8)
+                break
+            # Depth-preferred replacement, discounted by the entry's age
+            value = depth8 - 2 * self._relative_age((data >> 40) & 0xFF)
+            if replace_value is None or value < replace_value:
+                replace = i
+                replace_value = value
+                old = data
+
+        data = self._pack(key, depth, score, move, bound, ply, old, same_key)
+        entries[replace + 1] = data
+        entries[replace] = key ^ data
+
+    def hashfull(self, max_age=0):
+        """Permille of sampled entries written within the last max_age searches"""
+        sample = min(1000, self.bucket_count)
+        max_age_internal = max_age << GENERATION_BITS
+        entries = self.entries
+        count = 0
+        for i in range(1, 2 * sample * TT_CLUSTER_SIZE, 2):
+            data = entries[i]
+            if (data >> 32) & 0xFF and self._relative_age((data >> 40) & 0xFF) <= max_age_internal:
+                count += 1
+        return count * 1000 // (sample * TT_CLUSTER_SIZE)
+
+
+class EvalCache:
+    """Fixed-size two-way associative cache of static evaluations keyed by the Zobrist key.
+
+    Keys and scores live in two packed arrays; a bucket holds the most recently
+    stored entry in its first slot and the one it displaced in the second.
+    """
+
+    def __init__(self, size_mb=4):
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        """Reallocate the cache to use roughly size_mb megabytes (12 bytes per entry)"""
+        self.size_mb = max(1, int(size_mb))
+        self.bucket_count = max(1, self.size_mb * 1024 * 1024 // (2 * 12))
+        self.clear()
+
+    def clear(self):
+        """Wipe all entries and statistics"""
+        self.keys = array('Q')
+        self.keys.frombytes(bytes(8 * 2 * self.bucket_count))
+        self.scores = array('i')
+        self.scores.frombytes(bytes(self.scores.itemsize * 2 * self.bucket_count))
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        """Cached score for the key, or None"""
+        index = 2 * ((key * self.bucket_count) >> 64)
+        keys = self.keys
+        if keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        if keys[index + 1] == key:
+            self.hits += 1
+            return self.scores[index + 1]
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        index = 2 * ((key * self.bucket_count) >> 64)
+        keys = self.keys
+        scores = self.scores
+        keys[index + 1] = keys[index]
+        scores[index + 1] = scores[index]
+        keys[index] = key
+        scores[index] = score
+
+    def hit_rate(self):
+        """Fraction of probes that found their entry"""
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+
+class PawnEntry:
+    """Pawn hash entry (see Stockfish's Pawns::Entry): pawn-structure score plus byproducts reused by the evaluation"""
+
+    def __init__(self, key):
+        self.key = key
+        self.score_mg = 0  # Pawn structure score, White's point of view
+        self.score_eg = 0
+        self.passed_pawns = [0, 0]  # Passed pawns per color
+        self.open_files = 0  # Files without any pawn, as a bitboard
+        self.half_open_files = [0, 0]  # Files without pawns of the color (open files included)
+        self.attack_spans = [0, 0]  # Squares the color's pawns attack now or after advancing
+        self.backward_candidates = [0, 0]  # Backward unless the stop square is empty (not in score)
+        self.shield_king = [None, None]  # King square the cached shield score was computed for
+        self.shield_score = [0, 0]
+
+
+class PawnHashTable:
+    """Bounded, always-replace cache of PawnEntry objects indexed by the pawn-only Zobrist key"""
+
+    def __init__(self, size=PAWN_HASH_SIZE):
+        self.entries = [None] * size
+        self.mask = size - 1
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        self.entries = [None] * len(self.entries)
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """Entry for the pawn key, or None"""
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, entry):
+        self.entries[entry.key & self.mask] = entry
+
+    def hit_rate(self):
+        """Fraction of probes that found their entry"""
+        return self.hits / self.probes if self.probes else 0.0
+
+
+class Evaluator(abc.ABC):
+    """Interface of a pluggable static evaluation (see ChessAI.set_evaluator).
+
+    The search calls reset() on the root position, push() just before each move
+    is made on the board, push_null() for null moves and pop() after each unmake,
+    so an implementation can keep incremental state on its own stack. Subclasses
+    must implement evaluate(); the other hooks default to doing nothing.
+    """
+
+    def reset(self, board):
+        pass
+
+    def push(self, board, move):
+        pass
+
+    def push_null(self):
+        pass
+
+    def pop(self):
+        pass
+
+    @abc.abstractmethod
+    def evaluate(self, board):
+        """Score of the position from the side to move's point of view, in centipawns"""
+
+    def copy(self):
+        """Evaluator for another search (ponder thread, Lazy SMP helper), sharing any parameters"""
+        return self
+
+
+class SearchLimits:
+    """Limits for one internal AI search (see Stockfish's Search::LimitsType).
+
+    depth, nodes and mate (in moves) bound the search deterministically;
+    movetime or time_left/increment/moves_to_go (seconds) enable the clock.
+    With only deterministic limits set, the wall clock is ignored, so the
+    same position always gives the same move and node count.
+    """
+
+    def __init__(self, depth=None, nodes=None, movetime=None, mate=None, time_left=None, increment=0,
+                 moves_to_go=0):
+        self.depth = depth
+        self.nodes = nodes
+        self.movetime = movetime
+        self.mate = mate
+        self.time_left = time_left
+        self.increment = increment
+        self.moves_to_go = moves_to_go
+
+    def use_time(self):
+        """True if the search is bounded by the clock"""
+        return self.movetime is not None or self.time_left is not None
+
+
+class RootMove:
+    """A legal move of the search root with its score and subtree size from the latest root search (Stockfish's RootMove)"""
+
+    __slots__ = ("move", "score", "nodes")
+
+    def __init__(self, move):
+        self.move = move
+        self.score = float('-inf')  # Exact score, or -inf when unsearched or failing low
+        self.nodes = 0
+
+
+class TimeManager:
+    """Optimum and maximum thinking time for one move (see Stockfish timeman.cpp).
+
+    Times are in seconds. With a game clock the budgets come from the remaining
+    time, increment and moves to go; without one, the fixed per-move limit is
+    used as both the optimum and the hard maximum.
+    """
+
+    def __init__(self, move_overhead=0.01):
+        self.move_overhead = move_overhead
+        self.optimum_time = 0.0
+        self.maximum_time = 0.0
+        self.previous_time_reduction = 1.0
+        self.previous_score = None
+
+    def init(self, move_time, time_left=None, increment=0.0, moves_to_go=0, ply=0):
+        """Set the budgets for the coming search"""
+        if time_left is None:
+            self.optimum_time = self.maximum_time = max(0.01, move_time - self.move_overhead)
+            return
+
+        time_left = max(0.001, time_left)
+        # Moves-to-go horizon in hundredths, as in Stockfish
+        centi_mtg = min(moves_to_go * 100, 5000) if moves_to_go else 5051
+        if time_left < 1.0 and centi_mtg > 2950:
+            centi_mtg = 2950
+        budget = max(0.001, time_left + (increment * (centi_mtg - 100)
+                                         - self.move_overhead * (200 + centi_mtg)) / 100)
+
+        if not moves_to_go:
+            # Sudden death: spend a growing fraction of the remaining time as the game goes on
+            log_time = math.log10(time_left)
+            opt_constant = min(0.0032116 + 0.000321123 * log_time, 0.00508017)
+            max_constant = max(3.3977 + 3.03950 * log_time, 2.94761)
+            opt_scale = min(0.0121431 + (ply + 2.94693) ** 0.461073 * opt_constant, 0.213035 * time_left / budget)
+            max_scale = min(6.67704, max_constant + ply / 11.9847)
+        else:
+            opt_scale = min((0.88 + ply / 116.4) / (centi_mtg / 100.0), 0.88 * time_left / budget)
+            max_scale = 1.3 + 0.11 * (centi_mtg / 100.0)
+
+        self.optimum_time = opt_scale * budget
+        self.maximum_time = max(0.01, min(0.825179 * time_left - self.move_overhead,
+                                          max_scale * self.optimum_time) - 0.01)
+
+    def stop_iterating(self, elapsed, iteration_time, previous_iteration_time, score, older_score,
+                       best_move_changes, stable_depths, best_move_effort=0.0):
+        """Decide after an iteration whether to stop, instead of starting one that can't pay off"""
+        # Spend more time when the score is falling, less when it's rising
+        falling_eval = 11.85
+        if self.previous_score is not None:
+            falling_eval += 2.24 * (self.previous_score - score)
+        if older_score is not None:
+            falling_eval += 0.93 * (older_score - score)
+        falling_eval = max(0.57, min(1.70, falling_eval / 100))
+
+        # Spend less time when the best move has been stable for several iterations
+        time_reduction = 1.495 if stable_depths >= 3 else 0.687
+        reduction = (1.48 + self.previous_time_reduction) / (2.17 * time_reduction)
+        self.previous_time_reduction = time_reduction
+
+        best_move_instability = 1 + 1.88 * best_move_changes
+        # Spend less time when nearly all nodes went into the best move (the alternatives were refuted quickly)
+        high_best_move_effort = 0.76 if best_move_effort >= 0.9334 else 1.0
+        total_time = min(self.optimum_time * falling_eval * reduction * best_move_instability
+                         * high_best_move_effort, self.maximum_time)
+        if elapsed > total_time:
+            return True
+
+        # Predict the next iteration from the effective branching factor of the last two
+        branching = 4.0
+        if previous_iteration_time > 0.001:
+            branching = max(1.5, min(8.0, iteration_time / previous_iteration_time))
+        return elapsed + iteration_time * branching > self.maximum_time
+
+
+def _lazy_smp_worker(worker_id, board, max_depth, time_limit, tt_name, tt_size_mb, tt_generation,
+                     stop_event, result_queue, evaluator=None):
+    """Entry point of a Lazy SMP helper process"""
+    ai = ChessAI(depth=max_depth, time_limit=time_limit, opening_book_path=None, hash_size_mb=1,
+                 enable_stockfish=False)
+    ai.evaluator = evaluator
+    ai.transposition_table = SharedTranspositionTable(tt_size_mb, name=tt_name)
+    ai.transposition_table.generation8 = tt_generation
+    ai.board = board
+    ai.stop_event = stop_event
+    try:
+        ai._helper_search(worker_id, max_depth, result_queue)
+    finally:
+        ai.transposition_table.close()
+
+
+# Polyglot Zobrist keys, so search keys agree with chess.polyglot.zobrist_hash and the opening book
+ZOBRIST_RANDOM = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+ZOBRIST_CASTLING_OFFSET = 768
+ZOBRIST_EP_OFFSET = 772
+ZOBRIST_TURN = ZOBRIST_RANDOM[780]
+EVAL_CACHE_OPENING_KEY = 0x9E3779B97F4A7C15 # Xored into eval cache keys while _is_opening(), which the evaluation depends on
+_castling_zobrist_cache = {}
+
+
+def _zobrist_piece(piece_type, color, square):
+    """Zobrist key of a piece on a square (Polyglot ordering: black pawn, white pawn, black knight, ...)"""
+    return ZOBRIST_RANDOM[64 * ((piece_type - 1) * 2 + color) + square]
+
+
+def _zobrist_castling(board):
+    """Zobrist key of the castling rights of a position"""
+    rights = board.clean_castling_rights()
+    key = _castling_zobrist_cache.get(rights)
+    if key is None:
+        key = 0
+        for i, corner in enumerate((chess.BB_H1, chess.BB_A1, chess.BB_H8, chess.BB_A8)):
+            if rights & corner:
+                key ^= ZOBRIST_RANDOM[ZOBRIST_CASTLING_OFFSET + i]
+        _castling_zobrist_cache[rights] = key
+    return key
+
+
+def _zobrist_ep(board):
+    """Zobrist key of the en passant file, only when a pawn is ready to capture (as in Polyglot)"""
+    ep_square = board.ep_square
+    if board.turn == chess.WHITE:
+        ep_mask = chess.shift_down(chess.BB_SQUARES[ep_square])
+    else:
+        ep_mask = chess.shift_up(chess.BB_SQUARES[ep_square])
+    ep_mask = chess.shift_left(ep_mask) | chess.shift_right(ep_mask)
+    if ep_mask & board.pawns & board.occupied_co[board.turn]:
+        return ZOBRIST_RANDOM[ZOBRIST_EP_OFFSET + chess.square_file(ep_square)]
+    return 0
+
+
+def _piece_attacks(piece_type, square, occupied):
+    """Attack bitboard of a knight, bishop, rook, queen or king on a square, given an occupancy"""
+    if piece_type == chess.KNIGHT:
+        return chess.BB_KNIGHT_ATTACKS[square]
+    if piece_type == chess.KING:
+        return chess.BB_KING_ATTACKS[square]
+    attacks = 0
+    if piece_type != chess.ROOK:
+        attacks = chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+    if piece_type != chess.BISHOP:
+        attacks |= (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied]
+                    | chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+    return attacks
+
+
+class AttackMap:
+    """Attack bitboards of every piece of a position, built once per evaluation (see Stockfish's attackedBy).
+
+    piece_attacks[color] lists (piece_type, attacks) per piece; pawns appear as two
+    entries, their left and right captures, so counting squares over the list gives
+    the same attacker counts as board.attackers() square by square.
+    """
+
+    def __init__(self, board):
+        occupied = board.occupied
+        self.piece_attacks = [[], []]
+        self.attacked_by = [[0] * 7, [0] * 7]  # [color][piece_type], index 0 for all pieces
+        for color in chess.COLORS:
+            piece_attacks = self.piece_attacks[color]
+            attacked_by = self.attacked_by[color]
+            pawns = board.pawns & board.occupied_co[color]
+            if color == chess.WHITE:
+                left = ((pawns & ~chess.BB_FILE_A) << 7) & chess.BB_ALL
+                right = ((pawns & ~chess.BB_FILE_H) << 9) & chess.BB_ALL
+            else:
+                left = (pawns & ~chess.BB_FILE_A) >> 9
+                right = (pawns & ~chess.BB_FILE_H) >> 7
+            piece_attacks.append((chess.PAWN, left))
+            piece_attacks.append((chess.PAWN, right))
+            attacked_by[chess.PAWN] = left | right
+            for piece_type in (chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING):
+                union = 0
+                for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                    attacks = _piece_attacks(piece_type, square, occupied)
+                    piece_attacks.append((piece_type, attacks))
+                    union |= attacks
+                attacked_by[piece_type] = union
+            attacked_by[0] = (attacked_by[chess.PAWN] | attacked_by[chess.KNIGHT] | attacked_by[chess.BISHOP]
+                              | attacked_by[chess.ROOK] | attacked_by[chess.QUEEN] | attacked_by[chess.KING])
+
+    def count(self, color, mask):
+        """Number of (attacker, square) pairs of a color over the squares of mask"""
+        popcount = chess.popcount
+        return sum(popcount(attacks & mask) for _, attacks in self.piece_attacks[color])
+
+    def weighted_count(self, color, mask, weights):
+        """Attacker count and per-piece-type weighted count of a color over the squares of mask"""
+        popcount = chess.popcount
+        count = 0
+        weighted = 0
+        for piece_type, attacks in self.piece_attacks[color]:
+            n = popcount(attacks & mask)
+            count += n
+            weighted += n * weights[piece_type]
+        return count, weighted
+
+
+def _attackers_to(board, square, occupied):
+    """Bitboard of pieces of both colors attacking a square, given an occupancy (for x-rays)"""
+    queens_and_rooks = board.queens | board.rooks
+    queens_and_bishops = board.queens | board.bishops
+    return (
+        (chess.BB_KNIGHT_ATTACKS[square] & board.knights)
+        | (chess.BB_KING_ATTACKS[square] & board.kings)
+        | (chess.BB_PAWN_ATTACKS[chess.WHITE][square] & board.pawns & board.occupied_co[chess.BLACK])
+        | (chess.BB_PAWN_ATTACKS[chess.BLACK][square] & board.pawns & board.occupied_co[chess.WHITE])
+        | (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] & queens_and_rooks)
+        | (chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied] & queens_and_rooks)
+        | (chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied] & queens_and_bishops)
+    ) & occupied
+
+
+class Position:
+    """Compact search board: piece-type and color bitboards, a mailbox and an undo stack.
+
+    Mirrors the parts of chess.Board the search and evaluation use (same attribute
+    names, same move generation order), without python-chess's move stack,
+    board-state snapshots and chess960/variant handling: push() stores a small
+    undo tuple in a preallocated list and pop() reverses the move from it.
+    Built from a chess.Board at the root; standard chess only, with the castling
+    rights cleaned once there and kept clean by push().
+    """
+
+    __slots__ = ("piece_bb", "occupied_co", "occupied", "squares", "turn", "castling_rights", "ep_square",
+                 "halfmove_clock", "fullmove_number", "undo", "undo_size")
+
+    def __init__(self, board):
+        self.piece_bb = [0, board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings]
+        self.occupied_co = [board.occupied_co[chess.BLACK], board.occupied_co[chess.WHITE]]
+        self.occupied = board.occupied
+        self.squares = [board.piece_type_at(square) for square in chess.SQUARES]  # Mailbox: piece type or None
+        self.turn = board.turn
+        self.castling_rights = board.clean_castling_rights()
+        self.ep_square = board.ep_square
+        self.halfmove_clock = board.halfmove_clock
+        self.fullmove_number = board.fullmove_number
+        self.undo = [None] * UNDO_STACK_SIZE
+        self.undo_size = 0
+
+    def to_board(self):
+        """chess.Board of the current position (without move history)"""
+        board = chess.Board(None)
+        board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings = self.piece_bb[1:]
+        board.occupied_co[chess.WHITE] = self.occupied_co[chess.WHITE]
+        board.occupied_co[chess.BLACK] = self.occupied_co[chess.BLACK]
+        board.occupied = self.occupied
+        board.turn = self.turn
+        board.castling_rights = self.castling_rights
+        board.ep_square = self.ep_square
+        board.halfmove_clock = self.halfmove_clock
+        board.fullmove_number = self.fullmove_number
+        return board
+
+    def fen(self):
+        return self.to_board().fen()
+
+    @property
+    def pawns(self):
+        return self.piece_bb[chess.PAWN]
+
+    @property
+    def knights(self):
+        return self.piece_bb[chess.KNIGHT]
+
+    @property
+    def bishops(self):
+        return self.piece_bb[chess.BISHOP]
+
+    @property
+    def rooks(self):
+        return self.piece_bb[chess.ROOK]
+
+    @property
+    def queens(self):
+        return self.piece_bb[chess.QUEEN]
+
+    @property
+    def kings(self):
+        return self.piece_bb[chess.KING]
+
+    # Piece queries
+
+    def piece_type_at(self, square):
+        return self.squares[square]
+
+    def piece_at(self, square):
+        piece_type = self.squares[square]
+        if piece_type is None:
+            return None
+        return chess.Piece(piece_type, bool(self.occupied_co[chess.WHITE] & chess.BB_SQUARES[square]))
+
+    def pieces_mask(self, piece_type, color):
+        return self.piece_bb[piece_type] & self.occupied_co[color]
+
+    def pieces(self, piece_type, color):
+        return chess.SquareSet(self.piece_bb[piece_type] & self.occupied_co[color])
+
+    def piece_map(self):
+        white = self.occupied_co[chess.WHITE]
+        squares = self.squares
+        return {square: chess.Piece(squares[square], bool(white & chess.BB_SQUARES[square]))
+                for square in chess.scan_reversed(self.occupied)}
+
+    def king(self, color):
+        king_mask = self.piece_bb[chess.KING] & self.occupied_co[color]
+        return king_mask.bit_length() - 1 if king_mask else None
+
+    # Attacks
+
+    def attacks_mask(self, square):
+        piece_type = self.squares[square]
+        if piece_type == chess.PAWN:
+            return chess.BB_PAWN_ATTACKS[bool(self.occupied_co[chess.WHITE] & chess.BB_SQUARES[square])][square]
+        if piece_type is None:
+            return 0
+        return _piece_attacks(piece_type, square, self.occupied)
+
+    def attackers_mask(self, color, square, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        piece_bb = self.piece_bb
+        queens = piece_bb[chess.QUEEN]
+        attackers = ((chess.BB_KING_ATTACKS[square] & piece_bb[chess.KING])
+                     | (chess.BB_KNIGHT_ATTACKS[square] & piece_bb[chess.KNIGHT])
+                     | ((chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied]
+                         | chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+                        & (queens | piece_bb[chess.ROOK]))
+                     | (chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+                        & (queens | piece_bb[chess.BISHOP]))
+                     | (chess.BB_PAWN_ATTACKS[not color][square] & piece_bb[chess.PAWN]))
+        return attackers & self.occupied_co[color]
+
+    def is_attacked_by(self, color, square):
+        return bool(self.attackers_mask(color, square))
+
+    def checkers_mask(self):
+        king = self.king(self.turn)
+        return 0 if king is None else self.attackers_mask(not self.turn, king)
+
+    def is_check(self):
+        return bool(self.checkers_mask())
+
+    def pin_mask(self, color, square):
+        king = self.king(color)
+        if king is None:
+            return chess.BB_ALL
+        square_mask = chess.BB_SQUARES[square]
+        piece_bb = self.piece_bb
+        straight = piece_bb[chess.ROOK] | piece_bb[chess.QUEEN]
+        for attacks, sliders in ((chess.BB_FILE_ATTACKS, straight), (chess.BB_RANK_ATTACKS, straight),
+                                 (chess.BB_DIAG_ATTACKS, piece_bb[chess.BISHOP] | piece_bb[chess.QUEEN])):
+            rays = attacks[king][0]
+            if rays & square_mask:
+                for sniper in chess.scan_reversed(rays & sliders & self.occupied_co[not color]):
+                    if chess.between(sniper, king) & (self.occupied | square_mask) == square_mask:
+                        return chess.ray(king, sniper)
+                break
+        return chess.BB_ALL
+
+    # Move generation, in python-chess order
+
+    def generate_pseudo_legal_moves(self, from_mask=chess.BB_ALL, to_mask=chess.BB_ALL):
+        us = self.turn
+        our_pieces = self.occupied_co[us]
+        pawns = self.piece_bb[chess.PAWN]
+        Move = chess.Move
+
+        # Piece moves
+        for from_square in chess.scan_reversed(our_pieces & ~pawns & from_mask):
+            for to_square in chess.scan_reversed(self.attacks_mask(from_square) & ~our_pieces & to_mask):
+                yield Move(from_square, to_square)
+
+        if from_mask & self.piece_bb[chess.KING]:
+            yield from self.generate_castling_moves(from_mask, to_mask)
+
+        pawns &= our_pieces & from_mask
+        if not pawns:
+            return
+
+        # Pawn captures
+        targets_mask = self.occupied_co[not us] & to_mask
+        for from_square in chess.scan_reversed(pawns):
+            for to_square in chess.scan_reversed(chess.BB_PAWN_ATTACKS[us][from_square] & targets_mask):
+                if to_square < 8 or to_square >= 56:
+                    yield Move(from_square, to_square, chess.QUEEN)
+                    yield Move(from_square, to_square, chess.ROOK)
+                    yield Move(from_square, to_square, chess.BISHOP)
+                    yield Move(from_square, to_square, chess.KNIGHT)
+                else:
+                    yield Move(from_square, to_square)
+
+        # Pawn pushes
+        empty = ~self.occupied
+        if us == chess.WHITE:
+            single_moves = pawns << 8 & empty
+            double_moves = single_moves << 8 & empty & chess.BB_RANK_4
+            step = -8
+        else:
+            single_moves = pawns >> 8 & empty
+            double_moves = single_moves >> 8 & empty & chess.BB_RANK_5
+            step = 8
+        for to_square in chess.scan_reversed(single_moves & to_mask):
+            from_square = to_square + step
+            if to_square < 8 or to_square >= 56:
+                yield Move(from_square, to_square, chess.QUEEN)
+                yield Move(from_square, to_square, chess.ROOK)
+                yield Move(from_square, to_square, chess.BISHOP)
+                yield Move(from_square, to_square, chess.KNIGHT)
+            else:
+                yield Move(from_square, to_square)
+        for to_square in chess.scan_reversed(double_moves & to_mask):
+            yield Move(to_square + 2 * step, to_square)
+
+        if self.ep_square:
+            yield from self.generate_pseudo_legal_ep(from_mask, to_mask)
+
+    def generate_pseudo_legal_ep(self, from_mask=chess.BB_ALL, to_mask=chess.BB_ALL):
+        ep_square = self.ep_square
+        if not ep_square or not chess.BB_SQUARES[ep_square] & to_mask or chess.BB_SQUARES[ep_square] & self.occupied:
+            return
+        capturers = (self.piece_bb[chess.PAWN] & self.occupied_co[self.turn] & from_mask
+                     & chess.BB_PAWN_ATTACKS[not self.turn][ep_square] & chess.BB_RANKS[4 if self.turn else 3])
+        for capturer in chess.scan_reversed(capturers):
+            yield chess.Move(capturer, ep_square)
+
+    def generate_castling_moves(self, from_mask=chess.BB_ALL, to_mask=chess.BB_ALL):
+        """King-two-squares castling moves; the clean rights guarantee the king on e1/e8 and rooks in the corners"""
+        us = self.turn
+        backrank = chess.BB_RANK_1 if us == chess.WHITE else chess.BB_RANK_8
+        rights = self.castling_rights & backrank & to_mask
+        if not rights:
+            return
+        king_mask = self.occupied_co[us] & self.piece_bb[chess.KING] & backrank & from_mask
+        if not king_mask:
+            return
+        king = king_mask.bit_length() - 1
+        occupied = self.occupied
+        for candidate in chess.scan_reversed(rights):
+            rook = chess.BB_SQUARES[candidate]
+            if candidate < king:
+                king_to, rook_to = king - 2, king - 1
+            else:
+                king_to, rook_to = king + 2, king + 1
+            king_to_mask = chess.BB_SQUARES[king_to]
+            rook_to_mask = chess.BB_SQUARES[rook_to]
+            king_path = chess.between(king, king_to)
+            rook_path = chess.between(candidate, rook_to)
+            if not ((occupied ^ king_mask ^ rook) & (king_path | rook_path | king_to_mask | rook_to_mask)
+                    or self._attacked_for_king(king_path | king_mask, occupied ^ king_mask)
+                    or self._attacked_for_king(king_to_mask, occupied ^ king_mask ^ rook ^ rook_to_mask)):
+                yield chess.Move(king, king_to)
+
+    def _attacked_for_king(self, path, occupied):
+        them = not self.turn
+        return any(self.attackers_mask(them, square, occupied) for square in chess.scan_reversed(path))
+
+    def _slider_blockers(self, king):
+        piece_bb = self.piece_bb
+        rooks_and_queens = piece_bb[chess.ROOK] | piece_bb[chess.QUEEN]
+        bishops_and_queens = piece_bb[chess.BISHOP] | piece_bb[chess.QUEEN]
+        snipers = ((chess.BB_RANK_ATTACKS[king][0] & rooks_and_queens)
+                   | (chess.BB_FILE_ATTACKS[king][0] & rooks_and_queens)
+                   | (chess.BB_DIAG_ATTACKS[king][0] & bishops_and_queens))
+        blockers = 0
+        for sniper in chess.scan_reversed(snipers & self.occupied_co[not self.turn]):
+            between = chess.between(king, sniper) & self.occupied
+            # Exactly one piece in between
+            if between and not between & (between - 1):
+                blockers |= between
+        return blockers & self.occupied_co[self.turn]
+
+    def _is_safe(self, king, blockers, move):
+        from_square = move.from_square
+        if from_square == king:
+            if self.is_castling(move):
+                return True
+            return not self.attackers_mask(not self.turn, move.to_square)
+        if self.is_en_passant(move):
+            return bool(self.pin_mask(self.turn, from_square) & chess.BB_SQUARES[move.to_square]
+                        and not self._ep_skewered(king, from_square))
+        return bool(not blockers & chess.BB_SQUARES[from_square]
+                    or chess.ray(from_square, move.to_square) & chess.BB_SQUARES[king])
+
+    def _ep_skewered(self, king, capturer):
+        """True if taking en passant uncovers a slider attack on the king along the rank (or a diagonal)"""
+        last_double = self.ep_square + (-8 if self.turn == chess.WHITE else 8)
+        occupancy = (self.occupied & ~chess.BB_SQUARES[last_double] & ~chess.BB_SQUARES[capturer]
+                     | chess.BB_SQUARES[self.ep_square])
+        piece_bb = self.piece_bb
+        theirs = self.occupied_co[not self.turn]
+        if (chess.BB_RANK_ATTACKS[king][chess.BB_RANK_MASKS[king] & occupancy]
+                & theirs & (piece_bb[chess.ROOK] | piece_bb[chess.QUEEN])):
+            return True
+        return bool(chess.BB_DIAG_ATTACKS[king][chess.BB_DIAG_MASKS[king] & occupancy]
+                    & theirs & (piece_bb[chess.BISHOP] | piece_bb[chess.QUEEN]))
+
+    def _generate_evasions(self, king, checkers, from_mask=chess.BB_ALL, to_mask=chess.BB_ALL):
+        piece_bb = self.piece_bb
+        attacked = 0
+        for checker in chess.scan_reversed(checkers & (piece_bb[chess.BISHOP] | piece_bb[chess.ROOK]
+                                                       | piece_bb[chess.QUEEN])):
+            attacked |= chess.ray(king, checker) & ~chess.BB_SQUARES[checker]
+
+        if chess.BB_SQUARES[king] & from_mask:
+            for to_square in chess.scan_reversed(chess.BB_KING_ATTACKS[king] & ~self.occupied_co[self.turn]
+                                                 & ~attacked & to_mask):
+                yield chess.Move(king, to_square)
+
+        checker = checkers.bit_length() - 1
+        if chess.BB_SQUARES[checker] == checkers:
+            # Capture or block a single checker
+            target = chess.between(king, checker) | checkers
+            yield from self.generate_pseudo_legal_moves(~piece_bb[chess.KING] & from_mask, target & to_mask)
+            # Capture the checking pawn en passant (without duplicating moves)
+            if self.ep_square and not chess.BB_SQUARES[self.ep_square] & target:
+                if self.ep_square + (-8 if self.turn == chess.WHITE else 8) == checker:
+                    yield from self.generate_pseudo_legal_ep(from_mask, to_mask)
+
+    def generate_legal_moves(self, from_mask=chess.BB_ALL, to_mask=chess.BB_ALL):
+        king_mask = self.piece_bb[chess.KING] & self.occupied_co[self.turn]
+        if not king_mask:
+            yield from self.generate_pseudo_legal_moves(from_mask, to_mask)
+            return
+        king = king_mask.bit_length() - 1
+        blockers = self._slider_blockers(king)
+        checkers = self.attackers_mask(not self.turn, king)
+        if checkers:
+            moves = self._generate_evasions(king, checkers, from_mask, to_mask)
+        else:
+            moves = self.generate_pseudo_legal_moves(from_mask, to_mask)
+        is_safe = self._is_safe
+        for move in moves:
+            if is_safe(king, blockers, move):
+                yield move
+
+    def generate_legal_ep(self, from_mask=chess.BB_ALL, to_mask=chess.BB_ALL):
+        for move in self.generate_pseudo_legal_ep(from_mask, to_mask):
+            if not self.is_into_check(move):
+                yield move
+
+    def generate_legal_captures(self, from_mask=chess.BB_ALL, to_mask=chess.BB_ALL):
+        yield from self.generate_legal_moves(from_mask, to_mask & self.occupied_co[not self.turn])
+        yield from self.generate_legal_ep(from_mask, to_mask)
+
+    # Move classification
+
+    def is_pseudo_legal(self, move):
+        if not move:
+            return False
+        from_square = move.from_square
+        to_square = move.to_square
+        piece_type = self.squares[from_square]
+        if piece_type is None:
+            return False
+        from_mask = chess.BB_SQUARES[from_square]
+        to_mask = chess.BB_SQUARES[to_square]
+        if not self.occupied_co[self.turn] & from_mask:
+            return False
+        if move.promotion:
+            if piece_type != chess.PAWN or to_square >> 3 != (7 if self.turn == chess.WHITE else 0):
+                return False
+        if piece_type == chess.KING:
+            if self.castling_rights & self.occupied_co[self.turn] & to_mask:  # King-takes-rook notation (e1h1)
+                move = chess.Move(from_square, from_square + 2 if to_square > from_square else from_square - 2)
+            if move in self.generate_castling_moves():
+                return True
+        if self.occupied_co[self.turn] & to_mask:
+            return False
+        if piece_type == chess.PAWN:
+            return move in self.generate_pseudo_legal_moves(from_mask, to_mask)
+        return bool(self.attacks_mask(from_square) & to_mask)
+
+    def is_into_check(self, move):
+        king = self.king(self.turn)
+        if king is None:
+            return False
+        checkers = self.attackers_mask(not self.turn, king)
+        if checkers and move not in self._generate_evasions(king, checkers, chess.BB_SQUARES[move.from_square],
+                                                            chess.BB_SQUARES[move.to_square]):
+            return True
+        return not self._is_safe(king, self._slider_blockers(king), move)
+
+    def is_legal(self, move):
+        return self.is_pseudo_legal(move) and not self.is_into_check(move)
+
+    def is_en_passant(self, move):
+        to_square = move.to_square
+        return (self.ep_square == to_square and self.squares[move.from_square] == chess.PAWN
+                and abs(to_square - move.from_square) in (7, 9) and self.squares[to_square] is None)
+
+    def is_capture(self, move):
+        touched = chess.BB_SQUARES[move.from_square] ^ chess.BB_SQUARES[move.to_square]
+        return bool(touched & self.occupied_co[not self.turn]) or self.is_en_passant(move)
+
+    def is_castling(self, move):
+        if self.squares[move.from_square] == chess.KING:
+            diff = (move.from_square & 7) - (move.to_square & 7)
+            return (abs(diff) > 1
+                    or bool(self.piece_bb[chess.ROOK] & self.occupied_co[self.turn] & chess.BB_SQUARES[move.to_square]))
+        return False
+
+    def gives_check(self, move):
+        """True if the legal move checks the enemy king, directly or by discovery, decided without making it"""
+        us = self.turn
+        king = self.king(not us)
+        if king is None:
+            return False
+        from_square = move.from_square
+        to_square = move.to_square
+        piece_type = self.squares[from_square]
+        moved = chess.BB_SQUARES[from_square]
+        to_mask = chess.BB_SQUARES[to_square]
+        king_mask = chess.BB_SQUARES[king]
+
+        if piece_type == chess.KING:
+            attacks = 0
+            if self.piece_bb[chess.ROOK] & self.occupied_co[us] & to_mask:
+                to_square = from_square + 2 if to_square > from_square else from_square - 2  # King takes rook
+                to_mask = chess.BB_SQUARES[to_square]
+            occupied = self.occupied & ~moved | to_mask
+            if to_square - from_square == 2 or from_square - to_square == 2:
+                rook_to = (from_square + to_square) // 2
+                rook_from = to_square + 1 if to_square > from_square else to_square - 2
+                moved |= chess.BB_SQUARES[rook_from]
+                occupied = occupied & ~chess.BB_SQUARES[rook_from] | chess.BB_SQUARES[rook_to]
+                attacks = _piece_attacks(chess.ROOK, rook_to, occupied)
+        else:
+            occupied = self.occupied & ~moved | to_mask
+            if move.promotion:
+                attacks = _piece_attacks(move.promotion, to_square, occupied)
+            elif piece_type == chess.PAWN:
+                attacks = chess.BB_PAWN_ATTACKS[us][to_square]
+                if self.is_en_passant(move):
+                    occupied &= ~chess.BB_SQUARES[to_square - 8 if us == chess.WHITE else to_square + 8]
+            else:
+                attacks = _piece_attacks(piece_type, to_square, occupied)
+        if attacks & king_mask:
+            return True
+
+        # Discovered checks by our sliders that stayed put, through the vacated squares
+        piece_bb = self.piece_bb
+        ours = self.occupied_co[us] & ~moved
+        return bool(_piece_attacks(chess.ROOK, king, occupied) & (piece_bb[chess.ROOK] | piece_bb[chess.QUEEN]) & ours
+                    or _piece_attacks(chess.BISHOP, king, occupied)
+                    & (piece_bb[chess.BISHOP] | piece_bb[chess.QUEEN]) & ours)
+
+    def generate_quiet_checks(self):
+        """Legal non-captures that give check, in generation order, found without making them.
+
+        As Stockfish's StateInfo::checkSquares and blockersForKing: a move checks
+        directly when it lands on a square from which its piece attacks the enemy
+        king, and by discovery when it moves a sole blocker of one of our sliders
+        off the line to that king. Promotions test the new piece's attacks, and
+        castling the rook's. En passant counts as a capture and is skipped.
+        """
+        us = self.turn
+        king = self.king(not us)
+        if king is None:
+            return
+        piece_bb = self.piece_bb
+        occupied = self.occupied
+        king_mask = chess.BB_SQUARES[king]
+        diagonal = chess.BB_DIAG_ATTACKS[king][chess.BB_DIAG_MASKS[king] & occupied]
+        straight = (chess.BB_RANK_ATTACKS[king][chess.BB_RANK_MASKS[king] & occupied]
+                    | chess.BB_FILE_ATTACKS[king][chess.BB_FILE_MASKS[king] & occupied])
+        check_squares = [0, chess.BB_PAWN_ATTACKS[not us][king], chess.BB_KNIGHT_ATTACKS[king], diagonal,
+                         straight, diagonal | straight, 0]
+
+        # Our pieces standing alone between one of our sliders and the enemy king
+        discoverers = 0
+        snipers = ((chess.BB_RANK_ATTACKS[king][0] | chess.BB_FILE_ATTACKS[king][0])
+                   & (piece_bb[chess.ROOK] | piece_bb[chess.QUEEN])
+                   | chess.BB_DIAG_ATTACKS[king][0] & (piece_bb[chess.BISHOP] | piece_bb[chess.QUEEN]))
+        for sniper in chess.scan_reversed(snipers & self.occupied_co[us]):
+            between = chess.between(king, sniper) & occupied
+            if between and not between & (between - 1):
+                discoverers |= between
+        discoverers &= self.occupied_co[us]
+
+        # Only these targets can give a direct check; discoverers and promotions may move anywhere
+        backrank = chess.BB_RANK_1 if us == chess.WHITE else chess.BB_RANK_8
+        to_mask = (check_squares[chess.PAWN] | check_squares[chess.KNIGHT] | diagonal | straight
+                   | (chess.BB_RANK_8 if us == chess.WHITE else chess.BB_RANK_1) | self.castling_rights & backrank)
+        if discoverers:
+            to_mask = chess.BB_ALL
+        to_mask &= ~self.occupied_co[not us]
+
+        squares = self.squares
+        for move in self.generate_legal_moves(chess.BB_ALL, to_mask):
+            from_square = move.from_square
+            to_square = move.to_square
+            piece_type = squares[from_square]
+            if piece_type == chess.PAWN and to_square == self.ep_square:
+                continue
+            to_square_mask = chess.BB_SQUARES[to_square]
+            if discoverers & chess.BB_SQUARES[from_square] and not chess.ray(king, from_square) & to_square_mask:
+                yield move
+            elif move.promotion:
+                if _piece_attacks(move.promotion, to_square, occupied ^ chess.BB_SQUARES[from_square]) & king_mask:
+                    yield move
+            elif piece_type == chess.KING:
+                if to_square - from_square == 2 or from_square - to_square == 2:
+                    rook_to = (from_square + to_square) // 2
+                    after = occupied ^ chess.BB_SQUARES[from_square] ^ to_square_mask
+                    rook_from = to_square + 1 if to_square > from_square else to_square - 2
+                    after ^= chess.BB_SQUARES[rook_from] | chess.BB_SQUARES[rook_to]
+                    if _piece_attacks(chess.ROOK, rook_to, after) & king_mask:
+                        yield move
+            elif to_square_mask & check_squares[piece_type]:
+                yield move
+
+    def clean_castling_rights(self):
+        return self.castling_rights
+
+    def has_kingside_castling_rights(self, color):
+        return bool(self.castling_rights & (chess.BB_H1 if color == chess.WHITE else chess.BB_H8))
+
+    def has_queenside_castling_rights(self, color):
+        return bool(self.castling_rights & (chess.BB_A1 if color == chess.WHITE else chess.BB_A8))
+
+    def has_insufficient_material(self, color):
+        piece_bb = self.piece_bb
+        ours = self.occupied_co[color]
+        if ours & (piece_bb[chess.PAWN] | piece_bb[chess.ROOK] | piece_bb[chess.QUEEN]):
+            return False
+        if ours & piece_bb[chess.KNIGHT]:
+            return (chess.popcount(ours) <= 2
+                    and not (self.occupied_co[not color] & ~piece_bb[chess.KING] & ~piece_bb[chess.QUEEN]))
+        if ours & piece_bb[chess.BISHOP]:
+            bishops = piece_bb[chess.BISHOP]
+            same_color = not bishops & chess.BB_DARK_SQUARES or not bishops & chess.BB_LIGHT_SQUARES
+            return same_color and not piece_bb[chess.PAWN] and not piece_bb[chess.KNIGHT]
+        return True
+
+    def is_insufficient_material(self):
+        return self.has_insufficient_material(chess.WHITE) and self.has_insufficient_material(chess.BLACK)
+
+    # Make / unmake
+
+    def push(self, move):
+        """Make a legal move, saving (move, captured type, castling rights, ep square, halfmove clock) for pop()"""
+        from_square = move.from_square
+        to_square = move.to_square
+        squares = self.squares
+        piece_bb = self.piece_bb
+        occupied_co = self.occupied_co
+        us = self.turn
+        them = not us
+        piece_type = squares[from_square]
+        captured_type = squares[to_square]
+        ep_square = self.ep_square
+        self.undo[self.undo_size] = (move, captured_type, self.castling_rights, ep_square, self.halfmove_clock)
+        self.undo_size += 1
+
+        from_mask = chess.BB_SQUARES[from_square]
+        to_mask = chess.BB_SQUARES[to_square]
+        self.ep_square = None
+        self.halfmove_clock += 1
+        if us == chess.BLACK:
+            self.fullmove_number += 1
+        if self.castling_rights:
+            self.castling_rights &= ~(from_mask | to_mask)
+
+        piece_bb[piece_type] ^= from_mask
+        occupied_co[us] ^= from_mask
+        squares[from_square] = None
+        if captured_type is not None:
+            piece_bb[captured_type] ^= to_mask
+            occupied_co[them] ^= to_mask
+            self.halfmove_clock = 0
+        new_type = move.promotion or piece_type
+        piece_bb[new_type] |= to_mask
+        occupied_co[us] |= to_mask
+        squares[to_square] = new_type
+
+        if piece_type == chess.PAWN:
+            self.halfmove_clock = 0
+            diff = to_square - from_square
+            if diff == 16 or diff == -16:
+                self.ep_square = from_square + diff // 2
+            elif to_square == ep_square and captured_type is None and diff != 8 and diff != -8:
+                capture_square = to_square - 8 if us == chess.WHITE else to_square + 8
+                capture_mask = chess.BB_SQUARES[capture_square]
+                piece_bb[chess.PAWN] ^= capture_mask
+                occupied_co[them] ^= capture_mask
+                squares[capture_square] = None
+        elif piece_type == chess.KING:
+            if self.castling_rights:
+                self.castling_rights &= ~(chess.BB_RANK_1 if us == chess.WHITE else chess.BB_RANK_8)
+            if to_square - from_square == 2 or from_square - to_square == 2:
+                self._move_castling_rook(from_square, to_square)
+
+        self.occupied = occupied_co[chess.WHITE] | occupied_co[chess.BLACK]
+        self.turn = them
+
+    def _move_castling_rook(self, king_from, king_to):
+        """Move (or, on unmake, move back) the rook of a castling king move, in both directions by xor"""
+        if king_to > king_from:
+            rook_from, rook_to = king_to + 1, king_to - 1
+        else:
+            rook_from, rook_to = king_to - 2, king_to + 1
+        if self.squares[rook_to] == chess.ROOK:
+            rook_from, rook_to = rook_to, rook_from
+        mask = chess.BB_SQUARES[rook_from] | chess.BB_SQUARES[rook_to]
+        self.piece_bb[chess.ROOK] ^= mask
+        self.occupied_co[self.turn] ^= mask
+        self.squares[rook_from] = None
+        self.squares[rook_to] = chess.ROOK
+
+    def push_null(self):
+        """Pass the turn, forfeiting en passant"""
+        self.undo[self.undo_size] = (None, None, self.castling_rights, self.ep_square, self.halfmove_clock)
+        self.undo_size += 1
+        self.ep_square = None
+        self.halfmove_clock += 1
+        if self.turn == chess.BLACK:
+            self.fullmove_number += 1
+        self.turn = not self.turn
+
+    def pop(self):
+        """Unmake the last push() or push_null() and return its move (None for a null move)"""
+        self.undo_size -= 1
+        move, captured_type, self.castling_rights, ep_square, self.halfmove_clock = self.undo[self.undo_size]
+        self.ep_square = ep_square
+        self.turn = us = not self.turn
+        if us == chess.BLACK:
+            self.fullmove_number -= 1
+        if move is None:
+            return None
+
+        from_square = move.from_square
+        to_square = move.to_square
+        squares = self.squares
+        piece_bb = self.piece_bb
+        occupied_co = self.occupied_co
+        from_mask = chess.BB_SQUARES[from_square]
+        to_mask = chess.BB_SQUARES[to_square]
+        new_type = squares[to_square]
+        piece_type = chess.PAWN if move.promotion else new_type
+
+        piece_bb[new_type] ^= to_mask
+        occupied_co[us] ^= to_mask
+        squares[to_square] = None
+        piece_bb[piece_type] |= from_mask
+        occupied_co[us] |= from_mask
+        squares[from_square] = piece_type
+        if captured_type is not None:
+            piece_bb[captured_type] |= to_mask
+            occupied_co[not us] |= to_mask
+            squares[to_square] = captured_type
+        elif piece_type == chess.PAWN and to_square == ep_square:
+            capture_square = to_square - 8 if us == chess.WHITE else to_square + 8
+            capture_mask = chess.BB_SQUARES[capture_square]
+            piece_bb[chess.PAWN] |= capture_mask
+            occupied_co[not us] |= capture_mask
+            squares[capture_square] = chess.PAWN
+        elif piece_type == chess.KING and (to_square - from_square == 2 or from_square - to_square == 2):
+            self._move_castling_rook(from_square, to_square)
+
+        self.occupied = occupied_co[chess.WHITE] | occupied_co[chess.BLACK]
+        return move
+
+
+def _piece_to(piece_type, color, square):
+    """Index of a moved piece and its destination in the piece-to history tables"""
+    return 64 * ((piece_type - 1) * 2 + color) + square
+
+
+def _history_bonus(depth):
+    """History reward for a quiet move that caused a beta cutoff at this depth"""
+    return min(150 * depth - 100, HISTORY_BONUS_MAX)
+
+
+def _update_history(table, index, bonus, limit):
+    """Gravity update: the entry moves towards the bonus and saturates at +-limit"""
+    entry = table[index]
+    table[index] = entry + bonus - entry * abs(bonus) // limit
+
+
+_HALVING_MASKS = {}  # Table length -> (value bits, sign bits) of every int16 lane
+
+
+def _halve_history(table):
+    """Halve every entry of an array('h') in place (arithmetic shift, as value >> 1).
+
+    The buffer is shifted right by one bit as a single big integer, in C: each lane
+    loses the bit it got from its upper neighbour and keeps its own sign bit.
+    """
+    size = len(table)
+    masks = _HALVING_MASKS.get(size)
+    if masks is None:
+        masks = _HALVING_MASKS[size] = (
+            int.from_bytes((array('h', [0x7FFF]) * size).tobytes(), sys.byteorder),
+            int.from_bytes((array('h', [-0x8000]) * size).tobytes(), sys.byteorder))
+    value_bits, sign_bits = masks
+    bits = int.from_bytes(table, sys.byteorder)
+    bits = (bits >> 1) & value_bits | bits & sign_bits
+    memoryview(table).cast('B')[:] = bits.to_bytes(2 * size, sys.byteorder)
+
+
+def _encode_move(move):
+    """Pack a move into 16 bits: from | to << 6 | promotion << 12"""
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def _score_to_tt(score, ply):
+    """Convert mate scores from distance-to-root to distance-to-node"""
+    if score >= MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    """Inverse of _score_to_tt"""
+    if score >= MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score <= -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
 
 class ChessAI:
-    def __init__(self, depth=4, time_limit=10, opening_book_path="assets/books/komodo.bin"): # <--- Thêm opening_book_path
+    def __init__(self, depth=4, time_limit=10, opening_book_path="assets/books/komodo.bin", hash_size_mb=16,
+                 threads=1, enable_stockfish=True, eval_cache_mb=4): # <--- Thêm opening_book_path
         self.depth = depth
         self.time_limit = time_limit
         self.board = chess.Board()
-        self.transposition_table = {}
-        self.history_table = {} # Thêm history_table nếu chưa có (đã có trong code bạn cung cấp)
-        self.killer_moves = [[None, None] for _ in range(100)] # Khởi tạo killer_moves (đã có)
+        self.threads = max(1, threads)
+        if self.threads > 1:
+            self.transposition_table = SharedTranspositionTable(hash_size_mb)
+        else:
+            self.transposition_table = TranspositionTable(hash_size_mb)
+        self._clear_history()
         self.nodes_searched = 0
-        self.max_nodes = 1000000
         self.best_move_found = None
-        self.eval_cache = {} # Mặc dù không thấy dùng trong code mới, giữ lại nếu cần
+        self.eval_cache = EvalCache(eval_cache_mb) # Static evaluations by Zobrist key, White's point of view
         self.stop_search = False # Thêm cờ này nếu chưa có (đã có)
+        self.stop_event = None # Set from another process/thread to abort the search
+        self.target_depth = 0 # Depth the current iterative deepening aims for
+        self.time_manager = TimeManager()
+        self.clock = None # (time left, increment, moves to go) for the side to move, or None for time_limit per move
+        self.node_limit = 0 # Stop after this many nodes (0 = no limit)
+        self.time_limited = True # False when only deterministic limits apply
+        self.root_score = 0 # Score of the last completed iteration
+        self.best_move_changes = 0.0
+        self.completed_depth = 0 # Last fully completed iteration
+
+        # Pondering: search the expected reply in the background during the opponent's turn
+        self.ponder_enabled = False
+        self.pondering = False # True while this instance is a ponder search ignoring the clock
+        self._ponder = None # (thread, helper, expected key, expected stack length, result) while pondering
+        self._ponder_ai = None # ChessAI running the ponder searches, created on first use and reused
+        self.ponder_move = None # Expected opponent reply being pondered on
+
+        # Selectivity switches, so each technique can be measured on its own
+        self.use_null_move = True
+        self.use_lmr = True
+        self.use_reverse_futility = True
+        self.use_futility = True
+        self.use_late_move_pruning = True
+        self.use_delta_pruning = True
+        self.position = Position(self.board) # Search board, rebuilt from self.board at the root of every search
+        self.zobrist_key = 0 # Zobrist key of self.position during search, updated on make/unmake
+        self.key_history = [] # Keys of earlier positions, back to the last irreversible move
+        self.null_history = [] # len(key_history) after each null move on the search stack
+        self.psq_mg = 0 # Material + PST of self.position (White's view), middlegame king table
+        self.psq_eg = 0 # Same with the endgame king table
+        self.pawn_key = 0 # Zobrist key of the pawns only, for the pawn hash table
+        self.phase = PHASE_MAX # Game phase from non-pawn material: PHASE_MAX = all pieces on, 0 = pawn endgame
+        self.eval_history = [] # (psq_mg, psq_eg, pawn_key, phase) before each move on the search stack
+        self.pawn_table = PawnHashTable()
+        self.debug_incremental = False # Check the incremental evaluation against a full recomputation
+        self.eval_tiers = [0, 0, 0] # Evaluations answered by the cache, by the cheap terms (lazy exit), in full
+        self.evaluator = None # Evaluator replacing the built-in terms (e.g. nnue.NNUEEvaluator), or None
         self.start_time = 0 # Khởi tạo self.start_time (đã có)
 
 
@@ -115,7 +1675,7 @@ class ChessAI:
         self.use_stockfish_for_main_ai = False # Sẽ được set bởi toggle_stockfish
         self.use_stockfish_as_opponent = False # Sẽ được set bởi toggle_stockfish_opponent
 
-        self.stockfish_path = self._find_stockfish()
+        self.stockfish_path = self._find_stockfish() if enable_stockfish else None
         self.stockfish_process = None
         self.stockfish_strength = 10 # Default, GUI có thể thay đổi
 
@@ -175,10 +1735,11 @@ class ChessAI:
 
     def reset_board(self):
         """Reset the board to starting position"""
+        self._stop_pondering()
         self.board = chess.Board()
-        self.transposition_table = {}
-        self.history_table = {}
-        self.killer_moves = [[None, None] for _ in range(100)]
+        self.transposition_table.clear()
+        self.eval_cache.clear()
+        self._clear_history()
         # Reset Stockfish for a new game if it's running
         if self.stockfish_process:
             self._send_to_stockfish("ucinewgame")
@@ -200,7 +1761,26 @@ class ChessAI:
                     break
                 output_lines.append(line)
 
-    def get_ai_move(self):
+    def _clear_history(self):
+        """Allocate empty move ordering tables (new game)"""
+        self.main_history = array('h', bytes(2 * 2 * 64 * 64)) # [color][from][to] quiet move history
+        self.continuation_history = array('h', bytes(2 * PIECE_TO_SIZE * PIECE_TO_SIZE)) # [previous piece-to][piece-to]
+        self.countermoves = [None] * PIECE_TO_SIZE # Quiet refutation of the previous move, by its piece-to
+        self.killer_moves = [[None, None] for _ in range(MAX_PLY)]
+        self.piece_to_history = [] # Piece-to index of each move on the search stack, -1 for a null move
+        self.history_updated = False
+
+    def _age_history(self):
+        """Halve the history tables in place between searches, so old statistics fade instead of saturating"""
+        self.killer_moves = [[None, None] for _ in range(MAX_PLY)]
+        if not self.history_updated:
+            return
+        _halve_history(self.main_history)
+        _halve_history(self.continuation_history)
+        self.history_updated = False
+
+    def get_ai_move(self, limits=None):
+        """Return the AI's move for the current position; limits (SearchLimits) apply to the internal AI"""
         # Logic for determining which AI to use (Stockfish opponent, Stockfish main AI, or Internal AI)
         if self.use_stockfish_as_opponent and self.board.turn == chess.BLACK:
             print("AI: Getting move from Stockfish (opponent)...")
@@ -210,10 +1790,11 @@ class ChessAI:
                 return self._get_stockfish_move(time_ms=1000)
             else:
                 print("AI: Stockfish opponent not available, internal AI will play for Black (fallback).")
-                return self._get_internal_ai_move() # Internal AI plays
+                return self._get_internal_ai_move(limits) # Internal AI plays
 
         elif self.use_stockfish_for_main_ai:
             print(f"AI: Getting move from Stockfish (main engine, strength {self.stockfish_strength})...")
+            self._stop_pondering()
             if not self.stockfish_process and self.stockfish_path: self._init_stockfish()
             if self.stockfish_process:
                 self._send_to_stockfish(f"setoption name Skill Level value {self.stockfish_strength}")
@@ -226,22 +1807,37 @@ class ChessAI:
                     return move
                 else:
                     print("AI: Stockfish (main engine) failed. Falling back to internal AI.")
-                    return self._get_internal_ai_move()
+                    return self._get_internal_ai_move(limits)
             else:
                 print("AI: Stockfish (main engine) not available. Falling back to internal AI.")
-                return self._get_internal_ai_move()
+                return self._get_internal_ai_move(limits)
         else:
             print("AI: Getting move from Internal AI (Minimax)...")
-            return self._get_internal_ai_move()
+            return self._get_internal_ai_move(limits)
+
+    def _get_internal_ai_move(self, limits=None):
+        # A ponder hit turns the background search into the real one
+        if self._ponder and limits is None:
+            ponder_move = self._finish_pondering()
+            if ponder_move is not None:
+                if self.ponder_enabled:
+                    self._start_pondering(ponder_move)
+                return ponder_move
+        # Any other search (limited ones included) must not share the TT and histories with a ponder thread
+        self._stop_pondering()
 
-    def _get_internal_ai_move(self):
         self.nodes_searched = 0
         self.start_time = time.time()  # Ensure start_time is set for each internal AI move
         self.best_move_found = None
         self.stop_search = False
-
-        # 1. Check Polyglot opening book first for Internal AI
-        if self.opening_book_reader:
+        self.transposition_table.new_search()
+        self._age_history()
+        self._init_search_keys()
+        self.node_limit = limits.nodes if limits and limits.nodes else 0
+        self.time_limited = limits is None or limits.use_time()
+
+        # 1. Check Polyglot opening book first for Internal AI (not for fixed depth/node searches)
+        if self.opening_book_reader and (limits is None or limits.use_time()):
             try:
                 # Use weighted_choice for a more natural selection from book
                 entry = self.opening_book_reader.weighted_choice(self.board)
@@ -265,24 +1861,83 @@ class ChessAI:
         if len(legal_moves) == 1:
             return legal_moves[0]
 
-        if legal_moves:  # Initialize best_move_found to prevent None if search times out early
-            self.best_move_found = legal_moves[0]
-
-        max_depth = self._calculate_adaptive_depth()
+        # Root moves start in move picker order; every root search re-sorts them by score
+        self.root_moves = [RootMove(move) for move in self._move_picker(0, self._get_tt_move())]
+        self.best_move_found = self.root_moves[0].move  # In case the search stops before depth 1 completes
+
+        if limits and limits.depth:
+            max_depth = limits.depth
+        elif limits and limits.mate and not limits.nodes and not limits.use_time():
+            # Mate in N moves lies within 2N - 1 plies; nothing else would end a mate-only search
+            max_depth = min(2 * limits.mate + 2, MAX_PLY // 2)
+        elif limits and (not limits.use_time() or limits.movetime is not None):
+            max_depth = MAX_PLY // 2  # Node, mate or movetime limited: deepen until the limit is hit
+        else:
+            max_depth = self._calculate_adaptive_depth()
         print(f"AI (Internal): Calculated adaptive depth: {max_depth}")
 
-        for current_depth in range(1, max_depth + 1):
+        self._init_time_manager(limits)
+        self.best_move_changes = 0.0
+
+        # Lazy SMP: helper processes search the same root through the shared transposition table
+        helpers = self._start_helpers(max_depth) if self.threads > 1 else None
+        completed_depth, root_score = 0, 0
+        self.target_depth = max_depth
+        self.completed_depth = 0
+        iteration_scores = []
+        iteration_time = previous_iteration_time = 0.0
+        stable_depths = 0
+        previous_best = None
+
+        current_depth = 0
+        while current_depth < MAX_PLY // 2:
+            current_depth += 1
             # print(f"AI (Internal): Starting search at depth {current_depth}") # Optional detailed log
-            self._search_with_iterative_deepening(current_depth)
+            iteration_start = time.time()
+            score = self._search_with_iterative_deepening(current_depth)
+            if not self.stop_search:
+                completed_depth, root_score = current_depth, score
+                self.completed_depth = completed_depth
+                self.root_score = score
+                iteration_scores.append(score)
+                previous_iteration_time, iteration_time = iteration_time, time.time() - iteration_start
+                stable_depths = stable_depths + 1 if self.best_move_found == previous_best else 0
+                previous_best = self.best_move_found
 
-            if self.stop_search or (
-                    time.time() - self.start_time > self.time_limit * 0.95):  # Check time more frequently
-                print(f"AI (Internal): Time limit approaching/reached or search stopped after depth {current_depth}")
+            if self.stop_search:
+                print(f"AI (Internal): Search stopped after depth {current_depth}")
+                break
+            if self.pondering:
+                continue  # Keep deepening until the opponent's move arrives
+            if current_depth >= max_depth:
+                break
+            if limits and limits.mate and score >= MATE_SCORE - 2 * limits.mate:
+                print(f"AI (Internal): Found mate in {limits.mate} or less after depth {current_depth}")
+                break
+            if not self.time_limited or limits and limits.movetime is not None:
+                continue  # No time management: a fixed movetime is used in full
+            older_score = iteration_scores[-4] if len(iteration_scores) >= 4 else None
+            iteration_nodes = sum(root_move.nodes for root_move in self.root_moves)
+            best_move_effort = self.root_moves[0].nodes / max(1, iteration_nodes)
+            if self.time_manager.stop_iterating(time.time() - self.start_time, iteration_time,
+                                                previous_iteration_time, score, older_score,
+                                                self.best_move_changes, stable_depths, best_move_effort):
+                print(f"AI (Internal): Time budget used or next iteration can't finish after depth {current_depth}")
                 break
+            self.best_move_changes /= 2
+
+        if completed_depth:
+            self.time_manager.previous_score = root_score
+
+        if helpers:
+            self.best_move_found = self._stop_helpers(helpers, completed_depth, root_score)
 
         elapsed_time = time.time() - self.start_time
         print(
-            f"AI (Internal): Searched {self.nodes_searched} nodes in {elapsed_time:.2f} seconds to depth {current_depth if 'current_depth' in locals() else 'N/A'}.")
+            f"AI (Internal): Searched {self.nodes_searched} nodes in {elapsed_time:.2f} seconds to depth {current_depth if 'current_depth' in locals() else 'N/A'}, "
+            f"hashfull {self.transposition_table.hashfull()}, pawn hash hits {self.pawn_table.hit_rate():.0%}, "
+            f"eval cache hits {self.eval_cache.hit_rate():.0%}, "
+            f"evals cached/lazy/full {self.eval_tiers[0]}/{self.eval_tiers[1]}/{self.eval_tiers[2]}.")
 
         if self.best_move_found is None and legal_moves:
             print(
@@ -290,8 +1945,123 @@ class ChessAI:
             self.best_move_found = random.choice(legal_moves)
 
         # print(f"AI (Internal): Final best move: {self.best_move_found.uci() if self.best_move_found else 'None'}")
+        if self.ponder_enabled and self.best_move_found:
+            self._start_pondering(self.best_move_found)
         return self.best_move_found
 
+    def _init_time_manager(self, limits=None):
+        """Set the time budgets from the search limits, else the game clock, else time_limit per move"""
+        if limits and limits.time_left is not None:
+            self.time_manager.init(self.time_limit, limits.time_left, limits.increment, limits.moves_to_go,
+                                   self.board.ply())
+        elif limits and limits.movetime is not None:
+            self.time_manager.init(limits.movetime)
+        elif self.clock:
+            time_left, increment, moves_to_go = self.clock
+            self.time_manager.init(self.time_limit, time_left, increment, moves_to_go, self.board.ply())
+        else:
+            self.time_manager.init(self.time_limit)
+
+    def _start_pondering(self, best_move):
+        """Search the expected reply to best_move in a background thread, filling the shared TT"""
+        self._stop_pondering()
+        board = self.board.copy()
+        board.push(best_move)
+        if board.is_game_over():
+            return
+
+        # Expected reply comes from the TT entry of the position after our move
+        tt_entry = self.transposition_table.probe(chess.polyglot.zobrist_hash(board))
+        reply = tt_entry[2] if tt_entry else None
+        if reply is None or not board.is_legal(reply):
+            return
+        board.push(reply)
+
+        helper = self._ponder_ai
+        if helper is None:
+            # Its own tables are replaced by this instance's below, so keep them minimal
+            helper = self._ponder_ai = ChessAI(opening_book_path=None, hash_size_mb=1, enable_stockfish=False,
+                                               eval_cache_mb=1)
+        # Same settings and shared tables; only one of the two instances searches at a time
+        helper.depth = self.depth
+        helper.time_limit = self.time_limit
+        helper.clock = self.clock
+        helper.time_manager.previous_score = self.time_manager.previous_score
+        helper.transposition_table = self.transposition_table
+        helper.eval_cache = self.eval_cache
+        helper.pawn_table = self.pawn_table
+        helper.main_history = self.main_history
+        helper.continuation_history = self.continuation_history
+        helper.countermoves = self.countermoves
+        helper.use_null_move = self.use_null_move
+        helper.use_lmr = self.use_lmr
+        helper.use_reverse_futility = self.use_reverse_futility
+        helper.use_futility = self.use_futility
+        helper.use_late_move_pruning = self.use_late_move_pruning
+        helper.use_delta_pruning = self.use_delta_pruning
+        helper.evaluator = self.evaluator.copy() if self.evaluator else None
+        helper.board = board
+        helper.pondering = True
+        helper.stop_event = threading.Event()
+
+        result = {}
+
+        def ponder():
+            result['move'] = helper._get_internal_ai_move()
+
+        thread = threading.Thread(target=ponder, daemon=True)
+        self.ponder_move = reply
+        self._ponder = (thread, helper, chess.polyglot.zobrist_hash(board), len(board.move_stack), result)
+        print(f"AI (Internal): Pondering on {best_move.uci()} {reply.uci()}")
+        thread.start()
+
+    def _finish_pondering(self):
+        """On a ponder hit, let the ponder search finish on the clock and return its move; else abort it"""
+        thread, helper, expected_key, expected_length, result = self._ponder
+        if (len(self.board.move_stack) != expected_length
+                or chess.polyglot.zobrist_hash(self.board) != expected_key):
+            print("AI (Internal): Ponder miss.")
+            self._stop_pondering()
+            return None
+
+        print("AI (Internal): Ponder hit.")
+        self._ponder = None
+        self.ponder_move = None
+        # The time budget starts now, from the clock as set for this move; the iterations already
+        # done while pondering are kept
+        helper.clock = self.clock
+        helper._init_time_manager()
+        helper.start_time = time.time()
+        helper.pondering = False
+        if helper.target_depth and helper.completed_depth >= helper.target_depth:
+            helper.stop_event.set()  # Already searched as deep as a normal search would
+        thread.join()
+        self.nodes_searched = helper.nodes_searched
+        self.root_score = helper.root_score
+        self.completed_depth = helper.completed_depth
+        self.time_manager.previous_score = helper.time_manager.previous_score
+        self.time_manager.previous_time_reduction = helper.time_manager.previous_time_reduction
+        move = result.get('move')
+        if move is None or not self.board.is_legal(move):
+            return None
+        return move
+
+    def _stop_pondering(self):
+        """Abort any background ponder search; its transposition table entries are kept"""
+        if not self._ponder:
+            return
+        thread, helper = self._ponder[0], self._ponder[1]
+        self._ponder = None
+        self.ponder_move = None
+        helper.stop_event.set()
+        thread.join()
+
+    def set_ponder(self, enabled):
+        """Enable or disable pondering during the opponent's turn"""
+        self.ponder_enabled = enabled
+        if not enabled:
+            self._stop_pondering()
+
     def _check_opening_book(self):
         # Lấy trạng thái bàn cờ dưới dạng chuỗi FEN
         fen = self.board.fen()
@@ -309,6 +2079,7 @@ class ChessAI:
         return None
 
     def __del__(self):
+        self._stop_pondering()
         if self.stockfish_process:
             try:
                 self._send_to_stockfish("quit")
@@ -344,7 +2115,7 @@ class ChessAI:
     def _calculate_adaptive_depth(self):
         """Calculate adaptive search depth based on position complexity"""
         base_depth = self.depth
-        total_pieces = sum(1 for _ in self.board.piece_map())
+        total_pieces = chess.popcount(self.board.occupied)
         if total_pieces <= 10:  # Endgame
             return min(base_depth + 2, 7) # Capped max depth for endgame to 7 for performance
         elif total_pieces <= 20:  # Late middlegame
@@ -353,212 +2124,725 @@ class ChessAI:
             return base_depth # Max depth in opening/early midgame based on self.depth
 
     def _search_with_iterative_deepening(self, depth):
-        alpha = float('-inf')
-        beta = float('inf')
-        # best_score_at_this_depth = float('-inf') # Không cần thiết vì self.best_move_found được cập nhật trực tiếp
-
-        # Aspiration window logic
-        aspiration_window_active = False
-        if depth >= 3 and self.best_move_found:  # Chỉ dùng aspiration nếu đã có best_move từ độ sâu trước
-            prev_eval = self._get_stored_evaluation()  # Lấy eval của thế cờ, không phải của nước đi
-            if prev_eval != float('-inf'):  # Đổi điều kiện từ float('inf') sang float('-inf') cho eval
-                window = 50  # Initial window size
-                current_alpha, current_beta = prev_eval - window, prev_eval + window
-                # print(f"Depth {depth}: Trying aspiration window [{current_alpha}, {current_beta}] based on prev_eval {prev_eval}")
-
-                # Important: self.best_move_found will be updated inside _alpha_beta if a better move is found
-                score = self._alpha_beta(depth, current_alpha, current_beta, 0, True)
-
-                if score <= current_alpha or score >= current_beta:  # Search failed high or low
-                    # print(f"Depth {depth}: Aspiration search failed (score {score}). Re-searching with full window.")
-                    # Reset alpha/beta for full search
-                    alpha = float('-inf')
-                    beta = float('inf')
-                    score = self._alpha_beta(depth, alpha, beta, 0, True)
-                # else:
-                # print(f"Depth {depth}: Aspiration search successful (score {score}).")
-
-                # best_score_at_this_depth = score # Cập nhật điểm số tốt nhất ở độ sâu này
-                aspiration_window_active = True
-
-        if not aspiration_window_active:  # Nếu aspiration không được dùng hoặc thất bại và cần full search
-            score = self._alpha_beta(depth, alpha, beta, 0, True)
-            # best_score_at_this_depth = score
-
-        # self.best_move_found đã được cập nhật trong _alpha_beta(is_root=True)
-        if self.best_move_found:  # Chỉ in nếu tìm được nước đi
-            # print(f"AI (Internal) Depth {depth}: Best move so far = {self.best_move_found.uci()}, Score = {best_score_at_this_depth}")
-            pass  # Ít log hơn
-
-        # self._store_evaluation(best_score_at_this_depth) # Lưu trữ đánh giá của thế cờ
-        # Nên là eval của root node, không phải của move
-        # _alpha_beta nên trả về eval của board
-        # và _store_evaluation nên lưu eval đó với board_hash hiện tại
-
-    def _get_stored_evaluation(self):
-        """Get stored evaluation for current position"""
-        board_hash = hash(self.board._transposition_key())
-        if board_hash in self.transposition_table:
-            return self.transposition_table[board_hash][1]
-        return float('inf')
-
-    def _store_evaluation(self, score):
-        """Store evaluation for aspiration window"""
-        board_hash = hash(self.board._transposition_key())
-        if board_hash not in self.transposition_table:
-            self.transposition_table[board_hash] = (0, score)
-
-    def _order_moves(self, moves, depth):
-        """Enhanced move ordering for better alpha-beta efficiency"""
-        scored_moves = []
-        tt_move = self._get_tt_move()
-
-        for move in moves:
-            score = 0
-
-            # 1. Prioritize transposition table move
-            if tt_move and move == tt_move:
-                score += 10000
-
-            # 2. Prioritize captures by MVV-LVA (Most Valuable Victim - Least Valuable Aggressor)
-            if self.board.is_capture(move):
-                victim_square = move.to_square
-                victim_piece = self.board.piece_at(victim_square)
-
-                # Handle en passant captures
-                if self.board.is_en_passant(move):
-                    score += 10 * PAWN_VALUE
-                elif victim_piece:
-                    aggressor_piece = self.board.piece_at(move.from_square)
-                    score += 10 * self.piece_values[victim_piece.piece_type] - self.piece_values[
-                        aggressor_piece.piece_type]
-
-            # 3. Prioritize promotions
-            if move.promotion:
-                score += 900 if move.promotion == chess.QUEEN else 500
+        """One iteration: a root search inside an aspiration window around the previous iteration's score.
+
+        On a fail low or fail high the window widens gradually on the failing side
+        (as in Stockfish's search loop) rather than jumping to a full-width search.
+        """
+        previous_score = self.root_score
+        if (depth < ASPIRATION_MIN_DEPTH or not self.completed_depth
+                or abs(previous_score) >= MATE_SCORE - MAX_PLY):
+            return self._search_root(depth, float('-inf'), float('inf'))
+
+        delta = ASPIRATION_DELTA
+        alpha, beta = previous_score - delta, previous_score + delta
+        while True:
+            score = self._search_root(depth, alpha, beta)
+            if self.stop_search:
+                return score
+            if score <= alpha:
+                # Fail low: lower alpha and pull beta in towards it
+                beta = (alpha + beta) // 2
+                alpha = score - delta if delta <= ASPIRATION_MAX_DELTA else float('-inf')
+            elif score >= beta:
+                beta = score + delta if delta <= ASPIRATION_MAX_DELTA else float('inf')
+            else:
+                return score
+            delta += delta // 2
+
+    def _search_root(self, depth, alpha, beta):
+        """Search the root moves in order with PVS, recording each move's score and subtree node count.
+
+        The best move becomes best_move_found only when it beats alpha, so a failing
+        aspiration search keeps the previous best. Afterwards the best move goes to the
+        front of root_moves and the rest are sorted by score; the sort is stable, so moves
+        failing low keep their order from the previous iteration.
+        """
+        if self._check_stop():
+            return 0
+        self.nodes_searched += 1
+        board = self.position
+        in_check = board.is_check()
+        killers = self.killer_moves[0]
+        alpha_orig = alpha
+        best_score = float('-inf')
+        best_root_move = None
+        quiets_tried = []
+        for root_move in self.root_moves:
+            root_move.score = float('-inf')
+            root_move.nodes = 0
+
+        for i, root_move in enumerate(self.root_moves):
+            move = root_move.move
+            is_quiet = not move.promotion and not board.is_capture(move)
+            nodes_before = self.nodes_searched
+            self._make_move(move)
+            if is_quiet:
+                quiets_tried.append(move)
+            if i == 0:
+                score = -self._alpha_beta(depth - 1, -beta, -alpha, 1)
+            else:
+                # Late move reductions, as in _alpha_beta at a PV node
+                reduction = 0
+                if (self.use_lmr and is_quiet and depth >= LMR_MIN_DEPTH and i >= LMR_MIN_MOVE_INDEX
+                        and not in_check and not board.is_check()):
+                    reduction = max(0, min(LMR_REDUCTIONS[depth][min(i, 63)] - 1, depth - 2))
+                score = -self._alpha_beta(depth - 1 - reduction, -alpha - 1, -alpha, 1)
+                if reduction and score > alpha:
+                    score = -self._alpha_beta(depth - 1, -alpha - 1, -alpha, 1)
+                if alpha < score < beta:
+                    score = -self._alpha_beta(depth - 1, -beta, -alpha, 1)
+            self._unmake_move()
 
-            # 4. Killer move heuristic (quiet moves that cause beta cutoffs)
-            if self.killer_moves[depth][0] == move:
-                score += 80
-            elif self.killer_moves[depth][1] == move:
-                score += 70
+            if self.stop_search:
+                return 0
 
-            # 5. History heuristic (moves that have been good in the past)
-            if str(move) in self.history_table:
-                score += min(self.history_table[str(move)], 60)  # Cap to avoid overriding captures
+            root_move.nodes = self.nodes_searched - nodes_before
+            best_score = max(best_score, score)
+            if i == 0 or score > alpha:
+                root_move.score = score
+            if score > alpha:
+                if i > 0:
+                    self.best_move_changes += 1
+                best_root_move = root_move
+                self.best_move_found = move
+                alpha = score
+                if alpha >= beta:
+                    if is_quiet:
+                        if killers[0] != move:
+                            killers[1] = killers[0]
+                            killers[0] = move
+                        self._update_quiet_stats(move, quiets_tried, depth)
+                    break
 
-            # 6. Prioritize checks
-            self.board.push(move)
-            if self.board.is_check():
-                score += 50
-            self.board.pop()
+        self.root_moves.sort(key=lambda root_move: (root_move is not best_root_move, -root_move.score))
+        tt_flag = BOUND_EXACT
+        if best_score <= alpha_orig:
+            tt_flag = BOUND_UPPER
+        elif best_score >= beta:
+            tt_flag = BOUND_LOWER
+        self.transposition_table.store(self._position_key(), depth, best_score, self.root_moves[0].move, tt_flag)
+        return best_score
 
-            # 7. Prioritize castling
-            if self.board.is_castling(move):
-                score += 60
+    def _start_helpers(self, max_depth):
+        """Launch threads - 1 Lazy SMP helper processes on the current root"""
+        context = multiprocessing.get_context()
+        stop_event = context.Event()
+        result_queue = context.Queue()
+        remaining_time = max(0.1, self.time_limit - (time.time() - self.start_time))
+        processes = []
+        for worker_id in range(1, self.threads):
+            process = context.Process(
+                target=_lazy_smp_worker,
+                args=(worker_id, self.board.copy(), max_depth, remaining_time, self.transposition_table.name,
+                      self.transposition_table.size_mb, self.transposition_table.generation8,
+                      stop_event, result_queue, self.evaluator),
+                daemon=True)
+            process.start()
+            processes.append(process)
+        return processes, stop_event, result_queue
+
+    def _stop_helpers(self, helpers, main_depth, main_score):
+        """Stop the helper processes and pick the best move by depth-weighted voting"""
+        processes, stop_event, result_queue = helpers
+        stop_event.set()
+
+        results = {0: (main_depth, main_score, self.best_move_found)}
+        finished = 0
+        while finished < len(processes):
+            try:
+                worker_id, depth, score, move_uci, nodes = result_queue.get(timeout=2)
+            except Exception:
+                print("AI (Internal): Lazy SMP helper did not report back in time.")
+                break
+            if depth is None:
+                finished += 1
+                self.nodes_searched += nodes
+            else:
+                results[worker_id] = (depth, score, chess.Move.from_uci(move_uci))
+
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+        # Vote for moves weighted by score and depth, as Stockfish picks its best thread
+        results = {k: v for k, v in results.items() if v[2] is not None and v[0] > 0}
+        if not results:
+            return self.best_move_found
+        min_score = min(score for _, score, _ in results.values())
+        votes = {}
+        for depth, score, move in results.values():
+            votes[move] = votes.get(move, 0) + (score - min_score + 14) * depth
+        best_depth, _, best_move = max(results.values(), key=lambda r: (votes[r[2]], r[0]))
+        print(f"AI (Internal): Lazy SMP picked {best_move.uci()} from {len(results)} searches "
+              f"(deepest {max(r[0] for r in results.values())}, best move depth {best_depth}).")
+        return best_move
+
+    def _helper_search(self, worker_id, max_depth, result_queue):
+        """Iterative deepening for a Lazy SMP helper; odd helpers stay one ply ahead of the main search.
+
+        Each iteration goes through the same root search and aspiration windows as the
+        main search, so helpers share its move ordering and window behaviour.
+        """
+        self.nodes_searched = 0
+        self.start_time = time.time()
+        self.time_manager.init(self.time_limit)
+        self.stop_search = False
+        self._init_search_keys()
+        self.root_moves = [RootMove(move) for move in self._move_picker(0, self._get_tt_move())]
+        self.best_move_found = self.root_moves[0].move if self.root_moves else None
+        self.completed_depth = 0
+        self.root_score = 0
+        self.best_move_changes = 0.0
+
+        skip = worker_id % 2
+        for current_depth in range(1 + skip, max_depth + 1 + skip):
+            if self.best_move_found is None:
+                break
+            score = self._search_with_iterative_deepening(current_depth)
+            if self.stop_search:
+                break
+            self.completed_depth, self.root_score = current_depth, score
+            result_queue.put((worker_id, current_depth, score, self.best_move_found.uci(), self.nodes_searched))
+        result_queue.put((worker_id, None, None, None, self.nodes_searched))
 
-            # 8. Piece development in opening
-            if self._is_opening():
+    def _check_stop(self):
+        """Enforce the node limit exactly; poll the clock and any external stop request every 256 nodes"""
+        if self.node_limit and self.nodes_searched >= self.node_limit:
+            self.stop_search = True
+        elif self.nodes_searched & 255 == 0:
+            if ((self.time_limited and not self.pondering
+                 and time.time() - self.start_time > self.time_manager.maximum_time)
+                    or (self.stop_event is not None and self.stop_event.is_set())):
+                self.stop_search = True
+        return self.stop_search
+
+    def _move_picker(self, ply, tt_move=None, captures_only=False):
+        """Staged lazy move generator (see Stockfish movepick.cpp).
+
+        Stages: TT move, good captures and queen promotions, killers, quiet moves
+        ordered by history, bad captures. Each stage is generated and scored only
+        when the search asks for more moves, so cut nodes skip most of the work.
+        With captures_only (quiescence), captures losing material by SEE are skipped.
+        """
+        board = self.position
+        us = board.turn
+
+        # 1. Transposition table move
+        if tt_move and not captures_only and board.is_legal(tt_move):
+            yield tt_move
+        else:
+            tt_move = None
+
+        # 2. Captures by MVV-LVA (Most Valuable Victim - Least Valuable Aggressor), plus queen promotions
+        captures = list(board.generate_legal_captures())
+        promotion_rank = chess.BB_RANK_7 if us == chess.WHITE else chess.BB_RANK_2
+        if board.pawns & board.occupied_co[us] & promotion_rank:
+            for move in board.generate_legal_moves(board.pawns & promotion_rank, ~board.occupied):
+                if move.promotion == chess.QUEEN:
+                    captures.append(move)
+
+        scored_captures = []
+        bad_captures = []
+        for move in captures:
+            if move == tt_move:
+                continue
+            aggressor_value = self.piece_values[board.piece_type_at(move.from_square)]
+            victim_type = board.piece_type_at(move.to_square)
+            if victim_type is None:
+                # En passant or quiet promotion
+                victim_value = PAWN_VALUE if board.is_en_passant(move) else 0
+            else:
+                victim_value = self.piece_values[victim_type]
+            score = 10 * victim_value - aggressor_value
+            if move.promotion:
+                score += 900 if move.promotion == chess.QUEEN else 500
+            # Captures that lose material by SEE are tried after quiet moves
+            if not self._see_ge(move):
+                if not captures_only:
+                    bad_captures.append((score, move))
+            else:
+                scored_captures.append((score, move))
+
+        scored_captures.sort(key=lambda x: x[0], reverse=True)
+        for _, move in scored_captures:
+            yield move
+
+        if not captures_only:
+            # 3. Killer moves (quiet moves that caused beta cutoffs at this ply), then the countermove
+            # Only the killers yielded here are skipped by the quiet stage
+            killers = [killer for killer in self.killer_moves[ply]
+                       if (killer and killer != tt_move and not killer.promotion
+                           and not board.is_capture(killer) and board.is_legal(killer))]
+            for killer in killers:
+                yield killer
+
+            piece_to_history = self.piece_to_history
+            previous = piece_to_history[-1] if piece_to_history else -1
+            counter = self.countermoves[previous] if previous >= 0 else None
+            if (counter and counter != tt_move and counter not in killers and not counter.promotion
+                    and not board.is_capture(counter) and board.is_legal(counter)):
+                yield counter
+            else:
+                counter = None
+
+            # 4. Quiet moves ordered by history and simple positional hints
+            main_history = self.main_history
+            continuation_history = self.continuation_history
+            color_offset = us << 12
+            # Continuation history rows of the moves one and two plies back (negative after a null move or at the root)
+            continuation_1 = previous * PIECE_TO_SIZE
+            continuation_2 = (piece_to_history[-2] * PIECE_TO_SIZE
+                              if len(piece_to_history) >= 2 else -1)
+            is_opening = self._is_opening()
+            scored_quiets = []
+            for move in board.generate_legal_moves(chess.BB_ALL, ~board.occupied_co[not us]):
+                if (move == tt_move or move in killers or move == counter or move.promotion == chess.QUEEN
+                        or board.is_en_passant(move)):
+                    continue
                 from_square = move.from_square
-                piece = self.board.piece_at(from_square)
-                if piece and piece.piece_type in [chess.KNIGHT, chess.BISHOP] and chess.square_rank(from_square) in [0,
-                                                                                                                     7]:
-                    score += 30  # Develop minor pieces
+                to_square = move.to_square
+                piece_to = _piece_to(board.piece_type_at(from_square), us, to_square)
+
+                # History heuristics: this move in general, and as a follow-up to the previous two moves
+                history = main_history[color_offset | from_square << 6 | to_square]
+                if continuation_1 >= 0:
+                    history += continuation_history[continuation_1 + piece_to]
+                if continuation_2 >= 0:
+                    history += continuation_history[continuation_2 + piece_to]
+                score = history // QUIET_HISTORY_DIVISOR
+
+                if move.promotion:
+                    score += 500
+
+                # Prioritize checks
+                if board.gives_check(move):
+                    score += 50
+
+                # Prioritize castling
+                if board.is_castling(move):
+                    score += 60
+
+                # Piece development in opening
+                if is_opening:
+                    piece_type = board.piece_type_at(move.from_square)
+                    if piece_type in (chess.KNIGHT, chess.BISHOP) and chess.square_rank(move.from_square) in (0, 7):
+                        score += 30  # Develop minor pieces
+                    elif piece_type == chess.PAWN:
+                        to_file = chess.square_file(move.to_square)
+                        to_rank = chess.square_rank(move.to_square)
+                        if to_file in (3, 4) and to_rank in (3, 4):
+                            score += 25  # Control center with pawns
+
+                scored_quiets.append((score, move))
+
+            scored_quiets.sort(key=lambda x: x[0], reverse=True)
+            for _, move in scored_quiets:
+                yield move
+
+        # 5. Bad captures
+        bad_captures.sort(key=lambda x: x[0], reverse=True)
+        for _, move in bad_captures:
+            yield move
+
+    def _see_ge(self, move, threshold=0):
+        """Static Exchange Evaluation: True if the exchange on the target square wins at least threshold.
+
+        Bitboard swap algorithm as in Stockfish's Position::see_ge, revealing
+        sliding x-ray attackers as pieces leave the square's lines.
+        """
+        board = self.position
+        # En passant and promotions are treated as even exchanges
+        if move.promotion or board.is_en_passant(move) or board.is_castling(move):
+            return threshold <= 0
+
+        from_square = move.from_square
+        to_square = move.to_square
+        piece_values = self.piece_values
+
+        victim_type = board.piece_type_at(to_square)
+        swap = (piece_values[victim_type] if victim_type else 0) - threshold
+        if swap < 0:
+            return False
 
-                # Control center with pawns
-                if piece and piece.piece_type == chess.PAWN:
-                    to_square = move.to_square
-                    to_file = chess.square_file(to_square)
-                    to_rank = chess.square_rank(to_square)
+        swap = piece_values[board.piece_type_at(from_square)] - swap
+        if swap <= 0:
+            return True
 
-                    # Center control
-                    if (to_file in [3, 4] and to_rank in [3, 4]):
-                        score += 25
+        occupied = board.occupied ^ chess.BB_SQUARES[from_square] ^ chess.BB_SQUARES[to_square]
+        side = board.turn
+        attackers = _attackers_to(board, to_square, occupied)
+        diagonal_sliders = board.bishops | board.queens
+        straight_sliders = board.rooks | board.queens
+        result = 1
 
-            scored_moves.append((move, score))
+        while True:
+            side = not side
+            attackers &= occupied
+            side_attackers = attackers & board.occupied_co[side]
+            if not side_attackers:
+                break
+            result ^= 1
+
+            # Capture with the least valuable attacker, then add x-ray attackers behind it
+            if side_attackers & board.pawns:
+                swap = PAWN_VALUE - swap
+                if swap < result:
+                    break
+                occupied ^= chess.BB_SQUARES[chess.lsb(side_attackers & board.pawns)]
+                attackers |= chess.BB_DIAG_ATTACKS[to_square][chess.BB_DIAG_MASKS[to_square] & occupied] & diagonal_sliders
+            elif side_attackers & board.knights:
+                swap = KNIGHT_VALUE - swap
+                if swap < result:
+                    break
+                occupied ^= chess.BB_SQUARES[chess.lsb(side_attackers & board.knights)]
+            elif side_attackers & board.bishops:
+                swap = BISHOP_VALUE - swap
+                if swap < result:
+                    break
+                occupied ^= chess.BB_SQUARES[chess.lsb(side_attackers & board.bishops)]
+                attackers |= chess.BB_DIAG_ATTACKS[to_square][chess.BB_DIAG_MASKS[to_square] & occupied] & diagonal_sliders
+            elif side_attackers & board.rooks:
+                swap = ROOK_VALUE - swap
+                if swap < result:
+                    break
+                occupied ^= chess.BB_SQUARES[chess.lsb(side_attackers & board.rooks)]
+                attackers |= (chess.BB_RANK_ATTACKS[to_square][chess.BB_RANK_MASKS[to_square] & occupied]
+                              | chess.BB_FILE_ATTACKS[to_square][chess.BB_FILE_MASKS[to_square] & occupied]) & straight_sliders
+            elif side_attackers & board.queens:
+                swap = QUEEN_VALUE - swap
+                if swap < result:
+                    break
+                occupied ^= chess.BB_SQUARES[chess.lsb(side_attackers & board.queens)]
+                attackers |= chess.BB_DIAG_ATTACKS[to_square][chess.BB_DIAG_MASKS[to_square] & occupied] & diagonal_sliders
+                attackers |= (chess.BB_RANK_ATTACKS[to_square][chess.BB_RANK_MASKS[to_square] & occupied]
+                              | chess.BB_FILE_ATTACKS[to_square][chess.BB_FILE_MASKS[to_square] & occupied]) & straight_sliders
+            else:
+                # King capture: only legal if the opponent has no attackers left
+                if attackers & ~board.occupied_co[side]:
+                    return bool(result ^ 1)
+                return bool(result)
 
-        # Sort moves by score in descending order
-        scored_moves.sort(key=lambda x: x[1], reverse=True)
-        return [move for move, _ in scored_moves]
+        return bool(result)
 
     def _get_tt_move(self):
         """Get the best move from transposition table"""
-        board_hash = hash(self.board._transposition_key())
-        if board_hash in self.transposition_table and len(self.transposition_table[board_hash]) > 2:
-            return self.transposition_table[board_hash][2]  # Return the stored best move
+        tt_entry = self.transposition_table.probe(self._position_key())
+        if tt_entry:
+            return tt_entry[2]  # Return the stored best move
         return None
 
+    def _position_key(self):
+        """64-bit key of the current position for transposition table lookups"""
+        return self.zobrist_key
+
+    def _compute_pawn_key(self):
+        """Zobrist key of the pawns of self.position, from scratch"""
+        board = self.position
+        key = 0
+        for color in chess.COLORS:
+            for square in chess.scan_forward(board.pawns & board.occupied_co[color]):
+                key ^= _zobrist_piece(chess.PAWN, color, square)
+        return key
+
+    def _compute_psq(self):
+        """Material/PST accumulators and game phase of self.position, from scratch"""
+        mg = eg = phase = 0
+        for square, piece in self.position.piece_map().items():
+            mg += PSQ_MG[piece.piece_type][piece.color][square]
+            eg += PSQ_EG[piece.piece_type][piece.color][square]
+            phase += PHASE_WEIGHTS[piece.piece_type]
+        return mg, eg, phase
+
+    def _init_psq(self):
+        """Build the search Position from self.board and compute its material/PST accumulators, phase and pawn key"""
+        self.position = Position(self.board)
+        self.psq_mg, self.psq_eg, self.phase = self._compute_psq()
+        self.pawn_key = self._compute_pawn_key()
+        self.eval_history = []
+        if self.evaluator is not None:
+            self.evaluator.reset(self.position)
+
+    def _init_search_keys(self):
+        """Compute the root Zobrist key, the key history back to the last irreversible move and the PST accumulators"""
+        self._init_psq()
+        self.zobrist_key = chess.polyglot.zobrist_hash(self.board)
+        self.key_history = []
+        self.null_history = []
+        history_board = self.board.copy()
+        for _ in range(min(self.board.halfmove_clock, len(self.board.move_stack))):
+            history_board.pop()
+            self.key_history.append(chess.polyglot.zobrist_hash(history_board))
+        self.key_history.reverse()
+        # The opponent's last move, for countermoves and continuation history at the root
+        self.piece_to_history = []
+        if self.board.move_stack and self.board.move_stack[-1]:
+            last_move = self.board.move_stack[-1]
+            self.piece_to_history.append(_piece_to(self.board.piece_type_at(last_move.to_square),
+                                                   not self.board.turn, last_move.to_square))
+
+    def _make_move(self, move):
+        """Push a move on the search board, updating the Zobrist key incrementally"""
+        board = self.position
+        key = self.zobrist_key
+        self.key_history.append(key)
+        mg = self.psq_mg
+        eg = self.psq_eg
+        pawn_key = self.pawn_key
+        phase = self.phase
+        self.eval_history.append((mg, eg, pawn_key, phase))
+
+        us = board.turn
+        them = not us
+        from_square = move.from_square
+        to_square = move.to_square
+        piece_type = board.piece_type_at(from_square)
+        new_type = move.promotion or piece_type
+        self.piece_to_history.append(_piece_to(piece_type, us, to_square))
+
+        key ^= _zobrist_piece(piece_type, us, from_square)
+        key ^= _zobrist_piece(new_type, us, to_square)
+        mg += PSQ_MG[new_type][us][to_square] - PSQ_MG[piece_type][us][from_square]
+        eg += PSQ_EG[new_type][us][to_square] - PSQ_EG[piece_type][us][from_square]
+        if piece_type == chess.PAWN:
+            pawn_key ^= _zobrist_piece(chess.PAWN, us, from_square)
+            if move.promotion:
+                phase += PHASE_WEIGHTS[move.promotion]
+            else:
+                pawn_key ^= _zobrist_piece(chess.PAWN, us, to_square)
+
+        if piece_type == chess.PAWN and to_square == board.ep_square:
+            captured_square = to_square - 8 if us == chess.WHITE else to_square + 8
+            key ^= _zobrist_piece(chess.PAWN, them, captured_square)
+            pawn_key ^= _zobrist_piece(chess.PAWN, them, captured_square)
+            mg -= PSQ_MG[chess.PAWN][them][captured_square]
+            eg -= PSQ_EG[chess.PAWN][them][captured_square]
+        else:
+            captured_type = board.piece_type_at(to_square)
+            if captured_type:
+                key ^= _zobrist_piece(captured_type, them, to_square)
+                if captured_type == chess.PAWN:
+                    pawn_key ^= _zobrist_piece(chess.PAWN, them, to_square)
+                else:
+                    phase -= PHASE_WEIGHTS[captured_type]
+                mg -= PSQ_MG[captured_type][them][to_square]
+                eg -= PSQ_EG[captured_type][them][to_square]
+
+        if piece_type == chess.KING and abs(to_square - from_square) == 2:
+            if to_square > from_square:  # King-side: rook h-file -> f-file
+                rook_from, rook_to = to_square + 1, to_square - 1
+            else:  # Queen-side: rook a-file -> d-file
+                rook_from, rook_to = to_square - 2, to_square + 1
+            key ^= _zobrist_piece(chess.ROOK, us, rook_from) ^ _zobrist_piece(chess.ROOK, us, rook_to)
+            mg += PSQ_MG[chess.ROOK][us][rook_to] - PSQ_MG[chess.ROOK][us][rook_from]
+            eg += PSQ_EG[chess.ROOK][us][rook_to] - PSQ_EG[chess.ROOK][us][rook_from]
+        self.psq_mg = mg
+        self.psq_eg = eg
+        self.pawn_key = pawn_key
+        self.phase = phase
+
+        if board.castling_rights:
+            key ^= _zobrist_castling(board)
+        if board.ep_square is not None:
+            key ^= _zobrist_ep(board)
+
+        if self.evaluator is not None:
+            self.evaluator.push(board, move)
+        board.push(move)
+
+        if board.castling_rights:
+            key ^= _zobrist_castling(board)
+        if board.ep_square is not None:
+            key ^= _zobrist_ep(board)
+        self.zobrist_key = key ^ ZOBRIST_TURN
+
+    def _make_null_move(self):
+        """Pass the turn (null move) on the search board, updating the Zobrist key"""
+        board = self.position
+        key = self.zobrist_key
+        self.key_history.append(key)
+        self.eval_history.append((self.psq_mg, self.psq_eg, self.pawn_key, self.phase))
+        self.piece_to_history.append(-1)
+        if board.ep_square is not None:
+            key ^= _zobrist_ep(board)
+        if self.evaluator is not None:
+            self.evaluator.push_null()
+        board.push_null()
+        self.zobrist_key = key ^ ZOBRIST_TURN
+        self.null_history.append(len(self.key_history))
+
+    def _unmake_move(self):
+        """Pop the last move from the search board and restore its Zobrist key"""
+        self.position.pop()
+        self.zobrist_key = self.key_history.pop()
+        self.psq_mg, self.psq_eg, self.pawn_key, self.phase = self.eval_history.pop()
+        self.piece_to_history.pop()
+        if self.evaluator is not None:
+            self.evaluator.pop()
+        if self.null_history and self.null_history[-1] > len(self.key_history):
+            self.null_history.pop()
+
+    def _is_repetition(self):
+        """True if the current position occurred before, looking back only to the last irreversible move.
+
+        Positions before a null move on the search stack are not real repetitions,
+        so the scan also stops there (Stockfish's pliesFromNull).
+        """
+        key = self.zobrist_key
+        history = self.key_history
+        end = len(history) - min(self.position.halfmove_clock, len(history))
+        if self.null_history:
+            end = max(end, self.null_history[-1])
+        # Only positions with the same side to move, at least 4 plies back, can repeat
+        for i in range(len(history) - 4, end - 1, -2):
+            if history[i] == key:
+                return True
+        return False
+
+    def _is_insufficient_material(self):
+        """Cheap insufficient-material test: any pawn, rook or queen rules it out without further work"""
+        board = self.position
+        if board.pawns | board.rooks | board.queens:
+            return False
+        return board.is_insufficient_material()
+
+    def _is_draw(self, in_check):
+        """Fifty-move rule, repetition or insufficient material, without generating the move list"""
+        board = self.position
+        if board.halfmove_clock >= 100:
+            # Checkmate on the hundredth half-move takes precedence over the fifty-move rule
+            if not in_check or any(board.generate_legal_moves()):
+                return True
+        return self._is_repetition() or self._is_insufficient_material()
+
     def _is_opening(self):
         """Check if the game is in opening phase"""
         # Simple check based on move number and pieces developed
-        return self.board.fullmove_number < 10 and len(self.board.piece_map()) >= 28
+        return self.position.fullmove_number < 10 and chess.popcount(self.position.occupied) >= 28
+
+    def _alpha_beta(self, depth, alpha, beta, ply, is_root=False, allow_null=True):
+        """Enhanced alpha-beta pruning with PVS (Principal Variation Search)
 
-    def _alpha_beta(self, depth, alpha, beta, ply, is_root=False):
-        """Enhanced alpha-beta pruning with PVS (Principal Variation Search)"""
+        Non-PV nodes use null-move pruning, reverse futility pruning, futility
+        pruning, late-move pruning and late-move reductions; each can be
+        switched off with the use_* flags.
+        """
+        # Check time periodically, before counting the node so a node limit is never exceeded
+        if self._check_stop():
+            return 0
         self.nodes_searched += 1
 
-        # Check time periodically
-        if self.nodes_searched % 1000 == 0 and time.time() - self.start_time > self.time_limit * 0.8:
-            self.stop_search = True
+        # Draws are detected from counters and the key history; mate and stalemate
+        # fall out of the move loop below when no legal move is found
+        in_check = self.position.is_check()
+        if not is_root and self._is_draw(in_check):
             return 0
 
         # Check transposition table
-        board_hash = hash(self.board._transposition_key())
+        board_hash = self._position_key()
         alpha_orig = alpha
 
-        if board_hash in self.transposition_table and self.transposition_table[board_hash][0] >= depth:
-            tt_entry = self.transposition_table[board_hash]
+        tt_entry = self.transposition_table.probe(board_hash, ply)
+        # No cutoffs at the root, where we always need a best move
+        if tt_entry and tt_entry[0] >= depth and not is_root:
             tt_value = tt_entry[1]
-            tt_flag = tt_entry[3] if len(tt_entry) > 3 else None
+            tt_flag = tt_entry[3]
 
-            if tt_flag == 'EXACT':
+            if tt_flag == BOUND_EXACT:
                 return tt_value
-            elif tt_flag == 'LOWERBOUND':
+            elif tt_flag == BOUND_LOWER:
                 alpha = max(alpha, tt_value)
-            elif tt_flag == 'UPPERBOUND':
+            elif tt_flag == BOUND_UPPER:
                 beta = min(beta, tt_value)
 
             if alpha >= beta:
                 return tt_value
 
-        # Check terminal states
-        if self.board.is_checkmate():
-            return -10000 + ply if self.board.turn else 10000 - ply  # Prefer faster checkmate
-        if self.board.is_stalemate() or self.board.is_insufficient_material() or self.board.is_fifty_moves():
-            return 0
-
         # Quiescence search at leaf nodes to handle horizon effect
         if depth <= 0:
-            return self._quiescence_search(alpha, beta)
-
-        # Check for draw by repetition
-        if self.board.is_repetition(2):  # 2-fold repetition
-            return 0
-
-        # Generate and order moves
-        moves = self._order_moves(list(self.board.legal_moves), ply)
-
-        if not moves:
-            return 0  # No legal moves, but not checkmate or stalemate (should never happen)
+            return self._quiescence_search(alpha, beta, ply=ply)
+
+        is_pv = beta - alpha > 1
+        static_eval = None
+        if not is_pv and not in_check and not is_root:
+            static_eval = self._evaluate_position()
+
+            # Reverse futility pruning: far enough above beta that a quiet search won't drop below it
+            if (self.use_reverse_futility and depth <= REVERSE_FUTILITY_MAX_DEPTH
+                    and static_eval - REVERSE_FUTILITY_MARGIN * depth >= beta
+                    and abs(beta) < MATE_SCORE - MAX_PLY):
+                return static_eval
+
+            # Null-move pruning, skipped when we only have king and pawns (zugzwang danger)
+            us = self.position.turn
+            if (self.use_null_move and allow_null and depth >= NULL_MOVE_MIN_DEPTH and static_eval >= beta
+                    and self.position.occupied_co[us] & ~(self.position.pawns | self.position.kings)):
+                reduction = 2 + depth // 4
+                self._make_null_move()
+                null_score = -self._alpha_beta(depth - 1 - reduction, -beta, -beta + 1, ply + 1, allow_null=False)
+                self._unmake_move()
+                if self.stop_search:
+                    return 0
+                if null_score >= beta:
+                    # Don't return unproven mate scores
+                    return beta if null_score >= MATE_SCORE - MAX_PLY else null_score
+
+        # Futility pruning: quiet moves can't raise a hopeless static eval above alpha
+        futility_pruning = (self.use_futility and static_eval is not None and depth < len(FUTILITY_MARGINS)
+                            and static_eval + FUTILITY_MARGINS[depth] <= alpha)
+        late_move_pruning = (self.use_late_move_pruning and static_eval is not None
+                             and depth < len(LATE_MOVE_PRUNING_COUNTS))
+
+        # Moves are generated lazily, stage by stage
+        tt_move = tt_entry[2] if tt_entry else None
+        moves = self._move_picker(ply, tt_move)
+        killers = self.killer_moves[ply]
 
         best_score = float('-inf')
         best_move = None
+        quiets_searched = 0
+        quiets_tried = []
 
         # Principal Variation Search
         for i, move in enumerate(moves):
-            self.board.push(move)
+            is_quiet = not move.promotion and not self.position.is_capture(move)
+
+            # Prune late quiet moves once we have a non-losing score to fall back on
+            if is_quiet and best_move is not None and best_score > -MATE_SCORE + MAX_PLY:
+                if ((futility_pruning
+                     or (late_move_pruning and quiets_searched >= LATE_MOVE_PRUNING_COUNTS[depth]))
+                        and not self.position.gives_check(move)):
+                    continue
+
+            self._make_move(move)
+            if is_quiet:
+                quiets_searched += 1
+                quiets_tried.append(move)
 
             # First move is searched with full window
             if i == 0:
                 score = -self._alpha_beta(depth - 1, -beta, -alpha, ply + 1)
             else:
+                # Late move reductions for quiet moves that don't give or evade check
+                reduction = 0
+                if (self.use_lmr and is_quiet and depth >= LMR_MIN_DEPTH and i >= LMR_MIN_MOVE_INDEX
+                        and not in_check and not self.position.is_check()):
+                    reduction = LMR_REDUCTIONS[depth][min(i, 63)]
+                    if is_pv or move in killers:
+                        reduction -= 1
+                    reduction = max(0, min(reduction, depth - 2))
+
                 # Search with null window to prove this move is worse
-                score = -self._alpha_beta(depth - 1, -alpha - 1, -alpha, ply + 1)
+                score = -self._alpha_beta(depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+                # A reduced search that beats alpha is verified at full depth
+                if reduction and score > alpha:
+                    score = -self._alpha_beta(depth - 1, -alpha - 1, -alpha, ply + 1)
                 # If the move might be better than our current best, do a full search
                 if alpha < score < beta:
                     score = -self._alpha_beta(depth - 1, -beta, -alpha, ply + 1)
 
-            self.board.pop()
+            self._unmake_move()
 
             if self.stop_search:
                 return 0
@@ -568,49 +2852,105 @@ class ChessAI:
                 best_move = move
 
                 if is_root:
+                    if i > 0:
+                        self.best_move_changes += 1
                     self.best_move_found = move
 
             alpha = max(alpha, score)
             if alpha >= beta:
-                # Update killer moves (non-captures that cause cutoffs)
-                if not self.board.is_capture(move):
+                # Update killer moves (quiet moves that cause cutoffs; promotions are never killers,
+                # the picker only tries killers that aren't)
+                if is_quiet:
                     if self.killer_moves[ply][0] != move:
                         self.killer_moves[ply][1] = self.killer_moves[ply][0]
                         self.killer_moves[ply][0] = move
 
-                # Update history table
-                if str(move) not in self.history_table:
-                    self.history_table[str(move)] = 0
-                self.history_table[str(move)] += depth * depth
+                    self._update_quiet_stats(move, quiets_tried, depth)
 
                 break  # Beta cutoff
 
+        if best_move is None:
+            # No legal moves: checkmate (prefer faster mates) or stalemate
+            return -MATE_SCORE + ply if in_check else 0
+
         # Store result in transposition table
-        tt_flag = 'EXACT'
+        tt_flag = BOUND_EXACT
         if best_score <= alpha_orig:
-            tt_flag = 'UPPERBOUND'
+            tt_flag = BOUND_UPPER
         elif best_score >= beta:
-            tt_flag = 'LOWERBOUND'
+            tt_flag = BOUND_LOWER
 
-        self.transposition_table[board_hash] = (depth, best_score, best_move, tt_flag)
+        self.transposition_table.store(board_hash, depth, best_score, best_move, tt_flag, ply)
         return best_score
 
-    def _quiescence_search(self, alpha, beta, depth=0, max_depth=4):
-        """Enhanced quiescence search to evaluate only quiet positions"""
+    def _update_quiet_stats(self, best_move, quiets_tried, depth):
+        """Reward a quiet move that caused a beta cutoff and penalize the quiet moves tried before it.
+
+        Updates the main and continuation histories with gravity, and makes the move
+        the countermove of the previous one (Stockfish's update_quiet_stats).
+        """
+        board = self.position
+        us = board.turn
+        bonus = _history_bonus(depth)
+        piece_to_history = self.piece_to_history
+        previous = piece_to_history[-1] if piece_to_history else -1
+        continuation_rows = [row * PIECE_TO_SIZE for row in piece_to_history[-2:] if row >= 0]
+        for move in quiets_tried:
+            if move != best_move:
+                self._update_move_history(board, us, move, -bonus, continuation_rows)
+        self._update_move_history(board, us, best_move, bonus, continuation_rows)
+        if previous >= 0:
+            self.countermoves[previous] = best_move
+        self.history_updated = True
+
+    def _update_move_history(self, board, us, move, bonus, continuation_rows):
+        """Apply a history bonus (or malus) to a quiet move in the main and continuation histories"""
+        from_square = move.from_square
+        to_square = move.to_square
+        _update_history(self.main_history, us << 12 | from_square << 6 | to_square, bonus, HISTORY_MAX)
+        piece_to = _piece_to(board.piece_type_at(from_square), us, to_square)
+        for row in continuation_rows:
+            _update_history(self.continuation_history, row + piece_to, bonus, CONTINUATION_HISTORY_MAX)
+
+    def _quiescence_search(self, alpha, beta, depth=0, max_depth=4, ply=0):
+        """Enhanced quiescence search to evaluate only quiet positions
+
+        In check there is no stand pat: every evasion is searched, and having
+        none is checkmate.
+        """
+        # Check periodically if we should stop
+        if self._check_stop():
+            return 0
         self.nodes_searched += 1
 
-        # Check periodically if we should stop
-        if self.nodes_searched % 1000 == 0 and time.time() - self.start_time > self.time_limit * 0.8:
-            self.stop_search = True
+        in_check = self.position.is_check()
+        if depth > 0 and self._is_draw(in_check):
             return 0
 
         # Prevent excessive depth in quiescence search
         if depth >= max_depth:
-            return self._evaluate_position()
+            return self._evaluate_position(alpha, beta)
+
+        if in_check:
+            has_moves = False
+            for move in self._move_picker(min(ply, MAX_PLY - 1)):
+                has_moves = True
+                self._make_move(move)
+                score = -self._quiescence_search(-beta, -alpha, depth + 1, max_depth, ply + 1)
+                self._unmake_move()
+
+                if self.stop_search:
+                    return 0
 
-        stand_pat = self._evaluate_position()
+                if score >= beta:
+                    return beta
+                if score > alpha:
+                    alpha = score
+            return alpha if has_moves else -MATE_SCORE + ply
 
-        # Delta pruning - if even capturing the most valuable piece wouldn't improve alpha
+        stand_pat = self._evaluate_position(alpha, beta)
+
+        # Stand pat: the side to move can usually keep at least the static evaluation
         if stand_pat >= beta:
             return beta
 
@@ -618,24 +2958,24 @@ class ChessAI:
         if stand_pat > alpha:
             alpha = stand_pat
 
-        # Look at captures only
-        captures = [move for move in self.board.legal_moves if self.board.is_capture(move)]
-        captures = self._order_moves(captures, depth)
-
-        # Also consider checks in quiescence to avoid missing tactical opportunities
-        if depth < 2:  # Limit depth for check extensions to avoid explosion
-            for move in self.board.legal_moves:
-                if not self.board.is_capture(move):
-                    self.board.push(move)
-                    is_check = self.board.is_check()
-                    self.board.pop()
-                    if is_check:
-                        captures.append(move)
+        board = self.position
+        futility_base = stand_pat + DELTA_MARGIN
+        for move in self._quiescence_moves(depth):
+            # Delta pruning: even winning the captured piece (and promoting) leaves us below alpha
+            if self.use_delta_pruning and futility_base <= alpha:
+                victim_type = board.piece_type_at(move.to_square)
+                if victim_type is not None:
+                    gain = self.piece_values[victim_type]
+                else:
+                    gain = PAWN_VALUE if board.is_en_passant(move) else 0
+                if move.promotion:
+                    gain += self.piece_values[move.promotion] - PAWN_VALUE
+                if futility_base + gain <= alpha and not board.gives_check(move):
+                    continue
 
-        for move in captures:
-            self.board.push(move)
-            score = -self._quiescence_search(-beta, -alpha, depth + 1, max_depth)
-            self.board.pop()
+            self._make_move(move)
+            score = -self._quiescence_search(-beta, -alpha, depth + 1, max_depth, ply + 1)
+            self._unmake_move()
 
             if self.stop_search:
                 return 0
@@ -647,538 +2987,369 @@ class ChessAI:
 
         return alpha
 
-    def _evaluate_position(self):
-        """Enhanced position evaluation with multiple factors"""
-        if self.board.is_checkmate():
-            return -10000 if self.board.turn else 10000
-
-        if self.board.is_stalemate() or self.board.is_insufficient_material():
-            return 0  # Draw
-
-        material_score = self._evaluate_material()
-        position_score = self._evaluate_piece_positioning()
-        pawn_structure_score = self._evaluate_pawn_structure()
-        mobility_score = self._evaluate_mobility()
-        king_safety_score = self._evaluate_king_safety()
-        attack_score = self._evaluate_attack_potential()
-
-        # Combine all evaluation components
-        total_score = (
-                material_score +
-                position_score +
-                pawn_structure_score +
-                mobility_score +
-                king_safety_score +
-                attack_score
-        )
+    def _quiescence_moves(self, depth):
+        """Captures and queen promotions from the move picker (losing ones skipped), then quiet checks.
+
+        Quiet checks are only tried in the first QUIESCENCE_CHECK_DEPTH plies and
+        come from Position.generate_quiet_checks(), so no move is made to find them.
+        """
+        yield from self._move_picker(depth, captures_only=True)
+        if depth < QUIESCENCE_CHECK_DEPTH:
+            for move in self.position.generate_quiet_checks():
+                if move.promotion != chess.QUEEN:  # Already tried with the captures
+                    yield move
+
+    def _evaluate_position(self, alpha=None, beta=None):
+        """Enhanced position evaluation with multiple factors (terminal positions are handled by the search)
+
+        Tiered: the eval cache first, then material, PST and cached pawn structure.
+        Given a window, the attack-based terms are skipped when those cheap terms
+        are more than LAZY_EVAL_MARGIN outside it, and the cheap score is returned.
+        A plugged-in evaluator replaces all the terms (no lazy exit).
+        """
+        sign = 1 if self.position.turn == chess.WHITE else -1
+        # The Zobrist key ignores the move number, on which _is_opening() and so the evaluation depend
+        key = self.zobrist_key ^ EVAL_CACHE_OPENING_KEY if self._is_opening() else self.zobrist_key
+        total_score = None if self.debug_incremental else self.eval_cache.probe(key)
+        if total_score is not None:
+            self.eval_tiers[0] += 1
+            return sign * total_score
+
+        if self.evaluator is not None:
+            self.eval_tiers[2] += 1
+            score = self.evaluator.evaluate(self.position)
+            self.eval_cache.store(key, sign * score)
+            return score
+
+        cheap_score = self._evaluate_psq() + self._evaluate_pawn_structure()
+        if alpha is not None:
+            lazy_score = sign * cheap_score
+            if lazy_score - LAZY_EVAL_MARGIN >= beta or lazy_score + LAZY_EVAL_MARGIN <= alpha:
+                self.eval_tiers[1] += 1
+                return lazy_score
+
+        self.eval_tiers[2] += 1
+        total_score = int(cheap_score + self._evaluate_positional())
+        self.eval_cache.store(key, total_score)
 
         # Return score from current player's perspective
-        return total_score if self.board.turn == chess.WHITE else -total_score
-
-    def _evaluate_material(self):
-        """Evaluate material balance with piece values"""
-        score = 0
-
-        # Material counting
-        for piece_type in [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING]:
-            score += len(self.board.pieces(piece_type, chess.WHITE)) * self.piece_values[piece_type]
-            score -= len(self.board.pieces(piece_type, chess.BLACK)) * self.piece_values[piece_type]
+        return sign * total_score
+
+    def _evaluate_components(self):
+        """Sum of all evaluation terms, from White's point of view"""
+        return self._evaluate_psq() + self._evaluate_pawn_structure() + self._evaluate_positional()
+
+    def _evaluate_positional(self):
+        """Attack-based terms (mobility, king safety, attack potential), tapered, from White's point of view"""
+        attack_map = AttackMap(self.position)
+        mobility_mg, mobility_eg = self._evaluate_mobility(attack_map)
+        king_safety_mg, king_safety_eg = self._evaluate_king_safety(attack_map)
+        attack_mg, attack_eg = self._evaluate_attack_potential(attack_map)
+
+        # Combine all evaluation components, each a (middlegame, endgame) pair
+        return self._taper(mobility_mg + king_safety_mg + attack_mg,
+                           mobility_eg + king_safety_eg + attack_eg)
+
+    def _taper(self, mg, eg):
+        """Blend a middlegame and an endgame score by the game phase"""
+        phase = min(self.phase, PHASE_MAX)
+        return (mg * phase + eg * (PHASE_MAX - phase)) // PHASE_MAX
+
+    def _evaluate_psq(self):
+        """Material, bishop pair and tapered piece-square score from the incremental accumulators"""
+        board = self.position
+        if self.debug_incremental:
+            expected = self._compute_psq()
+            if (self.psq_mg, self.psq_eg, self.phase) != expected:
+                raise AssertionError(f"Incremental material/PST/phase {(self.psq_mg, self.psq_eg, self.phase)} "
+                                     f"!= {expected} in {board.fen()}")
+
+        score = self._taper(self.psq_mg, self.psq_eg)
 
         # Bishop pair bonus
-        if len(self.board.pieces(chess.BISHOP, chess.WHITE)) >= 2:
-            score += 50
-        if len(self.board.pieces(chess.BISHOP, chess.BLACK)) >= 2:
-            score -= 50
-
-        return score
-
-    def _evaluate_piece_positioning(self):
-        """Evaluate piece positioning using piece-square tables"""
-        score = 0
-        is_endgame = self._is_endgame()
-
-        for square in chess.SQUARES:
-            piece = self.board.piece_at(square)
-            if not piece:
-                continue
-
-            # Position value based on piece-square tables
-            position_value = 0
-            if piece.piece_type == chess.PAWN:
-                position_value = PAWN_TABLE[square if piece.color else 63 - square]
-            elif piece.piece_type == chess.KNIGHT:
-                position_value = KNIGHT_TABLE[square if piece.color else 63 - square]
-            elif piece.piece_type == chess.BISHOP:
-                position_value = BISHOP_TABLE[square if piece.color else 63 - square]
-            elif piece.piece_type == chess.ROOK:
-                position_value = ROOK_TABLE[square if piece.color else 63 - square]
-            elif piece.piece_type == chess.QUEEN:
-                position_value = QUEEN_TABLE[square if piece.color else 63 - square]
-            elif piece.piece_type == chess.KING:
-                position_value = KING_END_TABLE[square if piece.color else 63 - square] if is_endgame else \
-                KING_MIDDLE_TABLE[square if piece.color else 63 - square]
-
-            # Add or subtract based on piece color
-            if piece.color == chess.WHITE:
-                score += position_value
-            else:
-                score -= position_value
-
+        if chess.popcount(board.bishops & board.occupied_co[chess.WHITE]) >= 2:
+            score += BISHOP_PAIR_BONUS
+        if chess.popcount(board.bishops & board.occupied_co[chess.BLACK]) >= 2:
+            score -= BISHOP_PAIR_BONUS
         return score
 
     def _evaluate_pawn_structure(self):
-        """Enhanced pawn structure evaluation"""
+        """Tapered pawn structure score, from the pawn hash table when the pawn skeleton was seen before"""
+        return self._taper(*self._pawn_structure_scores())
+
+    def _pawn_structure_scores(self):
+        """Middlegame and endgame pawn structure scores, White's point of view"""
+        entry = self._pawn_entry()
+        occupied = self.position.occupied
+        # Backward pawns whose stop square is blocked by a piece: depends on more than the pawns
+        blocked = chess.popcount((entry.backward_candidates[chess.WHITE] << 8) & occupied) - \
+                  chess.popcount((entry.backward_candidates[chess.BLACK] >> 8) & occupied)
+        return (entry.score_mg - BACKWARD_PAWN_PENALTY[0] * blocked,
+                entry.score_eg - BACKWARD_PAWN_PENALTY[1] * blocked)
+
+    def _pawn_entry(self):
+        """Pawn hash entry of the current position, computed and stored on a miss"""
+        if self.debug_incremental and self.pawn_key != self._compute_pawn_key():
+            raise AssertionError(f"Incremental pawn key mismatch in {self.position.fen()}")
+        entry = self.pawn_table.probe(self.pawn_key)
+        if entry is None:
+            entry = self._compute_pawn_entry(self.pawn_key)
+            self.pawn_table.store(entry)
+        return entry
+
+    def _compute_pawn_entry(self, key):
+        """Enhanced pawn structure evaluation on bitboards (masks precomputed per square, see _build_pawn_masks)
+
+        Only pawn-dependent terms go into the entry, since it is shared by every
+        position with the same pawns.
+        """
+        board = self.position
+        entry = PawnEntry(key)
+        score_mg = score_eg = 0
+
+        all_files = 0
+        for color in chess.COLORS:
+            sign = 1 if color == chess.WHITE else -1
+            pawns = board.pawns & board.occupied_co[color]
+            enemy_pawns = board.pawns & board.occupied_co[not color]
+
+            # Doubled pawns: every pawn beyond the first on its file
+            files = pawns | (pawns >> 8)
+            files |= files >> 16
+            files |= files >> 32
+            files &= chess.BB_RANK_1
+            doubled = chess.popcount(pawns) - chess.popcount(files)
+            files *= 0x0101010101010101  # Spread the occupied files over every rank
+            entry.half_open_files[color] = ~files & chess.BB_ALL
+            all_files |= files
+
+            # Pawn chains: pawns defended diagonally from behind, one bonus per defender
+            if color == chess.WHITE:
+                defended = chess.popcount(pawns & (pawns << 9) & ~chess.BB_FILE_A) + \
+                           chess.popcount(pawns & (pawns << 7) & ~chess.BB_FILE_H)
+            else:
+                defended = chess.popcount(pawns & (pawns >> 7) & ~chess.BB_FILE_A) + \
+                           chess.popcount(pawns & (pawns >> 9) & ~chess.BB_FILE_H)
+
+            # Counts of each term, weighted by the (middlegame, endgame) pairs below
+            passed = passed_rank_squares = supported = isolated = backward = 0
+            passed_pawns = 0
+            attack_span = 0
+            backward_candidates = 0
+            for square in chess.scan_forward(pawns):
+                attack_span |= PAWN_ATTACK_SPAN_MASKS[color][square]
+
+                # Passed pawns: more value for advanced passed pawns - exponential bonus
+                if not PASSED_PAWN_MASKS[color][square] & enemy_pawns:
+                    passed_pawns |= chess.BB_SQUARES[square]
+                    rank = chess.square_rank(square) if color == chess.WHITE else 7 - chess.square_rank(square)
+                    passed += 1
+                    passed_rank_squares += rank * rank
+                    # Bonus for supported passed pawns
+                    supported += chess.popcount(PASSED_SUPPORT_MASKS[color][square] & pawns)
+
+                # Isolated pawns: no friendly pawn on an adjacent file
+                if not ADJACENT_FILE_MASKS[chess.square_file(square)] & pawns:
+                    isolated += 1
+
+                # Backward pawns: neighbours are more advanced and the stop square is blocked or attacked
+                if BACKWARD_SPAN_MASKS[color][square] & pawns:
+                    stop = PAWN_STOP_MASKS[color][square]
+                    if stop and STOP_ATTACK_MASKS[color][square] & enemy_pawns:
+                        backward += 1
+                    elif stop:
+                        backward_candidates |= chess.BB_SQUARES[square]
+
+            terms = ((PAWN_CHAIN_BONUS, defended), (PASSED_PAWN_BONUS, passed),
+                     (PASSED_PAWN_RANK_BONUS, passed_rank_squares), (SUPPORTED_PASSED_PAWN_BONUS, supported),
+                     (DOUBLED_PAWN_PENALTY, -doubled), (ISOLATED_PAWN_PENALTY, -isolated),
+                     (BACKWARD_PAWN_PENALTY, -backward))
+            score_mg += sign * sum(weights[0] * count for weights, count in terms)
+            score_eg += sign * sum(weights[1] * count for weights, count in terms)
+
+            entry.passed_pawns[color] = passed_pawns
+            entry.backward_candidates[color] = backward_candidates
+            entry.attack_spans[color] = attack_span
+
+        entry.open_files = ~all_files & chess.BB_ALL
+        entry.score_mg = score_mg
+        entry.score_eg = score_eg
+        return entry
+
+    def _pawn_shield(self, entry, color, king_square):
+        """Pawn shield bonus of a king, cached in the pawn entry per king square"""
+        if entry.shield_king[color] != king_square:
+            pawns = self.position.pawns & self.position.occupied_co[color]
+            entry.shield_score[color] = sum(bonus for square_mask, bonus in PAWN_SHIELD_TABLE[color][king_square]
+                                            if square_mask & pawns)
+            entry.shield_king[color] = king_square
+        return entry.shield_score[color]
+
+    def _evaluate_mobility(self, attack_map):
+        """Evaluate piece mobility from attack bitboards (see Stockfish's evaluate.cpp mobility area).
+
+        Squares count when they are not occupied by our own pieces and not
+        attacked by enemy pawns, weighted per piece type. Returns (middlegame, endgame).
+        """
+        board = self.position
+        mg = eg = 0
+
+        for color in chess.COLORS:
+            mobility_area = ~(board.occupied_co[color] | attack_map.attacked_by[not color][chess.PAWN])
+            mobility_mg = mobility_eg = 0
+            for piece_type, attacks in attack_map.piece_attacks[color]:
+                squares = chess.popcount(attacks & mobility_area)
+                mobility_mg += MOBILITY_WEIGHTS_MG[piece_type] * squares
+                mobility_eg += MOBILITY_WEIGHTS_EG[piece_type] * squares
+            if color == chess.WHITE:
+                mg += mobility_mg
+                eg += mobility_eg
+            else:
+                mg -= mobility_mg
+                eg -= mobility_eg
+
+        # Add check/checkmate threat bonus (the same in both phases)
+        if board.is_check():
+            check_bonus = -50 if board.turn == chess.WHITE else 50  # Side to move is in check
+            mg += check_bonus
+            eg += check_bonus
+
+        return mg, eg
+
+    def _evaluate_king_safety(self, attack_map):
+        """Enhanced king safety evaluation: middlegame shelter and endgame king activity, as (mg, eg)"""
+        phase = min(self.phase, PHASE_MAX)
+        mg = self._king_safety_middlegame(attack_map) if phase else 0
+        eg = self._king_safety_endgame() if phase < PHASE_MAX else 0
+        return mg, eg
+
+    def _king_safety_middlegame(self, attack_map):
+        """Castling, pawn shield and king-zone attackers"""
         score = 0
 
-        white_pawns = self.board.pieces(chess.PAWN, chess.WHITE)
-        black_pawns = self.board.pieces(chess.PAWN, chess.BLACK)
-
-        # Passed pawns
-        for square in white_pawns:
-            rank = chess.square_rank(square)
-            file = chess.square_file(square)
-            is_passed = True
-
-            # Check if there are any black pawns that can block this pawn
-            for f in range(max(0, file - 1), min(7, file + 1) + 1):
-                for r in range(rank + 1, 8):
-                    if chess.square(f, r) in black_pawns:
-                        is_passed = False
-                        break
-                if not is_passed:
-                    break
-
-            if is_passed:
-                # More value for advanced passed pawns - exponential bonus
-                score += 20 + (rank * rank * 2)
-
-                # Check if the passed pawn is supported
-                if rank > 0:
-                    for support_file in [max(0, file - 1), min(7, file + 1)]:
-                        support_square = chess.square(support_file, rank - 1)
-                        if support_square in white_pawns:
-                            score += 10  # Bonus for supported passed pawns
-
-        for square in black_pawns:
-            rank = chess.square_rank(square)
-            file = chess.square_file(square)
-            is_passed = True
-
-            # Check if there are any white pawns that can block this pawn
-            for f in range(max(0, file - 1), min(7, file + 1) + 1):
-                for r in range(0, rank):
-                    if chess.square(f, r) in white_pawns:
-                        is_passed = False
-                        break
-                if not is_passed:
-                    break
-
-            if is_passed:
-                # More value for advanced passed pawns - exponential bonus
-                score -= 20 + ((7 - rank) * (7 - rank) * 2)
-
-                # Check if the passed pawn is supported
-                if rank < 7:
-                    for support_file in [max(0, file - 1), min(7, file + 1)]:
-                        support_square = chess.square(support_file, rank + 1)
-                        if support_square in black_pawns:
-                            score -= 10  # Bonus for supported passed pawns
-
-        # Doubled pawns
-        for file_num in range(8):
-            file_mask = chess.BB_FILES[file_num]
-
-            white_pawns_in_file = len(white_pawns & chess.SquareSet(file_mask))
-            black_pawns_in_file = len(black_pawns & chess.SquareSet(file_mask))
-
-            if white_pawns_in_file > 1:
-                score -= 15 * (white_pawns_in_file - 1)  # Penalty for doubled pawns
-            if black_pawns_in_file > 1:
-                score += 15 * (black_pawns_in_file - 1)  # Penalty for doubled pawns
-
-        # Isolated pawns
-        for square in white_pawns:
-            file_num = chess.square_file(square)
-            isolated = True
-
-            # Check adjacent files for friendly pawns
-            for adj_file in [max(0, file_num - 1), min(7, file_num + 1)]:
-                if adj_file == file_num:
-                    continue
-                if white_pawns & chess.SquareSet(chess.BB_FILES[adj_file]):
-                    isolated = False
-                    break
-
-            if isolated:
-                score -= 20  # Penalty for isolated pawns
-
-        for square in black_pawns:
-            file_num = chess.square_file(square)
-            isolated = True
-
-            # Check adjacent files for friendly pawns
-            for adj_file in [max(0, file_num - 1), min(7, file_num + 1)]:
-                if adj_file == file_num:
-                    continue
-                if black_pawns & chess.SquareSet(chess.BB_FILES[adj_file]):
-                    isolated = False
-                    break
-
-            if isolated:
-                score += 20  # Penalty for isolated pawns
-
-        # Backward pawns detection
-        for square in white_pawns:
-            file_num = chess.square_file(square)
-            rank = chess.square_rank(square)
-            is_backward = False
-
-            # Check if adjacent files have pawns more advanced
-            left_file = max(0, file_num - 1)
-            right_file = min(7, file_num + 1)
-
-            # Is there any pawn on adjacent files more advanced?
-            more_advanced_adjacent = False
-            for f in [left_file, right_file]:
-                for r in range(rank + 1, 8):
-                    if chess.square(f, r) in white_pawns:
-                        more_advanced_adjacent = True
-                        break
-
-            # Can this pawn be safely advanced?
-            can_advance = True
-            if rank < 7:
-                advance_square = chess.square(file_num, rank + 1)
-                if self.board.piece_at(advance_square):  # Square is blocked
-                    can_advance = False
-                else:
-                    # Check if square is attacked by enemy pawns
-                    for f in [max(0, file_num - 1), min(7, file_num + 1)]:
-                        if rank + 2 < 8 and chess.square(f, rank + 2) in black_pawns:
-                            can_advance = False
-                            break
-
-            if more_advanced_adjacent and not can_advance:
-                score -= 10  # Penalty for backward pawns
-
-        for square in black_pawns:
-            file_num = chess.square_file(square)
-            rank = chess.square_rank(square)
-            is_backward = False
-
-            # Check if adjacent files have pawns more advanced
-            left_file = max(0, file_num - 1)
-            right_file = min(7, file_num + 1)
-
-            # Is there any pawn on adjacent files more advanced?
-            more_advanced_adjacent = False
-            for f in [left_file, right_file]:
-                for r in range(0, rank):
-                    if chess.square(f, r) in black_pawns:
-                        more_advanced_adjacent = True
-                        break
-
-            # Can this pawn be safely advanced?
-            can_advance = True
-            if rank > 0:
-                advance_square = chess.square(file_num, rank - 1)
-                if self.board.piece_at(advance_square):  # Square is blocked
-                    can_advance = False
-                else:
-                    # Check if square is attacked by enemy pawns
-                    for f in [max(0, file_num - 1), min(7, file_num + 1)]:
-                        if rank - 2 >= 0 and chess.square(f, rank - 2) in white_pawns:
-                            can_advance = False
-                            break
-
-            if more_advanced_adjacent and not can_advance:
-                score += 10  # Penalty for backward pawns
-
-        # Pawn chains
-        for square in white_pawns:
-            file_num = chess.square_file(square)
-            rank = chess.square_rank(square)
-
-            # Check for defending pawns
-            if file_num > 0 and rank > 0:
-                if chess.square(file_num - 1, rank - 1) in white_pawns:
-                    score += 5  # Bonus for pawn chains
-
-            if file_num < 7 and rank > 0:
-                if chess.square(file_num + 1, rank - 1) in white_pawns:
-                    score += 5  # Bonus for pawn chains
-
-        for square in black_pawns:
-            file_num = chess.square_file(square)
-            rank = chess.square_rank(square)
-
-            # Check for defending pawns
-            if file_num > 0 and rank < 7:
-                if chess.square(file_num - 1, rank + 1) in black_pawns:
-                    score -= 5  # Bonus for pawn chains
-
-            if file_num < 7 and rank < 7:
-                if chess.square(file_num + 1, rank + 1) in black_pawns:
-                    score -= 5  # Bonus for pawn chains
+        # Castling rights evaluation
+        if self.position.has_kingside_castling_rights(chess.WHITE):
+            score += 40
+        if self.position.has_queenside_castling_rights(chess.WHITE):
+            score += 30
+        if self.position.has_kingside_castling_rights(chess.BLACK):
+            score -= 40
+        if self.position.has_queenside_castling_rights(chess.BLACK):
+            score -= 30
+
+        # Has already castled bonus (detect by king position)
+        white_king = self.position.king(chess.WHITE)
+        if white_king is not None:
+            wk_file = chess.square_file(white_king)
+            wk_rank = chess.square_rank(white_king)
+            if wk_rank == 0:
+                if wk_file in [6, 7]:  # King-side castled
+                    score += 60
+                elif wk_file in [0, 1, 2]:  # Queen-side castled
+                    score += 50
+
+        black_king = self.position.king(chess.BLACK)
+        if black_king is not None:
+            bk_file = chess.square_file(black_king)
+            bk_rank = chess.square_rank(black_king)
+            if bk_rank == 7:
+                if bk_file in [6, 7]:  # King-side castled
+                    score -= 60
+                elif bk_file in [0, 1, 2]:  # Queen-side castled
+                    score -= 50
+
+        # King pawn shield - weighted by distance, cached in the pawn hash entry
+        pawn_entry = self._pawn_entry()
+        if white_king is not None:
+            score += self._pawn_shield(pawn_entry, chess.WHITE, white_king)
+        if black_king is not None:
+            score -= self._pawn_shield(pawn_entry, chess.BLACK, black_king)
+
+        # King attack zone and safety, attackers weighted by piece type
+        if white_king is not None:
+            black_attackers, attacker_weight = attack_map.weighted_count(
+                chess.BLACK, self._get_king_attack_zone(white_king), KING_ATTACKER_WEIGHTS)
+
+            # Safety penalty increases dramatically with more attackers
+            safety_penalty = 0
+            if black_attackers > 0:
+                # More attackers = exponentially worse
+                safety_penalty = 5 * black_attackers + 5 * attacker_weight
+                if black_attackers >= 2:
+                    safety_penalty *= 2
+                if black_attackers >= 3:
+                    safety_penalty = int(safety_penalty * 1.5)
+
+            score -= safety_penalty
+
+        if black_king is not None:
+            white_attackers, attacker_weight = attack_map.weighted_count(
+                chess.WHITE, self._get_king_attack_zone(black_king), KING_ATTACKER_WEIGHTS)
+
+            # Safety penalty increases dramatically with more attackers
+            safety_penalty = 0
+            if white_attackers > 0:
+                # More attackers = exponentially worse
+                safety_penalty = 5 * white_attackers + 5 * attacker_weight
+                if white_attackers >= 2:
+                    safety_penalty *= 2
+                if white_attackers >= 3:
+                    safety_penalty = int(safety_penalty * 1.5)
+
+            score += safety_penalty
 
         return score
 
-    def _evaluate_mobility(self):
-        """Evaluate piece mobility with improved weights"""
-        original_turn = self.board.turn
+    def _king_safety_endgame(self):
+        """In endgame, kings should be more active"""
         score = 0
-
-        # Evaluate white mobility
-        self.board.turn = chess.WHITE
-        white_moves = list(self.board.legal_moves)
-        white_mobility = len(white_moves)
-
-        # Get only quiet moves (non-captures)
-        white_quiet_moves = sum(1 for move in white_moves if not self.board.is_capture(move))
-
-        # Evaluate black mobility
-        self.board.turn = chess.BLACK
-        black_moves = list(self.board.legal_moves)
-        black_mobility = len(black_moves)
-
-        # Get only quiet moves (non-captures)
-        black_quiet_moves = sum(1 for move in black_moves if not self.board.is_capture(move))
-
-        # Restore original turn
-        self.board.turn = original_turn
-
-        # Quiet moves are weighted less than total mobility
-        mobility_score = 2 * (white_mobility - black_mobility) + (white_quiet_moves - black_quiet_moves)
-
-        # Add check/checkmate threat bonus
-        if self.board.is_check():
-            if self.board.turn == chess.WHITE:
-                score -= 50  # White is in check
-            else:
-                score += 50  # Black is in check
-
-        return score + mobility_score
-
-    def _evaluate_king_safety(self):
-        """Enhanced king safety evaluation"""
-        score = 0
-        is_endgame = self._is_endgame()
-
-        if not is_endgame:
-            # Castling rights evaluation
-            if self.board.has_kingside_castling_rights(chess.WHITE):
-                score += 40
-            if self.board.has_queenside_castling_rights(chess.WHITE):
-                score += 30
-            if self.board.has_kingside_castling_rights(chess.BLACK):
-                score -= 40
-            if self.board.has_queenside_castling_rights(chess.BLACK):
-                score -= 30
-
-            # Has already castled bonus (detect by king position)
-            white_king = self.board.king(chess.WHITE)
-            if white_king is not None:
-                wk_file = chess.square_file(white_king)
-                wk_rank = chess.square_rank(white_king)
-                if wk_rank == 0:
-                    if wk_file in [6, 7]:  # King-side castled
-                        score += 60
-                    elif wk_file in [0, 1, 2]:  # Queen-side castled
-                        score += 50
-
-            black_king = self.board.king(chess.BLACK)
-            if black_king is not None:
-                bk_file = chess.square_file(black_king)
-                bk_rank = chess.square_rank(black_king)
-                if bk_rank == 7:
-                    if bk_file in [6, 7]:  # King-side castled
-                        score -= 60
-                    elif bk_file in [0, 1, 2]:  # Queen-side castled
-                        score -= 50
-
-            # King pawn shield - weighted by distance
-            if white_king is not None:
-                wk_file = chess.square_file(white_king)
-                wk_rank = chess.square_rank(white_king)
-
-                # Define pawn shield area (depends on castle side)
-                shield_files = []
-                if wk_file < 3:  # Queenside castle
-                    shield_files = [max(0, wk_file - 1), wk_file, wk_file + 1]
-                elif wk_file > 4:  # Kingside castle
-                    shield_files = [wk_file - 1, wk_file, min(7, wk_file + 1)]
-                else:  # Middle (not castled or e-file)
-                    shield_files = [max(0, wk_file - 1), wk_file, min(7, wk_file + 1)]
-
-                # Check pawns in shield area
-                for f in shield_files:
-                    for r in range(wk_rank + 1, min(wk_rank + 3, 8)):
-                        square = chess.square(f, r)
-                        piece = self.board.piece_at(square)
-                        if piece and piece.piece_type == chess.PAWN and piece.color == chess.WHITE:
-                            # Closer pawns are more valuable
-                            distance = abs(r - wk_rank) + abs(f - wk_file)
-                            score += max(15 - 5 * distance, 5)
-
-            if black_king is not None:
-                bk_file = chess.square_file(black_king)
-                bk_rank = chess.square_rank(black_king)
-
-                # Define pawn shield area (depends on castle side)
-                shield_files = []
-                if bk_file < 3:  # Queenside castle
-                    shield_files = [max(0, bk_file - 1), bk_file, bk_file + 1]
-                elif bk_file > 4:  # Kingside castle
-                    shield_files = [bk_file - 1, bk_file, min(7, bk_file + 1)]
-                else:  # Middle (not castled or e-file)
-                    shield_files = [max(0, bk_file - 1), bk_file, min(7, bk_file + 1)]
-
-                # Check pawns in shield area
-                for f in shield_files:
-                    for r in range(max(0, bk_rank - 2), bk_rank):
-                        square = chess.square(f, r)
-                        piece = self.board.piece_at(square)
-                        if piece and piece.piece_type == chess.PAWN and piece.color == chess.BLACK:
-                            # Closer pawns are more valuable
-                            distance = abs(r - bk_rank) + abs(f - bk_file)
-                            score -= max(15 - 5 * distance, 5)
-
-            # King attack zone and safety
-            if white_king is not None:
-                attack_zone = self._get_king_attack_zone(white_king)
-                black_attackers = 0
-                attacker_weight = 0
-
-                for square in attack_zone:
-                    attackers = self.board.attackers(chess.BLACK, square)
-                    black_attackers += len(attackers)
-
-                    # Weight attackers by piece type
-                    for attacker_square in attackers:
-                        piece = self.board.piece_at(attacker_square)
-                        if piece.piece_type == chess.QUEEN:
-                            attacker_weight += 4
-                        elif piece.piece_type == chess.ROOK:
-                            attacker_weight += 3
-                        elif piece.piece_type in [chess.BISHOP, chess.KNIGHT]:
-                            attacker_weight += 2
-                        else:  # Pawn
-                            attacker_weight += 1
-
-                # Safety penalty increases dramatically with more attackers
-                safety_penalty = 0
-                if black_attackers > 0:
-                    # More attackers = exponentially worse
-                    safety_penalty = 5 * black_attackers + 5 * attacker_weight
-                    if black_attackers >= 2:
-                        safety_penalty *= 2
-                    if black_attackers >= 3:
-                        safety_penalty = int(safety_penalty * 1.5)
-
-                score -= safety_penalty
-
-            if black_king is not None:
-                attack_zone = self._get_king_attack_zone(black_king)
-                white_attackers = 0
-                attacker_weight = 0
-
-                for square in attack_zone:
-                    attackers = self.board.attackers(chess.WHITE, square)
-                    white_attackers += len(attackers)
-
-                    # Weight attackers by piece type
-                    for attacker_square in attackers:
-                        piece = self.board.piece_at(attacker_square)
-                        if piece.piece_type == chess.QUEEN:
-                            attacker_weight += 4
-                        elif piece.piece_type == chess.ROOK:
-                            attacker_weight += 3
-                        elif piece.piece_type in [chess.BISHOP, chess.KNIGHT]:
-                            attacker_weight += 2
-                        else:  # Pawn
-                            attacker_weight += 1
-
-                # Safety penalty increases dramatically with more attackers
-                safety_penalty = 0
-                if white_attackers > 0:
-                    # More attackers = exponentially worse
-                    safety_penalty = 5 * white_attackers + 5 * attacker_weight
-                    if white_attackers >= 2:
-                        safety_penalty *= 2
-                    if white_attackers >= 3:
-                        safety_penalty = int(safety_penalty * 1.5)
-
-                score += safety_penalty
-        else:
-            # In endgame, kings should be more active
-            white_king = self.board.king(chess.WHITE)
-            black_king = self.board.king(chess.BLACK)
-
-            if white_king is not None and black_king is not None:
-                # Center manhattan distance for kings in endgame
-                wk_file = chess.square_file(white_king)
-                wk_rank = chess.square_rank(white_king)
-                bk_file = chess.square_file(black_king)
-                bk_rank = chess.square_rank(black_king)
-
-                # Distance to center (lower is better)
-                white_center_dist = abs(3.5 - wk_file) + abs(3.5 - wk_rank)
-                black_center_dist = abs(3.5 - bk_file) + abs(3.5 - bk_rank)
-
-                # In endgame, active king is good
-                score += 10 * (black_center_dist - white_center_dist)
-
-                # King opposition
-                kings_file_distance = abs(wk_file - bk_file)
-                kings_rank_distance = abs(wk_rank - bk_rank)
-                kings_distance = kings_file_distance + kings_rank_distance
-
-                # Kings' opposition in endgame
-                if kings_distance == 2 and ((kings_file_distance == 0) or (kings_rank_distance == 0)):
-                    if self.board.turn == chess.WHITE:
-                        score += 20  # White has the opposition
-                    else:
-                        score -= 20  # Black has the opposition
+        white_king = self.position.king(chess.WHITE)
+        black_king = self.position.king(chess.BLACK)
+
+        if white_king is not None and black_king is not None:
+            # Center manhattan distance for kings in endgame
+            wk_file = chess.square_file(white_king)
+            wk_rank = chess.square_rank(white_king)
+            bk_file = chess.square_file(black_king)
+            bk_rank = chess.square_rank(black_king)
+
+            # Distance to center (lower is better)
+            white_center_dist = abs(3.5 - wk_file) + abs(3.5 - wk_rank)
+            black_center_dist = abs(3.5 - bk_file) + abs(3.5 - bk_rank)
+
+            # In endgame, active king is good
+            score += int(10 * (black_center_dist - white_center_dist))
+
+            # King opposition
+            kings_file_distance = abs(wk_file - bk_file)
+            kings_rank_distance = abs(wk_rank - bk_rank)
+            kings_distance = kings_file_distance + kings_rank_distance
+
+            # Kings' opposition in endgame
+            if kings_distance == 2 and ((kings_file_distance == 0) or (kings_rank_distance == 0)):
+                if self.position.turn == chess.WHITE:
+                    score += 20  # White has the opposition
+                else:
+                    score -= 20  # Black has the opposition
 
         return score
 
     def _get_king_attack_zone(self, king_square):
-        """Get expanded attack zone around the king"""
-        attack_zone = set()
-        king_file = chess.square_file(king_square)
-        king_rank = chess.square_rank(king_square)
-
-        # Two-square radius around king
-        for f in range(max(0, king_file - 2), min(8, king_file + 3)):
-            for r in range(max(0, king_rank - 2), min(8, king_rank + 3)):
-                square = chess.square(f, r)
-                if square != king_square:
-                    attack_zone.add(square)
-
-        return attack_zone
-
-    def _evaluate_attack_potential(self):
-        """Evaluate piece coordination and attack potential"""
-        score = 0
+        """Get expanded attack zone around the king (two-square radius bitboard)"""
+        return KING_ZONE_MASKS[king_square]
 
-        # Center control (d4, d5, e4, e5)
-        central_squares = [chess.D4, chess.E4, chess.D5, chess.E5]
-        for square in central_squares:
-            # Count attackers of each color
-            white_attackers = len(self.board.attackers(chess.WHITE, square))
-            black_attackers = len(self.board.attackers(chess.BLACK, square))
-            score += 10 * (white_attackers - black_attackers)
+    def _evaluate_attack_potential(self, attack_map):
+        """Evaluate piece coordination and attack potential, as (middlegame, endgame) scores"""
+        # Center control (d4, d5, e4, e5): count attackers of each color
+        center = attack_map.count(chess.WHITE, BB_CENTER) - attack_map.count(chess.BLACK, BB_CENTER)
+        mg = 10 * center
+        eg = 2 * center
 
         # Extended center control
-        extended_center = [
-            chess.C3, chess.D3, chess.E3, chess.F3,
-            chess.C4, chess.F4, chess.C5, chess.F5,
-            chess.C6, chess.D6, chess.E6, chess.F6
-        ]
-        for square in extended_center:
-            white_attackers = len(self.board.attackers(chess.WHITE, square))
-            black_attackers = len(self.board.attackers(chess.BLACK, square))
-            score += 5 * (white_attackers - black_attackers)
+        extended_center = (attack_map.count(chess.WHITE, BB_EXTENDED_CENTER)
+                           - attack_map.count(chess.BLACK, BB_EXTENDED_CENTER))
+        mg += 5 * extended_center
+        eg += extended_center
 
         # Development advantage in opening
         if self._is_opening():
@@ -1186,10 +3357,10 @@ class ChessAI:
             black_development = 0
 
             # Count developed minor pieces (knights and bishops)
-            white_knights = self.board.pieces(chess.KNIGHT, chess.WHITE)
-            black_knights = self.board.pieces(chess.KNIGHT, chess.BLACK)
-            white_bishops = self.board.pieces(chess.BISHOP, chess.WHITE)
-            black_bishops = self.board.pieces(chess.BISHOP, chess.BLACK)
+            white_knights = self.position.pieces(chess.KNIGHT, chess.WHITE)
+            black_knights = self.position.pieces(chess.KNIGHT, chess.BLACK)
+            white_bishops = self.position.pieces(chess.BISHOP, chess.WHITE)
+            black_bishops = self.position.pieces(chess.BISHOP, chess.BLACK)
 
             # Check if knights moved from starting squares
             if not chess.B1 in white_knights and not chess.G1 in white_knights:
@@ -1213,66 +3384,44 @@ class ChessAI:
             elif not chess.C8 in black_bishops or not chess.F8 in black_bishops:
                 black_development += 1
 
-            # Bonus for development advantage
-            score += 15 * (white_development - black_development)
+            # Bonus for development advantage (middlegame only)
+            mg += 15 * (white_development - black_development)
 
         # Attack on enemy king
-        white_king = self.board.king(chess.BLACK)  # Enemy king for white
-        black_king = self.board.king(chess.WHITE)  # Enemy king for black
+        white_king = self.position.king(chess.BLACK)  # Enemy king for white
+        black_king = self.position.king(chess.WHITE)  # Enemy king for black
 
+        # Count attacks near enemy king (the king square and its neighbours)
+        king_attacks = 0
         if white_king:
-            king_file = chess.square_file(white_king)
-            king_rank = chess.square_rank(white_king)
-
-            # Count attacks near enemy king
-            for f in range(max(0, king_file - 1), min(8, king_file + 2)):
-                for r in range(max(0, king_rank - 1), min(8, king_rank + 2)):
-                    square = chess.square(f, r)
-                    white_attackers = len(self.board.attackers(chess.WHITE, square))
-                    score += 3 * white_attackers  # White attacking black king area
+            king_area = chess.BB_KING_ATTACKS[white_king] | chess.BB_SQUARES[white_king]
+            king_attacks += attack_map.count(chess.WHITE, king_area)  # White attacking black king area
 
         if black_king:
-            king_file = chess.square_file(black_king)
-            king_rank = chess.square_rank(black_king)
-
-            # Count attacks near enemy king
-            for f in range(max(0, king_file - 1), min(8, king_file + 2)):
-                for r in range(max(0, king_rank - 1), min(8, king_rank + 2)):
-                    square = chess.square(f, r)
-                    black_attackers = len(self.board.attackers(chess.BLACK, square))
-                    score -= 3 * black_attackers  # Black attacking white king area
-
-        # Piece coordination - adjacent pieces protecting each other
-        for square in chess.SQUARES:
-            piece = self.board.piece_at(square)
-            if not piece:
-                continue
-
-            # Count how many pieces are defended
-            defenders = self.board.attackers(piece.color, square)
-            if piece.color == chess.WHITE:
-                score += 2 * len(defenders)  # Small bonus for protected pieces
-            else:
-                score -= 2 * len(defenders)
-
-        # Rooks on open files
-        white_rooks = self.board.pieces(chess.ROOK, chess.WHITE)
-        black_rooks = self.board.pieces(chess.ROOK, chess.BLACK)
-        white_pawns = self.board.pieces(chess.PAWN, chess.WHITE)
-        black_pawns = self.board.pieces(chess.PAWN, chess.BLACK)
+            king_area = chess.BB_KING_ATTACKS[black_king] | chess.BB_SQUARES[black_king]
+            king_attacks -= attack_map.count(chess.BLACK, king_area)  # Black attacking white king area
+        mg += 3 * king_attacks
+        eg += king_attacks
+
+        # Piece coordination - small bonus per defender of each of our pieces
+        coordination = 2 * (attack_map.count(chess.WHITE, self.position.occupied_co[chess.WHITE])
+                            - attack_map.count(chess.BLACK, self.position.occupied_co[chess.BLACK]))
+        mg += coordination
+        eg += coordination
+
+        # Rooks on open files (open and half-open files come from the pawn hash entry)
+        pawn_entry = self._pawn_entry()
+        white_rooks = self.position.pieces(chess.ROOK, chess.WHITE)
+        black_rooks = self.position.pieces(chess.ROOK, chess.BLACK)
 
         for square in white_rooks:
-            file_num = chess.square_file(square)
-            file_mask = chess.BB_FILES[file_num]
-
-            # Check if file has no pawns (open) or only enemy pawns (half-open)
-            white_pawns_in_file = white_pawns & chess.SquareSet(file_mask)
-            black_pawns_in_file = black_pawns & chess.SquareSet(file_mask)
-
-            if not white_pawns_in_file and not black_pawns_in_file:
-                score += 25  # Open file
-            elif not white_pawns_in_file:
-                score += 15  # Half-open file
+            square_mask = chess.BB_SQUARES[square]
+            if square_mask & pawn_entry.open_files:
+                mg += 25  # Open file
+                eg += 15
+            elif square_mask & pawn_entry.half_open_files[chess.WHITE]:
+                mg += 15  # Half-open file
+                eg += 10
 
             # Extra bonus for connected rooks
             for other_square in white_rooks:
@@ -1280,22 +3429,18 @@ class ChessAI:
                     if chess.square_file(square) == chess.square_file(other_square) or \
                             chess.square_rank(square) == chess.square_rank(other_square):
                         # Check if no pieces between rooks
-                        between_squares = chess.SquareSet(chess.between(square, other_square))
-                        if not any(self.board.piece_at(s) for s in between_squares):
-                            score += 20  # Connected rooks
+                        if not chess.between(square, other_square) & self.position.occupied:
+                            mg += 20  # Connected rooks
+                            eg += 10
 
         for square in black_rooks:
-            file_num = chess.square_file(square)
-            file_mask = chess.BB_FILES[file_num]
-
-            # Check if file has no pawns (open) or only enemy pawns (half-open)
-            white_pawns_in_file = white_pawns & chess.SquareSet(file_mask)
-            black_pawns_in_file = black_pawns & chess.SquareSet(file_mask)
-
-            if not white_pawns_in_file and not black_pawns_in_file:
-                score -= 25  # Open file
-            elif not black_pawns_in_file:
-                score -= 15  # Half-open file
+            square_mask = chess.BB_SQUARES[square]
+            if square_mask & pawn_entry.open_files:
+                mg -= 25  # Open file
+                eg -= 15
+            elif square_mask & pawn_entry.half_open_files[chess.BLACK]:
+                mg -= 15  # Half-open file
+                eg -= 10
 
             # Extra bonus for connected rooks
             for other_square in black_rooks:
@@ -1303,111 +3448,60 @@ class ChessAI:
                     if chess.square_file(square) == chess.square_file(other_square) or \
                             chess.square_rank(square) == chess.square_rank(other_square):
                         # Check if no pieces between rooks
-                        between_squares = chess.SquareSet(chess.between(square, other_square))
-                        if not any(self.board.piece_at(s) for s in between_squares):
-                            score -= 20  # Connected rooks
+                        if not chess.between(square, other_square) & self.position.occupied:
+                            mg -= 20  # Connected rooks
+                            eg -= 10
 
         # Outposts for knights and bishops
-        for square in chess.SQUARES:
-            piece = self.board.piece_at(square)
-            if not piece:
-                continue
-
+        board = self.position
+        minors = board.knights | board.bishops
+        pawns = board.pawns
+        for square in chess.scan_forward(minors & board.occupied_co[chess.WHITE]):
             rank = chess.square_rank(square)
             file = chess.square_file(square)
+            if rank >= 4:  # Advanced piece
+                # Check if square can be attacked by enemy pawns
+                is_outpost = not chess.BB_SQUARES[square] & pawn_entry.attack_spans[chess.BLACK]
+
+                # Check if supported by friendly pawn
+                support_squares = chess.BB_SQUARES[chess.square(max(0, file - 1), rank - 1)] | \
+                    chess.BB_SQUARES[chess.square(min(7, file + 1), rank - 1)]
+                pawn_support = support_squares & pawns & board.occupied_co[chess.WHITE]
+
+                if is_outpost:
+                    mg += 15  # Base outpost value
+                    eg += 10
+                    if pawn_support:
+                        mg += 10  # Additional value if supported by pawn
+                        eg += 5
+
+        for square in chess.scan_forward(minors & board.occupied_co[chess.BLACK]):
+            rank = chess.square_rank(square)
+            file = chess.square_file(square)
+            if rank <= 3:  # Advanced piece
+                # Check if square can be attacked by enemy pawns
+                is_outpost = not chess.BB_SQUARES[square] & pawn_entry.attack_spans[chess.WHITE]
 
-            # White outposts
-            if piece.color == chess.WHITE and piece.piece_type in [chess.KNIGHT, chess.BISHOP]:
-                if rank >= 4:  # Advanced piece
-                    is_outpost = True
-
-                    # Check if square can be attacked by enemy pawns
-                    for f in [max(0, file - 1), min(7, file + 1)]:
-                        for r in range(rank + 1, 8):
-                            pawn_square = chess.square(f, r)
-                            if self.board.piece_at(pawn_square) == chess.Piece(chess.PAWN, chess.BLACK):
-                                is_outpost = False
-                                break
-                        if not is_outpost:
-                            break
-
-                    # Check if supported by friendly pawn
-                    pawn_support = False
-                    for f in [max(0, file - 1), min(7, file + 1)]:
-                        if rank > 0:
-                            pawn_square = chess.square(f, rank - 1)
-                            if self.board.piece_at(pawn_square) == chess.Piece(chess.PAWN, chess.WHITE):
-                                pawn_support = True
-                                break
-
-                    if is_outpost:
-                        score += 15  # Base outpost value
-                        if pawn_support:
-                            score += 10  # Additional value if supported by pawn
-
-            # Black outposts
-            elif piece.color == chess.BLACK and piece.piece_type in [chess.KNIGHT, chess.BISHOP]:
-                if rank <= 3:  # Advanced piece
-                    is_outpost = True
-
-                    # Check if square can be attacked by enemy pawns
-                    for f in [max(0, file - 1), min(7, file + 1)]:
-                        for r in range(0, rank):
-                            pawn_square = chess.square(f, r)
-                            if self.board.piece_at(pawn_square) == chess.Piece(chess.PAWN, chess.WHITE):
-                                is_outpost = False
-                                break
-                        if not is_outpost:
-                            break
-
-                    # Check if supported by friendly pawn
-                    pawn_support = False
-                    for f in [max(0, file - 1), min(7, file + 1)]:
-                        if rank < 7:
-                            pawn_square = chess.square(f, rank + 1)
-                            if self.board.piece_at(pawn_square) == chess.Piece(chess.PAWN, chess.BLACK):
-                                pawn_support = True
-                                break
-
-                    if is_outpost:
-                        score -= 15  # Base outpost value
-                        if pawn_support:
-                            score -= 10  # Additional value if supported by pawn
+                # Check if supported by friendly pawn
+                support_squares = chess.BB_SQUARES[chess.square(max(0, file - 1), rank + 1)] | \
+                    chess.BB_SQUARES[chess.square(min(7, file + 1), rank + 1)]
+                pawn_support = support_squares & pawns & board.occupied_co[chess.BLACK]
 
-        return score
+                if is_outpost:
+                    mg -= 15  # Base outpost value
+                    eg -= 10
+                    if pawn_support:
+                        mg -= 10  # Additional value if supported by pawn
+                        eg -= 5
 
-    def _is_endgame(self):
-        """Enhanced endgame detection with material thresholds"""
-        # Count material for both sides
-        white_material = sum(self.piece_values[p.piece_type] for p in self.board.piece_map().values()
-                             if p.color == chess.WHITE and p.piece_type != chess.KING)
-        black_material = sum(self.piece_values[p.piece_type] for p in self.board.piece_map().values()
-                             if p.color == chess.BLACK and p.piece_type != chess.KING)
-
-        # Count queens
-        white_queens = len(self.board.pieces(chess.QUEEN, chess.WHITE))
-        black_queens = len(self.board.pieces(chess.QUEEN, chess.BLACK))
-
-        # Count minor pieces (knights and bishops)
-        white_minor = (len(self.board.pieces(chess.KNIGHT, chess.WHITE)) +
-                       len(self.board.pieces(chess.BISHOP, chess.WHITE)))
-        black_minor = (len(self.board.pieces(chess.KNIGHT, chess.BLACK)) +
-                       len(self.board.pieces(chess.BISHOP, chess.BLACK)))
-
-        # Endgame if:
-        # 1. No queens and at most one minor piece each, or
-        # 2. Both sides have <= 1300 material (excluding king), or
-        # 3. One side has queen and no other pieces, other side has <= one minor piece
-        return (
-                (white_queens == 0 and black_queens == 0 and white_minor <= 1 and black_minor <= 1) or
-                (white_material <= 1300 and black_material <= 1300) or
-                (white_queens == 1 and white_material - self.piece_values[
-                    chess.QUEEN] == 0 and black_minor <= 1 and black_queens == 0) or
-                (black_queens == 1 and black_material - self.piece_values[
-                    chess.QUEEN] == 0 and white_minor <= 1 and white_queens == 0)
-        )
+        return mg, eg
 
     def get_board_evaluation(self):
+        if self.board.is_checkmate():
+            return -MATE_SCORE
+        if self.board.is_stalemate() or self.board.is_insufficient_material():
+            return 0  # Draw
+        self._init_search_keys()
         return self._evaluate_position()
 
     def set_depth(self, depth):
@@ -1416,6 +3510,35 @@ class ChessAI:
     def set_time_limit(self, seconds):
         self.time_limit = max(1, seconds)
 
+    def set_clock(self, time_left, increment=0, moves_to_go=0):
+        """Use a game clock (seconds) for time management; time_left=None goes back to time_limit per move"""
+        self.clock = None if time_left is None else (time_left, increment, moves_to_go)
+
+    def set_hash_size(self, size_mb):
+        self._stop_pondering()  # The ponder search probes the table being reallocated
+        self.transposition_table.resize(size_mb)
+
+    def set_eval_cache_size(self, size_mb):
+        self._stop_pondering()  # The ponder search shares the cache
+        self.eval_cache.resize(size_mb)
+
+    def set_evaluator(self, evaluator):
+        """Evaluate positions with an Evaluator (e.g. nnue.NNUEEvaluator.load(path)); None = built-in terms"""
+        self._stop_pondering()
+        self.evaluator = evaluator
+        self.eval_cache.clear()  # Cached scores came from the previous evaluation
+
+    def set_threads(self, threads):
+        """Set the number of Lazy SMP search processes (1 = single-threaded search)"""
+        self._stop_pondering()  # The ponder search probes the table that may be replaced
+        self.threads = max(1, threads)
+        shared = isinstance(self.transposition_table, SharedTranspositionTable)
+        if self.threads > 1 and not shared:
+            self.transposition_table = SharedTranspositionTable(self.transposition_table.size_mb)
+        elif self.threads == 1 and shared:
+            self.transposition_table.close()
+            self.transposition_table = TranspositionTable(self.transposition_table.size_mb)
+
     def _find_stockfish(self):
         common_paths = []
         current_dir = os.path.dirname(__file__)
@@ -0,0 +1,327 @@
+"""Vectorized evaluation of many positions at once, for offline work (self-play scoring, EPD suites, tuning).
+
+Boards are converted once into a (N, 12) array of piece bitboards. Tapered material + PST is
+summed from table lookups (one per rank byte of the pawns, one per lowest set bit of the other
+pieces); the bishop pair and the tapered pawn structure terms of ChessAI are bitboard shifts and
+popcounts over the whole batch. Black's bitboards are mirrored (byteswapped) so that both sides
+share one pass wherever the tables are symmetric.
+Scores are from White's point of view and equal ChessAI._evaluate_psq() +
+ChessAI._evaluate_pawn_structure() for the same position.
+
+Usage:
+    python batch_eval.py [--positions N] [--epd FILE] [--scalar N] [--repeat N]
+    python -m pytest batch_eval.py
+
+Requires numpy >= 2.0 (np.bitwise_count).
+"""
+import argparse
+import itertools
+import operator
+import random
+import time
+
+import chess
+import numpy as np
+
+from ai import (BACKWARD_PAWN_PENALTY, BISHOP_PAIR_BONUS, DOUBLED_PAWN_PENALTY, ISOLATED_PAWN_PENALTY,
+                PASSED_PAWN_BONUS, PASSED_PAWN_RANK_BONUS, PAWN_CHAIN_BONUS, PHASE_MAX, PHASE_WEIGHTS, PSQ_EG,
+                PSQ_MG, SUPPORTED_PASSED_PAWN_BONUS, ChessAI)
+
+# Plane index of (color, piece type): white pawn .. white king, then black pawn .. black king
+PLANES = [(color, piece_type) for color in (chess.WHITE, chess.BLACK) for piece_type in chess.PIECE_TYPES]
+CHUNK_SIZE = 4096
+
+FILE_A = np.uint64(chess.BB_FILE_A)
+FILE_H = np.uint64(chess.BB_FILE_H)
+NOT_FILE_A = np.uint64(~chess.BB_FILE_A & chess.BB_ALL)
+NOT_FILE_H = np.uint64(~chess.BB_FILE_H & chess.BB_ALL)
+EDGE_FILES = FILE_A | FILE_H
+RANK_1 = np.uint64(chess.BB_RANK_1)
+
+
+def _south_fill(x):
+    x = x | (x >> 8)
+    x = x | (x >> 16)
+    return x | (x >> 32)
+
+
+def _north(x):
+    return x << 8
+
+
+def _south(x):
+    return x >> 8
+
+
+def _east(x):
+    return (x << 1) & NOT_FILE_A
+
+
+def _west(x):
+    return (x >> 1) & NOT_FILE_H
+
+
+def _pack(mg, eg):
+    """Middlegame score in the low and endgame score in the high 32 bits, so that one int64
+    addition sums both (see _split)"""
+    return np.int64(mg + (eg << 32))
+
+
+def _split(packed):
+    eg = (packed + (1 << 31)) >> 32
+    return packed - (eg << 32), eg
+
+
+def _build_psq_table():
+    """(12, 65) packed material + PST per plane and square. Square 64 is the zero entry hit once
+    a plane has run out of bits."""
+    table = np.zeros((12, 65), dtype=np.int64)
+    for plane, (color, piece_type) in enumerate(PLANES):
+        table[plane, :64] = [_pack(mg, eg) for mg, eg in zip(PSQ_MG[piece_type][color], PSQ_EG[piece_type][color])]
+    return table
+
+
+PSQ_TABLE = _build_psq_table()
+# Pawns only stand on ranks 2-7 and are the most numerous pieces: sum each rank byte with one lookup
+# into a (8, 256) table per pawn plane rather than walking the bits
+_BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1, bitorder='little').astype(np.int64)
+PAWN_RANK_TABLES = {plane: np.stack([_BYTE_BITS @ PSQ_TABLE[plane, 8 * rank:8 * rank + 8] for rank in range(8)])
+                    for plane in (0, 6)}
+# Piece types whose Black values are the negated White values of the vertically mirrored square:
+# Black's bitboard is byteswapped and looked up in White's table together with White's pieces
+MIRRORED_PIECE_TYPES = [piece_type for piece_type in chess.PIECE_TYPES
+                        if all(psq[piece_type][chess.BLACK][square] == -psq[piece_type][chess.WHITE][square ^ 56]
+                               for psq in (PSQ_MG, PSQ_EG) for square in chess.SQUARES)]
+# Small integer weights are summed exactly by float32 matrix products, far faster than integer ones
+PLANE_PHASE = np.array([PHASE_WEIGHTS[piece_type] for _, piece_type in PLANES], dtype=np.float32)
+# Weight of each count returned by _pawn_counts, packed like PSQ_TABLE
+PAWN_TERM_WEIGHTS = [_pack(*PAWN_CHAIN_BONUS), _pack(*PASSED_PAWN_BONUS), _pack(*SUPPORTED_PASSED_PAWN_BONUS),
+                     _pack(-DOUBLED_PAWN_PENALTY[0], -DOUBLED_PAWN_PENALTY[1]),
+                     _pack(-ISOLATED_PAWN_PENALTY[0], -ISOLATED_PAWN_PENALTY[1]),
+                     _pack(-BACKWARD_PAWN_PENALTY[0], -BACKWARD_PAWN_PENALTY[1])]
+# Squared relative rank of each byte (rank) of a White bitboard, weighted like PASSED_PAWN_RANK_BONUS
+PASSED_RANK_WEIGHTS = [_pack(rank * rank * PASSED_PAWN_RANK_BONUS[0], rank * rank * PASSED_PAWN_RANK_BONUS[1])
+                       for rank in range(8)]
+ONE = np.uint64(1)
+
+_get_pieces = operator.attrgetter("pawns", "knights", "bishops", "rooks", "queens", "kings")
+
+
+def boards_to_bitboards(boards):
+    """Convert boards to a (N, 12) uint64 array of piece bitboards (see PLANES)"""
+    count = len(boards)
+    pieces = np.fromiter(itertools.chain.from_iterable(map(_get_pieces, boards)), dtype=np.uint64,
+                         count=6 * count).reshape(count, 6).T
+    white = np.array([board.occupied_co[chess.WHITE] for board in boards], dtype=np.uint64)
+    # Built plane by plane and returned transposed, so evaluate_bitboards gets its rows without a copy
+    return np.concatenate([pieces & white, pieces & ~white]).T
+
+
+def boards_to_planes(boards):
+    """Convert boards to a (N, 12, 64) uint8 array of piece planes (see PLANES)"""
+    return _unpack(boards_to_bitboards(boards)).reshape(len(boards), 12, 64)
+
+
+def _unpack(bitboards):
+    return np.unpackbits(bitboards.astype('<u8').view(np.uint8), axis=-1, bitorder='little')
+
+
+def _add_piece_squares(total, plane, pieces, count):
+    """Add the PSQ_TABLE entries of plane for the set bits of pieces (at most count per bitboard):
+    a byte lookup per pawn rank, otherwise one lookup per piece, lowest set bit first"""
+    if plane in PAWN_RANK_TABLES:
+        rank_bytes = pieces.view(np.uint8).reshape(*pieces.shape, 8)
+        for rank in range(1, 7):
+            total += PAWN_RANK_TABLES[plane][rank].take(rank_bytes[..., rank])
+        return
+    table = PSQ_TABLE[plane]
+    for _ in range(min(count, 3) - 1):
+        rest = pieces & (pieces - ONE)
+        total += table.take(np.bitwise_count((pieces ^ rest) - ONE))
+        pieces = rest
+    if count > 2:
+        # Only promotions leave more than two of a piece: finish just the bitboards that still have bits
+        rows = np.flatnonzero(pieces)
+        extra = np.zeros(len(rows), dtype=np.int64)
+        _add_piece_squares(extra, plane, pieces.reshape(-1)[rows], count - 2)
+        total.reshape(-1)[rows] += extra
+    elif count:
+        total += table.take(np.bitwise_count(pieces - ONE))  # The last piece is the lowest bit
+
+
+def _psq_scores(planes, counts):
+    """Middlegame and endgame material + PST of (12, N) planes"""
+    total = np.zeros(planes.shape[1], dtype=np.int64)
+    sides = np.zeros((2, planes.shape[1]), dtype=np.int64)  # White's and mirrored Black's pieces
+    for piece_type in chess.PIECE_TYPES:
+        white, black = PLANES.index((chess.WHITE, piece_type)), PLANES.index((chess.BLACK, piece_type))
+        if piece_type in MIRRORED_PIECE_TYPES:
+            pieces = np.stack([planes[white], planes[black].byteswap()])
+            _add_piece_squares(sides, white, pieces, max(counts[white].max(), counts[black].max()))
+        else:
+            _add_piece_squares(total, white, planes[white], counts[white].max())
+            _add_piece_squares(total, black, planes[black], counts[black].max())
+    return _split(total + sides[0] - sides[1])
+
+
+def _pawn_counts(own, enemy, occupied):
+    """Pawn structure term counts of White's side, mirroring ChessAI._compute_pawn_entry (plus the
+    blocked backward pawns of _pawn_structure_scores) with shifts instead of per-square masks.
+    Black's side is counted on vertically mirrored bitboards.
+
+    Returns the counts weighted by PAWN_TERM_WEIGHTS and the passed pawns. As in ChessAI,
+    a pawn on an edge file treats its own file as its missing neighbour for passed-pawn support,
+    backward pawns and stop-square attacks.
+    """
+    count = np.bitwise_count
+
+    # Doubled pawns: every pawn beyond the first on its file
+    own_fill = _south_fill(own)
+    file_set = own_fill & RANK_1
+    doubled = count(own) - count(file_set)
+
+    # Pawn chains: one bonus per diagonal defender from behind
+    pushed = _north(own)
+    defended_east = _east(pushed)
+    defended_west = _west(pushed)
+    defended = count(own & defended_east) + count(own & defended_west)
+
+    # Passed pawns: not inside the front span of any enemy pawn
+    enemy_front = _south(_south_fill(enemy))
+    passed_pawns = own & ~(enemy_front | _east(enemy_front) | _west(enemy_front))
+    supported = (count(passed_pawns & defended_east) + count(passed_pawns & defended_west)
+                 + count(passed_pawns & pushed & EDGE_FILES))
+
+    # Isolated pawns: no friendly pawn on an adjacent file
+    isolated = count(own & ~((_east(file_set) | _west(file_set)) * FILE_A))
+
+    # Backward pawns: a friendly pawn ahead on a neighbouring file, stop square blocked or attacked
+    own_rear = _south(own_fill)
+    more_advanced = _east(own_rear) | _west(own_rear) | (own_rear & EDGE_FILES)
+    two_ahead = enemy >> np.uint64(16)
+    attacked = _east(two_ahead) | _west(two_ahead) | (two_ahead & EDGE_FILES)
+    backward = count(own & more_advanced & (_south(occupied) | attacked))
+
+    return (defended, count(passed_pawns), supported, doubled, isolated, backward), passed_pawns
+
+
+def _pawn_scores(white_pawns, black_pawns, occupied):
+    """Middlegame and endgame pawn structure scores of White minus Black"""
+    # Mirroring the ranks (byte order) turns Black's pawns into White's, so both sides share one pass
+    own = np.stack([white_pawns, black_pawns.byteswap()])
+    enemy = own[::-1].byteswap()
+    counts, passed_pawns = _pawn_counts(own, enemy, np.stack([occupied, occupied.byteswap()]))
+    total = sum(weight * term_count for weight, term_count in zip(PAWN_TERM_WEIGHTS, counts))
+    # Passed pawns never stand on the first or last rank
+    ranks = np.bitwise_count(passed_pawns.view(np.uint8)).reshape(2, -1, 8)
+    total += sum(PASSED_RANK_WEIGHTS[rank] * ranks[:, :, rank] for rank in range(1, 7))
+    return _split(total[0] - total[1])
+
+
+def evaluate_bitboards(bitboards):
+    """Tapered material + PST, bishop pair and pawn structure of a (N, 12) bitboard array"""
+    planes = np.ascontiguousarray(bitboards.T, dtype='<u8')  # One little-endian row per plane
+    counts = np.bitwise_count(planes)
+    mg, eg = _psq_scores(planes, counts)
+    phase = np.minimum((PLANE_PHASE @ counts.astype(np.float32)).astype(np.int64), PHASE_MAX)
+    score = (mg * phase + eg * (PHASE_MAX - phase)) // PHASE_MAX
+
+    # Bishop pair bonus
+    score += BISHOP_PAIR_BONUS * ((counts[2] >= 2).astype(np.int64) - (counts[8] >= 2))
+
+    # Pawn structure, tapered on its own like ChessAI._evaluate_pawn_structure
+    occupied = np.bitwise_or.reduce(planes)
+    pawn_mg, pawn_eg = _pawn_scores(planes[0], planes[6], occupied)
+    score += (pawn_mg * phase + pawn_eg * (PHASE_MAX - phase)) // PHASE_MAX
+    return score
+
+
+def evaluate_boards(boards, chunk_size=CHUNK_SIZE):
+    """Scores of a list of boards from White's point of view, processed in chunks to bound memory"""
+    scores = [evaluate_bitboards(boards_to_bitboards(boards[i:i + chunk_size]))
+              for i in range(0, len(boards), chunk_size)]
+    return np.concatenate(scores) if scores else np.zeros(0, dtype=np.int64)
+
+
+def random_positions(count, seed=1, max_plies=80):
+    """Positions from random playouts of the starting position"""
+    rng = random.Random(seed)
+    boards = []
+    board = chess.Board()
+    while len(boards) < count:
+        moves = list(board.legal_moves)
+        if not moves or board.ply() >= max_plies:
+            board = chess.Board()
+            continue
+        board.push(rng.choice(moves))
+        boards.append(board.copy(stack=False))
+    return boards
+
+
+def scalar_score(ai, board):
+    """The terms evaluate_boards covers, computed by ChessAI: PST accumulators built from the board,
+    then material + PST + bishop pair and pawn structure (get_board_evaluation() does much more)"""
+    ai.board = board
+    ai._init_psq()
+    return ai._evaluate_psq() + ai._evaluate_pawn_structure()
+
+
+def test_batch_matches_scalar():
+    """Batch scores equal the scalar ones, promoted pieces included (for pytest)"""
+    boards = random_positions(2000, seed=7) + [
+        chess.Board("QQQQ4/8/8/8/8/8/qqqk4/K7 w - - 0 1"),
+        chess.Board("BBB5/BNNN4/RRR5/8/8/8/8/K6k w - - 0 1"),
+        chess.Board("k7/1P1P4/8/8/8/8/PPPPPPPP/K7 w - - 0 1"),
+    ]
+    ai = ChessAI(opening_book_path=None, enable_stockfish=False)
+    assert list(evaluate_boards(boards, chunk_size=512)) == [scalar_score(ai, board) for board in boards]
+
+
+def load_epd(path):
+    """Boards from an EPD or FEN-per-line file"""
+    boards = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                boards.append(chess.Board(" ".join(line.split()[:4]) + " 0 1"))
+    return boards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy batched evaluation")
+    parser.add_argument("--positions", type=int, default=100000, help="random positions to evaluate")
+    parser.add_argument("--epd", help="evaluate the positions of an EPD file instead")
+    parser.add_argument("--scalar", type=int, default=2000, help="positions timed through the scalar path")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each path, the fastest is reported")
+    args = parser.parse_args()
+
+    boards = load_epd(args.epd) if args.epd else random_positions(args.positions)
+
+    ai = ChessAI(opening_book_path=None, enable_stockfish=False)
+    sample = boards[:args.scalar]
+
+    # The runs of both paths alternate so that they see the same machine load
+    batch_time = scalar_time = float("inf")
+    for _ in range(args.repeat):
+        start = time.time()
+        scores = evaluate_boards(boards)
+        batch_time = min(batch_time, time.time() - start)
+
+        ai.pawn_table.clear()  # Every run starts cold, like the first
+        start = time.time()
+        scalar_scores = [scalar_score(ai, board) for board in sample]
+        scalar_time = min(scalar_time, time.time() - start)
+    batch_rate = len(boards) / batch_time if batch_time else 0
+    mismatches = sum(1 for expected, score in zip(scalar_scores, scores) if expected != score)
+    scalar_rate = len(sample) / scalar_time if scalar_time else 0
+
+    print(f"Batch  : {len(boards)} positions in {batch_time:.2f}s ({batch_rate:.0f} positions/s)")
+    print(f"Scalar : {len(sample)} positions in {scalar_time:.2f}s ({scalar_rate:.0f} positions/s, "
+          f"_evaluate_psq + _evaluate_pawn_structure)")
+    print(f"Speedup: {batch_rate / scalar_rate if scalar_rate else 0:.0f}x")
+    print(f"Covered terms differing from the scalar evaluation: {mismatches}/{len(sample)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Search benchmarks for the internal AI (see engines/stockfish/src/benchmark.cpp).
+
+Usage:
+    python benchmark.py bench [--depth N | --nodes N] [--nnue FILE]
+    python benchmark.py smp [--time SECONDS] [--threads 1 2 4 8]
+    python -m pytest benchmark.py
+"""
+import argparse
+import os
+import time
+
+import chess
+
+from ai import ChessAI, SearchLimits
+
+# A small set of opening, middlegame and endgame positions
+BENCH_POSITIONS = [
+    chess.STARTING_FEN,
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 11",
+    "4rrk1/pp1n3p/3q2pQ/2p1pb2/2PP4/2P3N1/P2B2PP/4RRK1 b - - 7 19",
+    "rq3rk1/ppp2ppp/1bnpb3/3N2B1/3NP3/7P/PPPQ1PP1/2KR3R w - - 7 14",
+    "r1bq1r1k/1pp1n1pp/1p1p4/4p2Q/4Pp2/1BNP4/PPP2PPP/3R1RK1 w - - 2 14",
+    "6k1/6p1/6Pp/ppp5/3pn2P/1P3K2/1PP2P2/3N4 b - - 0 1",
+    "3b4/5kp1/1p1p1p1p/pP1PpP1P/P1P1P3/3KN3/8/8 w - - 0 1",
+]
+
+
+def bench(depth=None, nodes=None, nnue_path=None):
+    """Fixed depth or node search of every bench position; the total node count is a reproducible signature"""
+    if depth is None and nodes is None:
+        depth = 4
+    ai = ChessAI(time_limit=60, opening_book_path=None, enable_stockfish=False)
+    if nnue_path:
+        from nnue import NNUEEvaluator  # Needs numpy, only imported when a network is benched
+        ai.set_evaluator(NNUEEvaluator.load(nnue_path))
+    total_nodes = 0
+    total_time = 0.0
+    for index, fen in enumerate(BENCH_POSITIONS, 1):
+        ai.reset_board()
+        ai.board.set_fen(fen)
+        start = time.time()
+        move = ai.get_ai_move(SearchLimits(depth=depth, nodes=nodes))
+        elapsed = time.time() - start
+        total_time += elapsed
+        total_nodes += ai.nodes_searched
+        print(f"Position {index}/{len(BENCH_POSITIONS)}: {move.uci() if move else '(none)'} "
+              f"nodes {ai.nodes_searched} time {elapsed:.2f}s")
+    print("===========================")
+    print(f"Total time (s) : {total_time:.2f}")
+    print(f"Nodes searched : {total_nodes}")
+    print(f"Nodes/second   : {total_nodes / total_time if total_time else 0:.0f}")
+
+
+def bench_smp(seconds, thread_counts):
+    """Search every bench position for a fixed time per thread count and report NPS scaling"""
+    # Helpers are processes: more threads than CPU cores only share the cores, nps can't scale past them
+    print(f"CPU cores: {os.cpu_count()}")
+    print(f"{'threads':>7} {'nodes':>10} {'time':>8} {'nps':>10} {'speedup':>8}")
+    base_nps = None
+    for threads in thread_counts:
+        ai = ChessAI(depth=64, time_limit=seconds, opening_book_path=None, threads=threads,
+                     enable_stockfish=False)
+        total_nodes = 0
+        total_time = 0.0
+        for fen in BENCH_POSITIONS:
+            ai.reset_board()
+            ai.board.set_fen(fen)
+            start = time.time()
+            ai.get_ai_move()
+            total_time += time.time() - start
+            total_nodes += ai.nodes_searched
+        nps = total_nodes / total_time if total_time else 0
+        base_nps = base_nps or nps
+        print(f"{threads:>7} {total_nodes:>10} {total_time:>8.2f} {nps:>10.0f} {nps / base_nps:>7.2f}x")
+
+
+def test_mate_limit_without_mate():
+    """A mate-only search returns a move when there is no mate to find (for pytest)"""
+    ai = ChessAI(time_limit=60, opening_book_path=None, enable_stockfish=False)
+    ai.board.set_fen(BENCH_POSITIONS[2])
+    move = ai.get_ai_move(SearchLimits(mate=2))
+    assert move in ai.board.legal_moves
+    assert ai.completed_depth <= 6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChessAI search benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bench_parser = subparsers.add_parser("bench", help="deterministic fixed depth/node search")
+    bench_limit = bench_parser.add_mutually_exclusive_group()
+    bench_limit.add_argument("--depth", type=int, help="search depth per position (default 4)")
+    bench_limit.add_argument("--nodes", type=int, help="node limit per position")
+    bench_parser.add_argument("--nnue", help="evaluate with this network file (see train_nnue.py)")
+
+    smp_parser = subparsers.add_parser("smp", help="Lazy SMP nodes-per-second scaling")
+    smp_parser.add_argument("--time", type=float, default=5, help="seconds per position")
+    smp_parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+
+    args = parser.parse_args()
+    if args.command == "bench":
+        bench(args.depth, args.nodes, args.nnue)
+    elif args.command == "smp":
+        bench_smp(args.time, args.threads)
+
+
+if __name__ == "__main__":
+    main()
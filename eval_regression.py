@@ -0,0 +1,139 @@
+"""Evaluation regression positions: scores of the pre-bitboard evaluation code, for refactors that must not change them.
+
+PAWN_STRUCTURE_POSITIONS holds the scores of the original square-by-square
+_evaluate_pawn_structure() (before the bitboard masks and the pawn hash table),
+White's point of view, for bench and perft positions, hand-made edge-file,
+doubled, isolated, passed and backward pawn cases, and random-playout positions.
+The original weights are now the middlegame half of the tapered pawn terms, so
+the middlegame score is what must still match. The eval cache must not change them
+either: test_eval_cache_move_number checks that positions differing only in the
+move number, which decides the opening development term, are cached apart.
+
+Usage:
+    python eval_regression.py
+    python -m pytest eval_regression.py
+"""
+import sys
+
+import chess
+
+from ai import ChessAI
+
+# FEN and score of the original pawn structure evaluation
+PAWN_STRUCTURE_POSITIONS = [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 0),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 10", -10),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 11", -35),
+    ("4rrk1/pp1n3p/3q2pQ/2p1pb2/2PP4/2P3N1/P2B2PP/4RRK1 b - - 7 19", -15),
+    ("rq3rk1/ppp2ppp/1bnpb3/3N2B1/3NP3/7P/PPPQ1PP1/2KR3R w - - 7 14", 10),
+    ("r1bq1r1k/1pp1n1pp/1p1p4/4p2Q/4Pp2/1BNP4/PPP2PPP/3R1RK1 w - - 2 14", 5),
+    ("6k1/6p1/6Pp/ppp5/3pn2P/1P3K2/1PP2P2/3N4 b - - 0 1", -30),
+    ("3b4/5kp1/1p1p1p1p/pP1PpP1P/P1P1P3/3KN3/8/8 w - - 0 1", -10),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", -10),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", -35),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", -5),
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", 87),
+    ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", 0),
+    ("4k3/8/8/8/8/P7/P7/4K3 w - - 0 1", -5),
+    ("4k3/8/8/P6P/8/8/8/4K3 w - - 0 1", 64),
+    ("4k3/p6p/8/8/8/8/8/4K3 b - - 0 1", -4),
+    ("4k3/2p5/8/1P1P4/8/8/8/4K3 w - - 0 1", -20),
+    ("4k3/8/2p5/8/1P6/P7/8/4K3 w - - 0 1", 53),
+    ("4k3/pp6/8/1P6/P7/8/8/4K3 w - - 0 1", 5),
+    ("4k3/8/8/3p4/3P4/8/8/4K3 w - - 0 1", 0),
+    ("4k3/1p6/1P6/8/8/8/8/4K3 w - - 0 1", 0),
+    ("4k3/8/8/8/8/8/PPPPPPPP/4K3 w - - 0 1", 176),
+    ("4k3/pppppppp/8/8/8/8/8/4K3 w - - 0 1", -176),
+    ("4k3/7p/6pP/6P1/8/8/8/4K3 w - - 0 1", 0),
+    ("4k3/p7/P7/1P6/8/8/8/4K3 w - - 0 1", 15),
+    ("4k3/6P1/7P/8/8/p7/1p6/4K3 w - - 0 1", 0),
+    ("8/k7/8/2PPP3/8/8/5K2/8 w - - 0 1", 156),
+    ("8/5k2/3ppp2/8/8/3PPP2/5K2/8 w - - 0 1", 0),
+    ("rnB1k1nr/4ppbp/p1ppq1p1/1p6/1P2P3/5PPN/PBPP3P/RN1Q1RK1 w kq - 2 12", 5),
+    ("1r5r/3kpp1p/n2p1np1/1pP5/3PP3/2P3PN/P4R1P/RNb2QK1 w - - 1 23", -25),
+    ("1r1k3r/4pR1p/n2p2p1/1pP5/3Pn3/N1P3PN/P6P/R1b2Q1K b - - 2 25", -30),
+    ("rk5r/5R1p/n1Pp2p1/1p2p3/3P4/N1PQ2PN/P7/R1b3K1 w - - 0 32", 20),
+    ("1k6/2R4r/2P2rpN/1p3n2/2P1p1P1/R4N2/P7/7K w - - 12 57", -17),
+    ("1k6/2R2r1r/2P3pN/1p2Nn2/2P1p1P1/4R3/P7/7K b - - 15 58", -17),
+    ("r1bqkb1r/p4p2/2n1p2n/1ppp2pp/2P2PP1/PP1PB3/4P2P/RN1QKBNR b KQkq - 0 10", -15),
+    ("r1bq1b2/p2k1p1r/2n1p3/1ppp1np1/2P3p1/PP1PB2B/2Q1P2P/RN2K1NR b KQ - 1 14", -30),
+    ("rnb2b2/2k2p1r/p2np3/qpp3p1/1PPp2p1/P2P4/2Q1P1BP/RN1KB1NR b - - 13 25", -15),
+    ("rn6/1bk1b1n1/p3pp2/qPp3pr/1P1p2p1/P1NP1B2/2K1P2P/R1Q1B1NR b - - 4 32", 0),
+    ("rn1k4/4b1n1/1q6/1p2pppr/1Ppp4/P1NP1Qp1/1R2PB1P/3K2NR b - - 0 44", -5),
+    ("1n3b2/4k1nQ/7q/1P4pr/rRpN4/3P2pN/4P2P/2K4R b - - 1 58", 114),
+    ("r1q1k2r/1b3n2/ppPp4/bn3ppp/P6P/R1N1K1P1/1P2PP2/2BQ2RB w kq - 2 26", 90),
+    ("r1q1k3/1b3n2/ppPp3r/1P3ppp/7P/RPb1KPP1/4P3/2BQ2RB b q - 0 28", 70),
+    ("r1q1k3/1b3n2/ppPpr3/1P3ppp/7P/RPb1KPP1/4P3/2BQ2RB w q - 1 29", 70),
+    ("2q1k3/rbP2n2/pp1p1b2/1P2rppp/4P2P/RP3PP1/5K2/2BQ2RB w - - 1 32", 77),
+    ("q5kb/r4n2/ppbpP3/1PB2ppp/4P2P/1P4P1/3QK3/R2R3B b - - 0 42", -25),
+    ("3q2kb/r4n2/pp1pP3/1bB2ppp/4P2P/1P4P1/2QK4/R2R3B w - - 6 46", 10),
+    ("1n2kbnr/r1pqpp2/3pb1pp/1p6/p3P3/PPPPBB2/5PPP/RN1QK1NR b k - 1 11", -5),
+    ("4kbnr/B1pbpp2/q2p2pp/1p1n4/P2PP3/P1P2B2/R1Q2PPP/1N3KNR b k - 0 19", -95),
+    ("4kbnr/2p1pp2/3p3p/qP1P2N1/3P1Pb1/2P5/1R2B1PP/1NQ2K1R w - - 1 28", 20),
+    ("4kb1r/4pp1N/3p1n2/1pqP1P1p/3P3Q/2PB1b2/1R4PP/1N3K1R w - - 2 35", 25),
+    ("4kb1r/4pp1N/3p4/1p1P1P2/2qP2n1/2P4Q/1Rb3PP/1N3K1R w - - 3 40", 27),
+    ("4k2r/4ppb1/3p4/1p1P1PN1/3P2n1/2Pb3Q/1R4PP/1N3K1R w - - 3 43", 27),
+    ("4k3/4ppbr/3p4/1p1P1PN1/3P2n1/2Pb2Q1/4R1PP/1N3K1R b - - 6 44", 17),
+    ("4kb1r/4pN2/3p4/1p1P1P2/3P3Q/2Pb4/4R1PR/1N3K2 w - - 1 48", 27),
+    ("3k1b2/8/3pp3/3P1P1r/1p1P4/2P2N2/2b1KRPR/1N6 b - - 1 54", 32),
+    ("3k4/4b3/3pp3/3P1P1r/1p1P4/2P2N2/2b1KRPR/1N6 w - - 2 55", 32),
+    ("8/2k1b3/3pp3/3P1P2/1p1P2Pr/2P2N2/2b1KR1R/1N6 w - - 5 58", 53),
+    ("rn2k2r/pb1p2pp/2pb3n/q1Q5/2Pp1B1P/5Pp1/PP2P2R/RN1K1BN1 w kq - 2 15", -20),
+    ("rnb1k1r1/2b3pp/pQpp3P/8/2Pp4/2q2Pp1/PP1BP2R/RN1K1BN1 b q - 4 21", -35),
+    ("rn2k2r/2bb2pp/pQpp3P/8/2Pp1B2/2N2Pp1/PP2P2R/R2K1BN1 b q - 2 23", -35),
+    ("rn2k2r/2b3pp/pQpp3P/8/2Pp1B2/2N2Ppb/PP2P2R/R2K1BN1 w q - 3 24", -35),
+    ("r4k1r/7p/p1n4p/2pNp1b1/QPPp1P2/P3P1p1/4K1B1/R5N1 w - - 1 36", -85),
+    ("r2b3r/5k1p/p1n4p/2pNp3/QPPp1P2/P3PKp1/R5B1/6N1 w - - 5 38", -85),
+    ("rn1b3r/5k1p/p6p/2PNp3/Q1Pp1P2/P3PK2/R5p1/5BN1 w - - 0 40", -92),
+    ("rqb1kb1r/1p2p3/p4npn/2PP2P1/4pP1p/P3K2P/1P2P1BR/R1B2QN1 b q - 0 22", 50),
+    ("r3kb1r/1p1bp3/p1q3pn/2PP1PP1/1P2p1Pp/P3K3/1B2P1BR/R4QN1 b q - 2 28", -12),
+    ("r2k1b1r/3bpn2/ppq3p1/2PP1PP1/1P1Bp1Pp/P3K2B/4P2R/R4QN1 w - - 2 31", -17),
+    ("r2k1b1r/3bp3/pPq5/3PnpP1/1P1Bp1Pp/P3K2B/4P2R/R3Q1N1 w - - 0 33", 55),
+]
+
+
+def pawn_structure_mismatches(ai=None):
+    """Positions whose middlegame pawn structure score differs from the original, as (fen, ours, expected)"""
+    ai = ai or ChessAI(opening_book_path=None, enable_stockfish=False)
+    mismatches = []
+    for fen, expected in PAWN_STRUCTURE_POSITIONS:
+        ai.board.set_fen(fen)
+        ai._init_search_keys()
+        score, _ = ai._pawn_structure_scores()
+        if score != expected:
+            mismatches.append((fen, score, expected))
+    return mismatches
+
+
+def test_pawn_structure_regression():
+    """The pawn structure evaluation matches the original on every regression position (for pytest)"""
+    assert pawn_structure_mismatches() == []
+
+
+def test_eval_cache_move_number():
+    """Cached evaluations equal fresh ones when only the move number (opening or not) differs (for pytest)"""
+    ai = ChessAI(opening_book_path=None, enable_stockfish=False)
+    # White has developed two minor pieces, Black one: the development term applies only in the opening
+    fens = ["r1bqkbnr/pppppppp/2n5/8/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 {}".format(fullmove)
+            for fullmove in (3, 30)]
+    scores = []
+    for fen in fens + fens:
+        ai.board = chess.Board(fen)
+        ai._init_search_keys()
+        scores.append(ai._evaluate_position())
+    assert scores[0] != scores[1]
+    assert scores[2:] == scores[:2]
+    assert ai.eval_tiers[0] == 2  # The second round came from the cache
+
+
+def main():
+    mismatches = pawn_structure_mismatches()
+    for fen, ours, expected in mismatches:
+        print(f"Mismatch {fen}: {ours} (original {expected})")
+    print(f"Pawn structure: {len(PAWN_STRUCTURE_POSITIONS) - len(mismatches)}/{len(PAWN_STRUCTURE_POSITIONS)} "
+          f"positions match the original evaluation")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""NNUE-style evaluation for ChessAI (see engines/stockfish/src/nnue).
+
+A small HalfKA network: for each perspective, every piece on the board (kings included)
+is a feature of (king bucket, piece, square), the board being flipped for Black and
+mirrored so that the perspective's king stands on files e-h. The feature transformer
+sums the active weight rows into an int16 accumulator per perspective; like
+nnue_accumulator.cpp, the accumulators are updated incrementally on make/unmake and only
+refreshed from scratch when a king move changes its own bucket or mirroring. The two
+accumulators (side to move first) go through clipped ReLU, one int8 hidden layer and an
+int8 output layer. As in HalfKAv2, every feature also has a PSQT weight summed per
+perspective next to the accumulator; half the difference of the two sums is added to the
+output, so material and piece-square values need not pass through the hidden layer.
+
+Experimental: no trained network ships with ChessAI, and the networks train_nnue.py
+produces so far evaluate worse than the hand-written evaluation of ai.py (higher mean
+error against search scores), so the hand-written evaluation stays the default.
+
+Usage:
+    from nnue import NNUEEvaluator
+    ai.set_evaluator(NNUEEvaluator.load("chessai.nnue"))
+    python -m pytest nnue.py
+
+Weights are trained by train_nnue.py. Requires numpy.
+"""
+import os
+import random
+import struct
+import tempfile
+
+import chess
+import numpy as np
+
+from ai import Evaluator, Position
+
+# Oriented king square (perspective at the bottom, king on files e-h) -> king bucket
+KING_BUCKETS = [0] * 8 + [1] * 8 + [2] * 16 + [3] * 32
+NUM_KING_BUCKETS = 4
+NUM_FEATURES = NUM_KING_BUCKETS * 12 * 64
+
+QA = 127  # Accumulator / activation scale: 1.0 = 127
+QB = 64  # Hidden and output weight scale: 1.0 = 64
+QB_SHIFT = 6
+OUTPUT_SCALE = 400  # Centipawns per unit of network output
+
+FILE_MAGIC = b"CNUE"
+FILE_VERSION = 1
+HEADER = struct.Struct("<4sIIII")  # magic, version, features, accumulator size, hidden size
+
+
+def _build_orientations():
+    """ORIENTATIONS[perspective][king square] = (square xor, feature offset)"""
+    orientations = [[None] * 64, [None] * 64]
+    for perspective in chess.COLORS:
+        for king_square in chess.SQUARES:
+            flip = 0 if perspective == chess.WHITE else 56
+            oriented_king = king_square ^ flip
+            if chess.square_file(oriented_king) < 4:
+                flip ^= 7
+                oriented_king ^= 7
+            orientations[perspective][king_square] = (flip, KING_BUCKETS[oriented_king] * 768)
+    return orientations
+
+
+ORIENTATIONS = _build_orientations()
+
+
+def feature_index(perspective, orient, color, piece_type, square):
+    """Index of a piece on a square in the perspective's feature set"""
+    flip, offset = orient
+    return offset + (2 * (piece_type - 1) + (color != perspective)) * 64 + (square ^ flip)
+
+
+def board_features(board, perspective):
+    """Active feature indices of the board for one perspective"""
+    orient = ORIENTATIONS[perspective][board.king(perspective)]
+    return [feature_index(perspective, orient, piece.color, piece.piece_type, square)
+            for square, piece in board.piece_map().items()]
+
+
+class NNUENetwork:
+    """Quantized network weights and the forward pass"""
+
+    def __init__(self, ft_weights, ft_bias, psqt_weights, hidden_weights, hidden_bias, output_weights,
+                 output_bias):
+        self.ft_weights = np.asarray(ft_weights, dtype=np.int16)  # (NUM_FEATURES, accumulator size)
+        self.ft_bias = np.asarray(ft_bias, dtype=np.int16)
+        self.psqt_weights = np.asarray(psqt_weights, dtype=np.int32)  # (NUM_FEATURES,), output units
+        self.hidden_weights = np.asarray(hidden_weights, dtype=np.int8)  # (2 * size, hidden)
+        self.hidden_bias = np.asarray(hidden_bias, dtype=np.int32)
+        self.output_weights = np.asarray(output_weights, dtype=np.int8)  # (hidden,)
+        self.output_bias = int(output_bias)
+        if self.ft_weights.shape[0] != NUM_FEATURES:
+            raise ValueError(f"Network has {self.ft_weights.shape[0]} input features, expected {NUM_FEATURES}")
+        if 2 * self.ft_weights.shape[1] * QA * 127 + int(np.abs(self.hidden_bias).max(initial=0)) >= 1 << 24:
+            raise ValueError("Hidden layer sums may exceed 2 ** 24 (accumulator size or biases too large)")
+        # PSQT sums are plain Python integers, cheaper than numpy scalars
+        self.psqt_list = self.psqt_weights.tolist()
+        # float32 copies for BLAS: every product and partial sum is an integer below 2 ** 24,
+        # so the float forward pass gives exactly the integer results
+        self.hidden_weights_f32 = self.hidden_weights.astype(np.float32)
+        self.hidden_bias_f32 = self.hidden_bias.astype(np.float32)
+        self.output_weights_f32 = self.output_weights.astype(np.float32)
+
+    @classmethod
+    def load(cls, path):
+        """Read a network written by save()"""
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, features, size, hidden = HEADER.unpack_from(data)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError(f"{path} is not a version {FILE_VERSION} ChessAI NNUE file")
+        offset = HEADER.size
+        arrays = []
+        for dtype, count in ((np.int16, features * size), (np.int16, size), (np.int32, features),
+                             (np.int8, 2 * size * hidden), (np.int32, hidden), (np.int8, hidden), (np.int32, 1)):
+            arrays.append(np.frombuffer(data, dtype=np.dtype(dtype).newbyteorder("<"), count=count, offset=offset))
+            offset += arrays[-1].nbytes
+        if offset != len(data):
+            raise ValueError(f"{path} has {len(data) - offset} unexpected trailing bytes")
+        ft_weights, ft_bias, psqt_weights, hidden_weights, hidden_bias, output_weights, output_bias = arrays
+        return cls(ft_weights.reshape(features, size), ft_bias, psqt_weights, hidden_weights.reshape(2 * size, hidden),
+                   hidden_bias, output_weights, output_bias[0])
+
+    def save(self, path):
+        """Write the network as a header followed by the little-endian weight arrays"""
+        features, size = self.ft_weights.shape
+        hidden = self.hidden_bias.shape[0]
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(FILE_MAGIC, FILE_VERSION, features, size, hidden))
+            for values, dtype in ((self.ft_weights, "<i2"), (self.ft_bias, "<i2"), (self.psqt_weights, "<i4"),
+                                  (self.hidden_weights, "<i1"), (self.hidden_bias, "<i4"),
+                                  (self.output_weights, "<i1"), (np.array([self.output_bias]), "<i4")):
+                f.write(values.astype(dtype).tobytes())
+
+    def refresh(self, features):
+        """Accumulator and PSQT sum of a perspective from its active features"""
+        psqt = self.psqt_list
+        return (self.ft_bias + self.ft_weights[features].sum(axis=0, dtype=np.int16),
+                sum(psqt[feature] for feature in features))
+
+    def propagate(self, us, them, psqt):
+        """Centipawn score for the side to move from the two accumulators and the PSQT difference"""
+        x = np.minimum(np.maximum(np.concatenate((us, them)), 0), QA).astype(np.float32)
+        # Floor of the division by QB is the >> QB_SHIFT of the integer layer
+        hidden = np.floor((x @ self.hidden_weights_f32 + self.hidden_bias_f32) * (1 / QB))
+        hidden = np.minimum(np.maximum(hidden, 0), QA)
+        output = int(hidden @ self.output_weights_f32) + self.output_bias + psqt // 2
+        return output * OUTPUT_SCALE // (QA * QB)
+
+
+class NNUEEvaluator(Evaluator):
+    """Evaluator keeping, per ply, a (2, accumulator size) int16 array and the two PSQT sums, indexed by color.
+
+    Experimental: weaker than the hand-written evaluation with the networks trained so far.
+    """
+
+    def __init__(self, network):
+        self.network = network
+        self.stack = []
+
+    @classmethod
+    def load(cls, path):
+        return cls(NNUENetwork.load(path))
+
+    def copy(self):
+        return NNUEEvaluator(self.network)
+
+    def reset(self, board):
+        accumulator = np.empty((2, self.network.ft_bias.shape[0]), dtype=np.int16)
+        psqt = [0, 0]
+        for perspective in chess.COLORS:
+            accumulator[int(perspective)], psqt[perspective] = self.network.refresh(board_features(board, perspective))
+        self.stack = [(accumulator, psqt)]
+
+    def push(self, board, move):
+        """Apply the pieces changed by move (not yet made on board) to a copy of the accumulators"""
+        us = board.turn
+        them = not us
+        from_square = move.from_square
+        to_square = move.to_square
+        piece_type = board.piece_type_at(from_square)
+        added = [(us, move.promotion or piece_type, to_square)]
+        removed = [(us, piece_type, from_square)]
+        if piece_type == chess.PAWN and to_square == board.ep_square:
+            removed.append((them, chess.PAWN, to_square - 8 if us == chess.WHITE else to_square + 8))
+        else:
+            captured_type = board.piece_type_at(to_square)
+            if captured_type:
+                removed.append((them, captured_type, to_square))
+        if piece_type == chess.KING and abs(to_square - from_square) == 2:
+            if to_square > from_square:  # King-side: rook h-file -> f-file
+                rook_from, rook_to = to_square + 1, to_square - 1
+            else:  # Queen-side: rook a-file -> d-file
+                rook_from, rook_to = to_square - 2, to_square + 1
+            added.append((us, chess.ROOK, rook_to))
+            removed.append((us, chess.ROOK, rook_from))
+
+        weights = self.network.ft_weights
+        psqt_weights = self.network.psqt_list
+        parent, parent_psqt = self.stack[-1]
+        accumulator = parent.copy()
+        psqt = parent_psqt[:]
+        for perspective in chess.COLORS:
+            row = accumulator[int(perspective)]
+            orient = ORIENTATIONS[perspective][board.king(perspective)]
+            if piece_type == chess.KING and perspective == us:
+                new_orient = ORIENTATIONS[us][to_square]
+                if new_orient != orient:
+                    row[:], psqt[perspective] = self._refresh_after(board, perspective, new_orient, added, removed)
+                    continue
+            for piece in added:
+                feature = feature_index(perspective, orient, *piece)
+                row += weights[feature]
+                psqt[perspective] += psqt_weights[feature]
+            for piece in removed:
+                feature = feature_index(perspective, orient, *piece)
+                row -= weights[feature]
+                psqt[perspective] -= psqt_weights[feature]
+        self.stack.append((accumulator, psqt))
+
+    def _refresh_after(self, board, perspective, orient, added, removed):
+        """Accumulator and PSQT sum of the position after the move, rebuilt from the pieces"""
+        pieces = {square: (piece.color, piece.piece_type) for square, piece in board.piece_map().items()}
+        for _, _, square in removed:
+            del pieces[square]
+        for color, piece_type, square in added:
+            pieces[square] = (color, piece_type)
+        return self.network.refresh([feature_index(perspective, orient, color, piece_type, square)
+                                     for square, (color, piece_type) in pieces.items()])
+
+    def push_null(self):
+        self.stack.append(self.stack[-1])
+
+    def pop(self):
+        self.stack.pop()
+
+    def evaluate(self, board):
+        accumulator, psqt = self.stack[-1]
+        us = board.turn
+        return self.network.propagate(accumulator[int(us)], accumulator[int(not us)], psqt[us] - psqt[not us])
+
+
+# Castling, en passant, promotions and king bucket changes (chessprogramming.org/Perft_Results)
+TEST_FENS = [
+    chess.STARTING_FEN,
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+]
+
+
+def random_network(size=32, hidden=8, seed=1):
+    """Small network with random weights, for tests"""
+    rng = np.random.default_rng(seed)
+    return NNUENetwork(rng.integers(-64, 64, (NUM_FEATURES, size)), rng.integers(0, 64, size),
+                       rng.integers(-2000, 2000, NUM_FEATURES), rng.integers(-127, 128, (2 * size, hidden)),
+                       rng.integers(-1000, 1000, hidden), rng.integers(-127, 128, hidden), 100)
+
+
+def test_incremental_matches_refresh(playouts=20, plies=80):
+    """Incrementally updated accumulators equal a full refresh along random playouts (for pytest)"""
+    network = random_network()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.nnue")
+        network.save(path)
+        loaded = NNUENetwork.load(path)
+    for name in ("ft_weights", "ft_bias", "psqt_weights", "hidden_weights", "hidden_bias", "output_weights"):
+        assert np.array_equal(getattr(loaded, name), getattr(network, name)), name
+    assert loaded.output_bias == network.output_bias
+
+    rng = random.Random(1)
+    evaluator = NNUEEvaluator(network)
+    reference = evaluator.copy()
+    for playout in range(playouts):
+        position = Position(chess.Board(TEST_FENS[playout % len(TEST_FENS)]))
+        evaluator.reset(position)
+        root_score = evaluator.evaluate(position)
+        for _ in range(plies):
+            moves = list(position.generate_legal_moves())
+            if not moves:
+                break
+            if not position.is_check() and rng.random() < 0.05:
+                evaluator.push_null()
+                position.push_null()
+            else:
+                # Prefer the rare special moves so every playout exercises them
+                special = [move for move in moves if position.is_en_passant(move) or position.is_castling(move)]
+                move = rng.choice(special if special and rng.random() < 0.5 else moves)
+                evaluator.push(position, move)
+                position.push(move)
+            reference.reset(position)
+            (accumulator, psqt), (expected, expected_psqt) = evaluator.stack[-1], reference.stack[0]
+            assert np.array_equal(accumulator, expected) and psqt == expected_psqt, position.fen()
+            assert evaluator.evaluate(position) == reference.evaluate(position), position.fen()
+        while len(evaluator.stack) > 1:
+            evaluator.pop()
+            position.pop()
+        assert evaluator.evaluate(position) == root_score
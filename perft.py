@@ -0,0 +1,184 @@
+"""Perft: move generation correctness and speed (see engines/stockfish/src/perft.h).
+
+Counts the leaf nodes of the legal move tree of the search Position (ai.Position)
+and compares them with the published counts of the standard test positions and,
+with --verify, with python-chess's own move generator.
+
+Usage:
+    python perft.py suite [--depth N] [--processes N] [--no-bulk] [--verify]
+    python perft.py divide [--fen FEN | --position NAME] --depth N [--processes N] [--no-bulk] [--verify]
+    python -m pytest perft.py
+"""
+import argparse
+import sys
+import time
+
+import chess
+
+from ai import Position
+
+# Name, FEN and known leaf counts for depth 1, 2, ... (chessprogramming.org/Perft_Results)
+PERFT_POSITIONS = [
+    ("start", chess.STARTING_FEN, [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+POSITIONS_BY_NAME = {name: fen for name, fen, _ in PERFT_POSITIONS}
+
+
+def perft(position, depth, bulk=True):
+    """Leaf node count of the legal move tree; with bulk, the last ply counts moves without making them"""
+    if depth <= 0:
+        return 1
+    if bulk and depth == 1:
+        return sum(1 for _ in position.generate_legal_moves())
+    nodes = 0
+    for move in list(position.generate_legal_moves()):
+        position.push(move)
+        nodes += perft(position, depth - 1, bulk)
+        position.pop()
+    return nodes
+
+
+def board_perft(board, depth):
+    """Reference count with python-chess's move generator"""
+    if depth <= 1:
+        return board.legal_moves.count() if depth == 1 else 1
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += board_perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def _perft_root_move(args):
+    """Worker: perft of one root move (the position travels as a FEN, the move as UCI)"""
+    fen, move_uci, depth, bulk = args
+    position = Position(chess.Board(fen))
+    position.push(chess.Move.from_uci(move_uci))
+    return move_uci, perft(position, depth - 1, bulk)
+
+
+def divide(fen, depth, bulk=True, processes=1):
+    """Perft per root move as a list of (uci, nodes), optionally split over worker processes"""
+    position = Position(chess.Board(fen))
+    tasks = [(fen, move.uci(), depth, bulk) for move in position.generate_legal_moves()]
+    if processes > 1 and len(tasks) > 1:
+        import multiprocessing  # Only needed for the split
+        with multiprocessing.get_context().Pool(processes) as pool:
+            return pool.map(_perft_root_move, tasks)
+    return [_perft_root_move(task) for task in tasks]
+
+
+def verify_divide(fen, depth, counts):
+    """Root moves whose counts differ from python-chess, as (uci, ours, expected); ours is None for a missing move"""
+    board = chess.Board(fen)
+    ours = dict(counts)
+    generated = set()
+    mismatches = []
+    for move in board.legal_moves:
+        uci = move.uci()
+        generated.add(uci)
+        board.push(move)
+        expected = board_perft(board, depth - 1)
+        board.pop()
+        if ours.get(uci) != expected:
+            mismatches.append((uci, ours.get(uci), expected))
+    mismatches.extend((uci, nodes, 0) for uci, nodes in ours.items() if uci not in generated)
+    return mismatches
+
+
+def run_suite(max_depth=3, bulk=True, processes=1, verify=False):
+    """Perft of every standard position up to max_depth; returns the number of failures"""
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    print(f"{'position':<10} {'depth':>5} {'nodes':>10} {'time':>8} {'nps':>10}  result")
+    for name, fen, known in PERFT_POSITIONS:
+        depth = min(max_depth, len(known))
+        start = time.time()
+        counts = divide(fen, depth, bulk, processes)
+        elapsed = time.time() - start
+        nodes = sum(n for _, n in counts)
+        total_nodes += nodes
+        total_time += elapsed
+        result = "ok" if nodes == known[depth - 1] else f"FAIL (expected {known[depth - 1]})"
+        if verify:
+            mismatches = verify_divide(fen, depth, counts)
+            if mismatches:
+                result += f", {len(mismatches)} root moves differ from python-chess"
+        if result != "ok":
+            failures += 1
+        print(f"{name:<10} {depth:>5} {nodes:>10} {elapsed:>8.2f} {nodes / elapsed if elapsed else 0:>10.0f}  {result}")
+    print("===========================")
+    print(f"Nodes searched : {total_nodes}")
+    print(f"Nodes/second   : {total_nodes / total_time if total_time else 0:.0f}")
+    return failures
+
+
+def run_divide(fen, depth, bulk=True, processes=1, verify=False):
+    """Print the per-move counts of one position like Stockfish's 'go perft'"""
+    start = time.time()
+    counts = divide(fen, depth, bulk, processes)
+    elapsed = time.time() - start
+    for uci, nodes in counts:
+        print(f"{uci}: {nodes}")
+    nodes = sum(n for _, n in counts)
+    print(f"\nNodes searched : {nodes}")
+    print(f"Time (s)       : {elapsed:.2f}")
+    print(f"Nodes/second   : {nodes / elapsed if elapsed else 0:.0f}")
+    if verify:
+        mismatches = verify_divide(fen, depth, counts)
+        for uci, ours, expected in mismatches:
+            print(f"Mismatch {uci}: {ours} (python-chess {expected})")
+        if not mismatches:
+            print("All root moves match python-chess.")
+        return len(mismatches)
+    return 0
+
+
+def test_perft_positions():
+    """Shallow perft of the standard positions, bulk and move-by-move (for pytest)"""
+    for name, fen, known in PERFT_POSITIONS:
+        position = Position(chess.Board(fen))
+        for depth in (1, 2):
+            assert perft(position, depth) == known[depth - 1], name
+        assert perft(position, 2, bulk=False) == known[1], name
+        assert position.fen() == chess.Board(fen).fen(), name  # push/pop restored the position
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft move generation test and benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    suite_parser = subparsers.add_parser("suite", help="standard positions against their known counts")
+    suite_parser.add_argument("--depth", type=int, default=3, help="maximum depth per position (default 3)")
+
+    divide_parser = subparsers.add_parser("divide", help="per-move counts of one position")
+    divide_source = divide_parser.add_mutually_exclusive_group()
+    divide_source.add_argument("--fen", default=chess.STARTING_FEN)
+    divide_source.add_argument("--position", choices=sorted(POSITIONS_BY_NAME), help="a standard position by name")
+    divide_parser.add_argument("--depth", type=int, required=True)
+
+    for subparser in (suite_parser, divide_parser):
+        subparser.add_argument("--processes", type=int, default=1, help="split root moves over worker processes")
+        subparser.add_argument("--no-bulk", action="store_true", help="make every leaf move instead of counting")
+        subparser.add_argument("--verify", action="store_true", help="compare per-move counts with python-chess")
+
+    args = parser.parse_args()
+    if args.command == "suite":
+        failures = run_suite(args.depth, not args.no_bulk, args.processes, args.verify)
+    else:
+        fen = POSITIONS_BY_NAME[args.position] if args.position else args.fen
+        failures = run_divide(fen, args.depth, not args.no_bulk, args.processes, args.verify)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Train the NNUE network of nnue.py on locally generated positions.
+
+Positions come from self-play of the internal AI: a few random opening plies, then the
+best move of a fixed depth search (with an occasional random move for variety). Each
+quiet position (not in check, best move not a capture or promotion, no mate score) is
+labeled with that search score, so the network learns a search-backed evaluation rather
+than copying the hand-written terms. The PSQT weights start from the material and
+piece-square tables of ai.py, so training refines that baseline. Training minimizes the squared error in win
+probability space (sigmoid(score / 400)) with Adam in float32; the weights are then
+quantized to the int16/int8 layout of nnue.NNUENetwork and saved.
+
+Usage:
+    python train_nnue.py [--positions N] [--depth N] [--data FILE] [--epochs N] [--output FILE]
+
+Labeled positions are appended to --data as "FEN;score" lines and reused by later runs.
+Requires numpy.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import time
+
+import chess
+import numpy as np
+
+from ai import MATE_SCORE, MAX_PLY, PSQ_EG, PSQ_MG, ChessAI, SearchLimits
+from nnue import NUM_FEATURES, OUTPUT_SCALE, QA, QB, QB_SHIFT, NNUENetwork, board_features
+
+MAX_PIECES = 32
+MAX_WEIGHT = 127 / QB  # Largest hidden/output weight representable as int8
+LABEL_LIMIT = 3000  # Labels are clipped to +-LABEL_LIMIT centipawns
+
+
+def generate_positions(count, depth, seed=1, random_plies=8, random_move_rate=0.1, max_plies=200):
+    """(FEN, score for the side to move) of quiet self-play positions labeled by a depth-limited search"""
+    rng = random.Random(seed)
+    ai = ChessAI(opening_book_path=None, enable_stockfish=False)
+    samples = []
+    while len(samples) < count:
+        board = chess.Board()
+        ai.reset_board()
+        while not board.is_game_over(claim_draw=True) and board.ply() < max_plies and len(samples) < count:
+            moves = list(board.legal_moves)
+            if board.ply() < random_plies or len(moves) == 1:
+                board.push(rng.choice(moves))
+                continue
+            ai.board = board.copy()
+            with contextlib.redirect_stdout(io.StringIO()):
+                move = ai.get_ai_move(SearchLimits(depth=depth))
+            score = ai.root_score
+            quiet = not (board.is_check() or board.is_capture(move) or move.promotion)
+            if quiet and abs(score) < MATE_SCORE - MAX_PLY:
+                samples.append((board.fen(), max(-LABEL_LIMIT, min(LABEL_LIMIT, score))))
+            board.push(rng.choice(moves) if rng.random() < random_move_rate else move)
+    return samples
+
+
+def save_samples(path, samples):
+    with open(path, "a") as f:
+        for fen, score in samples:
+            f.write(f"{fen};{score}\n")
+
+
+def load_samples(path):
+    samples = []
+    with open(path) as f:
+        for line in f:
+            fen, _, score = line.strip().rpartition(";")
+            if fen:
+                samples.append((fen, int(score)))
+    return samples
+
+
+def encode(samples):
+    """(N, 2, MAX_PIECES) feature indices (side to move first, padded with NUM_FEATURES) and (N,) labels"""
+    features = np.full((len(samples), 2, MAX_PIECES), NUM_FEATURES, dtype=np.int32)
+    labels = np.empty(len(samples), dtype=np.float32)
+    for i, (fen, score) in enumerate(samples):
+        board = chess.Board(fen)
+        for row, perspective in enumerate((board.turn, not board.turn)):
+            active = board_features(board, perspective)
+            features[i, row, :len(active)] = active
+        labels[i] = score
+    return features, labels
+
+
+def initial_psqt():
+    """PSQT weights (network output units) holding the ai.py material + PST value of each feature's piece.
+
+    Kings get 0; the two mirrorings of a square are averaged.
+    """
+    psqt = np.zeros(NUM_FEATURES + 1)
+    for feature in range(NUM_FEATURES):
+        piece_index, oriented_square = divmod(feature % 768, 64)
+        piece_type = piece_index // 2 + 1
+        if piece_type == chess.KING:
+            continue
+        color = chess.WHITE if piece_index % 2 == 0 else chess.BLACK  # Seen by White: own pieces are white
+        values = [(PSQ_MG[piece_type][color][square] + PSQ_EG[piece_type][color][square]) / 2
+                  for square in (oriented_square, oriented_square ^ 7)]
+        psqt[feature] = sum(values) / 2 / OUTPUT_SCALE
+    return psqt
+
+
+class Trainer:
+    """Float32 copy of the network with a manual forward/backward pass and Adam"""
+
+    def __init__(self, size=64, hidden=16, seed=1, learning_rate=2e-3):
+        rng = np.random.default_rng(seed)
+        self.params = {
+            # Last row is the padding feature and stays zero
+            "ft_weights": np.vstack([rng.normal(0, 0.05, (NUM_FEATURES, size)), np.zeros((1, size))]),
+            "ft_bias": np.full(size, 0.5),
+            "psqt_weights": initial_psqt(),
+            "hidden_weights": rng.normal(0, 1 / np.sqrt(2 * size), (2 * size, hidden)),
+            "hidden_bias": np.zeros(hidden),
+            # Small, so the untrained network starts close to the PSQT evaluation
+            "output_weights": rng.normal(0, 0.1 / np.sqrt(hidden), hidden),
+            "output_bias": np.zeros(1),
+        }
+        self.params = {name: value.astype(np.float32) for name, value in self.params.items()}
+        self.moments = {name: (np.zeros_like(value), np.zeros_like(value)) for name, value in self.params.items()}
+        self.learning_rate = learning_rate
+        self.steps = 0
+
+    def forward(self, features):
+        """Network output (score / OUTPUT_SCALE) and the activations needed by backward()"""
+        p = self.params
+        accumulators = p["ft_weights"][features].sum(axis=2) + p["ft_bias"]  # (B, 2, size)
+        x = np.clip(accumulators, 0, 1).reshape(len(features), -1)
+        pre_hidden = x @ p["hidden_weights"] + p["hidden_bias"]
+        hidden = np.clip(pre_hidden, 0, 1)
+        psqt = p["psqt_weights"][features].sum(axis=2)  # (B, 2)
+        output = hidden @ p["output_weights"] + p["output_bias"] + (psqt[:, 0] - psqt[:, 1]) / 2
+        return output, (features, accumulators, x, pre_hidden, hidden)
+
+    def step(self, features, labels):
+        """One Adam step on a batch; returns the batch loss"""
+        p = self.params
+        output, (features, accumulators, x, pre_hidden, hidden) = self.forward(features)
+        predicted = _sigmoid(output * OUTPUT_SCALE / 400)
+        target = _sigmoid(labels / 400)
+        error = predicted - target
+
+        d_output = 2 * error * predicted * (1 - predicted) * (OUTPUT_SCALE / 400) / len(labels)
+        d_hidden = np.outer(d_output, p["output_weights"]) * ((pre_hidden > 0) & (pre_hidden < 1))
+        d_x = (d_hidden @ p["hidden_weights"].T).reshape(accumulators.shape) * (
+            (accumulators > 0) & (accumulators < 1))
+        d_ft_weights = np.zeros_like(p["ft_weights"])
+        np.add.at(d_ft_weights, features, np.broadcast_to(d_x[:, :, None, :], features.shape + (d_x.shape[-1],)))
+        d_ft_weights[NUM_FEATURES] = 0
+        d_psqt = np.zeros_like(p["psqt_weights"])
+        np.add.at(d_psqt, features[:, 0], np.broadcast_to(d_output[:, None] / 2, features[:, 0].shape))
+        np.add.at(d_psqt, features[:, 1], np.broadcast_to(-d_output[:, None] / 2, features[:, 1].shape))
+        d_psqt[NUM_FEATURES] = 0
+        gradients = {
+            "ft_weights": d_ft_weights,
+            "ft_bias": d_x.sum(axis=(0, 1)),
+            "psqt_weights": d_psqt,
+            "hidden_weights": x.T @ d_hidden,
+            "hidden_bias": d_hidden.sum(axis=0),
+            "output_weights": hidden.T @ d_output,
+            "output_bias": np.array([d_output.sum()], dtype=np.float32),
+        }
+
+        self.steps += 1
+        beta1, beta2 = 0.9, 0.999
+        for name, gradient in gradients.items():
+            m, v = self.moments[name]
+            m *= beta1
+            m += (1 - beta1) * gradient
+            v *= beta2
+            v += (1 - beta2) * gradient * gradient
+            m_hat = m / (1 - beta1 ** self.steps)
+            v_hat = v / (1 - beta2 ** self.steps)
+            p[name] -= self.learning_rate * m_hat / (np.sqrt(v_hat) + 1e-8)
+        # Keep the int8 layers representable after quantization
+        np.clip(p["hidden_weights"], -MAX_WEIGHT, MAX_WEIGHT, out=p["hidden_weights"])
+        np.clip(p["output_weights"], -MAX_WEIGHT, MAX_WEIGHT, out=p["output_weights"])
+        return float(np.mean(error * error))
+
+    def quantize(self):
+        """NNUENetwork with the current weights in the int16/int8 inference layout"""
+        p = self.params
+        return NNUENetwork(
+            np.rint(p["ft_weights"][:NUM_FEATURES] * QA), np.rint(p["ft_bias"] * QA),
+            np.rint(p["psqt_weights"][:NUM_FEATURES] * QA * QB),
+            np.rint(p["hidden_weights"] * QB), np.rint(p["hidden_bias"] * QA * QB),
+            np.rint(p["output_weights"] * QB), np.rint(p["output_bias"][0] * QA * QB))
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def quantized_scores(network, features):
+    """Centipawn scores of the quantized network, computed like NNUENetwork.propagate for a batch"""
+    weights = np.vstack([network.ft_weights, np.zeros((1, network.ft_weights.shape[1]), dtype=np.int16)])
+    accumulators = network.ft_bias + weights[features].sum(axis=2, dtype=np.int16)
+    x = np.clip(accumulators, 0, QA).reshape(len(features), -1).astype(np.int32)
+    hidden = np.clip((x @ network.hidden_weights + network.hidden_bias) >> QB_SHIFT, 0, QA)
+    psqt = np.append(network.psqt_weights, 0)[features].sum(axis=2, dtype=np.int64)
+    output = hidden @ network.output_weights + network.output_bias + (psqt[:, 0] - psqt[:, 1]) // 2
+    return output.astype(np.int64) * OUTPUT_SCALE // (QA * QB)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the ChessAI NNUE network")
+    parser.add_argument("--positions", type=int, default=20000, help="labeled positions to generate")
+    parser.add_argument("--depth", type=int, default=2, help="search depth of the labels")
+    parser.add_argument("--data", default="nnue_data.txt", help="labeled position file, appended to")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--learning-rate", type=float, default=2e-3)
+    parser.add_argument("--lr-decay", type=float, default=0.85, help="learning rate factor after each epoch")
+    parser.add_argument("--size", type=int, default=64, help="accumulator size per perspective")
+    parser.add_argument("--hidden", type=int, default=16, help="hidden layer size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="chessai.nnue")
+    args = parser.parse_args()
+
+    samples = load_samples(args.data) if os.path.exists(args.data) else []
+    if len(samples) < args.positions:
+        start = time.time()
+        new_samples = generate_positions(args.positions - len(samples), args.depth, seed=args.seed + len(samples))
+        save_samples(args.data, new_samples)
+        samples += new_samples
+        print(f"Generated {len(new_samples)} positions at depth {args.depth} in {time.time() - start:.0f}s")
+
+    random.Random(args.seed).shuffle(samples)
+    features, labels = encode(samples)
+    validation = max(1, len(samples) // 10)
+    train_features, train_labels = features[validation:], labels[validation:]
+    valid_features, valid_labels = features[:validation], labels[:validation]
+
+    trainer = Trainer(args.size, args.hidden, args.seed, args.learning_rate)
+    rng = np.random.default_rng(args.seed)
+    for epoch in range(1, args.epochs + 1):
+        order = rng.permutation(len(train_labels))
+        losses = [trainer.step(train_features[batch], train_labels[batch])
+                  for batch in np.array_split(order, max(1, len(order) // args.batch_size))]
+        valid_output, _ = trainer.forward(valid_features)
+        valid_loss = np.mean((_sigmoid(valid_output * OUTPUT_SCALE / 400) - _sigmoid(valid_labels / 400)) ** 2)
+        print(f"Epoch {epoch:>3}: train loss {np.mean(losses):.5f} validation loss {valid_loss:.5f}")
+        trainer.learning_rate *= args.lr_decay
+
+    network = trainer.quantize()
+    network.save(args.output)
+
+    # Static evaluation error against the search labels, hand-written terms vs network
+    ai = ChessAI(opening_book_path=None, enable_stockfish=False)
+    handcrafted = []
+    for fen, _ in samples[:validation]:
+        ai.board = chess.Board(fen)
+        handcrafted.append(ai.get_board_evaluation())
+    network_error = np.mean(np.abs(quantized_scores(network, valid_features) - valid_labels))
+    handcrafted_error = np.mean(np.abs(np.array(handcrafted) - valid_labels))
+    print(f"Saved {args.output} ({os.path.getsize(args.output)} bytes)")
+    print(f"Mean absolute error vs depth {args.depth} search on {validation} validation positions: "
+          f"network {network_error:.0f} cp, hand-written evaluation {handcrafted_error:.0f} cp")
+
+
+if __name__ == "__main__":
+    main()